@@ -0,0 +1,215 @@
+"""Versioned on-disk artifact of a fitted King County preprocessor and the model trained on its output.
+
+An artifact is a directory with
+
+    manifest.json       versions, parameters and the fitted state of the preprocessor and every step
+    arrays/<name>.npy   every array of the fitted state, e.g. the waterfront reference points and the KD-tree of the
+                        water distance step, stored uncompressed so loading memory-maps them
+    model.skops         the model (optional), stored with skops like in the notebook
+
+Loading does not unpickle anything: the arrays are memory-mapped, the KD-tree is restored from its arrays and skops
+only loads trusted types. The manifest holds the layout version of the artifact and the pipeline version, a hash
+of the code of the steps, the dtype schema and the input columns. An artifact saved by another version of the
+pipeline is rejected, because its fitted state may not match the code anymore.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from schema_king_county import apply_dtypes
+from sklearn.utils.validation import check_is_fitted
+from spatial_index import NearestReferenceIndex
+from step_cache import code_version, content_hash
+
+# Changing the layout of the artifacts invalidates all of them
+ARTIFACT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+ARRAY_DIR = "arrays"
+MODEL_NAME = "model.skops"
+
+# Parameters of the preprocessor stored in the artifact. The callbacks and the step cache belong to a run.
+PREPROCESSOR_PARAMS = ("copy", "track_memory", "n_jobs", "dtypes")
+
+
+def pipeline_version(preprocessor) -> str:
+    """Hash of the code the fitted state depends on: the classes and code of the steps, the code of the dtype
+    schema and the input columns of the pipeline."""
+    parts = [code_version(apply_dtypes), preprocessor.INPUT_COLUMNS]
+    for name, step in _steps(preprocessor):
+        parts += [name, type(step).__qualname__, code_version(step)]
+    return content_hash(ARTIFACT_VERSION, *parts)
+
+
+def _steps(preprocessor) -> list:
+    return [
+        (f"{stage_name}__{name}", step)
+        for stage_name, stage in preprocessor.preprocessor_pipe.steps
+        for name, step in stage.steps
+    ]
+
+
+def _fitted_state(step) -> dict:
+    """The attributes learned by 'fit' (public attributes ending with '_')."""
+    return {
+        name: value
+        for name, value in vars(step).items()
+        if name.endswith("_") and not name.startswith("_")
+    }
+
+
+def _encode(value, name: str, arrays: dict):
+    """JSON representation of 'value'. Arrays are added to 'arrays' under 'name' and referenced by it."""
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {"__array__": name}
+    if isinstance(value, NearestReferenceIndex):
+        return {"__index__": _encode(value.state(), name, arrays)}
+    if isinstance(value, pd.CategoricalDtype):
+        categories = value.categories.to_numpy()
+        return {"__category__": _encode(categories, name, arrays)}
+    if isinstance(value, np.dtype):
+        return {"__dtype__": value.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {
+            str(key): _encode(item, f"{name}.{key}", arrays)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_encode(item, f"{name}.{i}", arrays) for i, item in enumerate(value)]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(
+        f"'{name}' of type {type(value).__name__} cannot be stored in an artifact"
+    )
+
+
+def _decode(value, load_array):
+    if isinstance(value, list):
+        return [_decode(item, load_array) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "__array__" in value:
+        return load_array(value["__array__"])
+    if "__index__" in value:
+        return NearestReferenceIndex.from_state(_decode(value["__index__"], load_array))
+    if "__category__" in value:
+        return pd.CategoricalDtype(
+            np.asarray(load_array(value["__category__"]["__array__"]))
+        )
+    if "__dtype__" in value:
+        return np.dtype(value["__dtype__"])
+    return {key: _decode(item, load_array) for key, item in value.items()}
+
+
+def save_artifact(path: str, preprocessor, model=None) -> None:
+    """Save a fitted preprocessor and optionally a model to the directory 'path', which is replaced if it exists.
+
+    Parameters:
+    ----------
+    path : str
+        Directory of the artifact.
+    preprocessor : PreprocessingKingCountyData
+        The fitted preprocessor.
+    model : estimator, optional
+        Model trained on the output of the preprocessor, stored with skops.
+    """
+    steps = _steps(preprocessor)
+    # The steps are fitted one after another, so a fitted last step means a fitted pipeline
+    check_is_fitted(steps[-1][1])
+    arrays = {}
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "pipeline": pipeline_version(preprocessor),
+        "params": _encode(
+            {name: getattr(preprocessor, name) for name in PREPROCESSOR_PARAMS},
+            "params",
+            arrays,
+        ),
+        "dtypes_": _encode(preprocessor.dtypes_, "dtypes_", arrays),
+        "steps": {
+            name: {
+                "params": _encode(
+                    step.get_params(deep=False), f"{name}.params", arrays
+                ),
+                "state": _encode(_fitted_state(step), f"{name}.state", arrays),
+            }
+            for name, step in steps
+        },
+        "model": None if model is None else type(model).__qualname__,
+    }
+
+    # Written to a temporary directory first, so an interrupted save never leaves a broken artifact
+    tmp_path = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, ARRAY_DIR))
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, ARRAY_DIR, name + ".npy"), array)
+    if model is not None:
+        import skops.io as sio
+
+        sio.dump(model, os.path.join(tmp_path, MODEL_NAME))
+    with open(os.path.join(tmp_path, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path: str, preprocessor, mmap: bool = True, trusted: list = None):
+    """Restore the parameters and the fitted state saved in the artifact 'path' into 'preprocessor'.
+
+    Parameters:
+    ----------
+    path : str
+        Directory of the artifact.
+    preprocessor : PreprocessingKingCountyData
+        A new preprocessor the state is restored into.
+    mmap : bool
+        If True (default) the arrays are memory-mapped read-only instead of read into memory.
+    trusted : list, optional
+        Types besides the scikit-learn and numpy types skops may load for the model (see skops.io.load).
+
+    Returns:
+    ----------
+    model : estimator or None
+        The model saved with the preprocessor.
+
+    Raises:
+    ----------
+    ValueError:
+        If the artifact was saved with another artifact layout or pipeline version.
+    """
+    with open(os.path.join(path, MANIFEST_NAME)) as file:
+        manifest = json.load(file)
+    if manifest["version"] != ARTIFACT_VERSION:
+        raise ValueError(
+            f"The artifact {path} has layout version {manifest['version']}, expected {ARTIFACT_VERSION}"
+        )
+    if manifest["pipeline"] != pipeline_version(preprocessor):
+        raise ValueError(
+            f"The artifact {path} was saved by another version of the pipeline"
+        )
+
+    def load_array(name):
+        return np.load(
+            os.path.join(path, ARRAY_DIR, name + ".npy"),
+            mmap_mode="r" if mmap else None,
+        )
+
+    for name, value in _decode(manifest["params"], load_array).items():
+        setattr(preprocessor, name, value)
+    preprocessor.dtypes_ = _decode(manifest["dtypes_"], load_array)
+    for name, step in _steps(preprocessor):
+        stored = manifest["steps"][name]
+        step.set_params(**_decode(stored["params"], load_array))
+        vars(step).update(_decode(stored["state"], load_array))
+
+    if manifest["model"] is None:
+        return None
+    import skops.io as sio
+
+    return sio.load(os.path.join(path, MODEL_NAME), trusted=trusted)
@@ -0,0 +1,242 @@
+"""Benchmarks of the King County preprocessing pipeline on synthetic data of growing size.
+
+Every named step of the data cleaning and feature engineering pipelines is timed, as well as generating the data and
+writing and reading it in the supported file formats. The results are written as JSON and can be compared against a
+stored baseline to flag regressions. Run from the pipeline directory:
+
+    python -m benchmarks.run_benchmarks --sizes 10k 100k 1m --output results.json
+    python -m benchmarks.run_benchmarks --sizes 10k 100k 1m --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import make_king_county_data
+from data_io import OUTPUT_FORMATS, load_file_to_dataframe, save_dataframe
+from preprocessing_king_county import PreprocessingKingCountyData
+
+SIZES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+DEFAULT_SIZES = ["10k", "100k"]
+IO_FORMATS = ["csv", "parquet", "arrow"]
+
+# A timing is only flagged if it is slower than the baseline by more than both thresholds
+TOLERANCE = 0.25
+MIN_SECONDS = 0.01
+
+
+def time_preprocessing(df: pd.DataFrame, repeat: int = 1) -> dict:
+    """Time every step of a fresh PreprocessingKingCountyData fitted and transforming 'df'.
+
+    Returns:
+    ----------
+    timings : dict
+        Maps every step (see PreprocessingKingCountyData.timing_report) and 'total' to the fastest of 'repeat'
+        runs in seconds. 'rows_out' holds the number of rows of the result.
+    """
+    timings = {}
+    for _ in range(repeat):
+        preprocessor = PreprocessingKingCountyData()
+        started = time.perf_counter()
+        result = preprocessor.preprocess_fit_transform(df)
+        run = dict(preprocessor.timing_report(), total=time.perf_counter() - started)
+        for name, seconds in run.items():
+            timings[name] = min(seconds, timings.get(name, np.inf))
+    timings["rows_out"] = len(result)
+    return timings
+
+
+def time_io(df: pd.DataFrame, directory: str, formats: list = IO_FORMATS) -> dict:
+    """Time writing 'df' to and reading it from a file of every format in 'formats'.
+
+    Returns:
+    ----------
+    timings : dict
+        Maps 'write_<format>' and 'read_<format>' to seconds and 'size_mb_<format>' to the size of the file in MiB.
+    """
+    timings = {}
+    for output_format in formats:
+        path = os.path.join(directory, "houses" + OUTPUT_FORMATS[output_format])
+        started = time.perf_counter()
+        save_dataframe(df, path, output_format)
+        timings[f"write_{output_format}"] = time.perf_counter() - started
+        started = time.perf_counter()
+        load_file_to_dataframe(path)
+        timings[f"read_{output_format}"] = time.perf_counter() - started
+        timings[f"size_mb_{output_format}"] = os.path.getsize(path) / 2**20
+        os.remove(path)
+    return timings
+
+
+def environment() -> dict:
+    """Versions and hardware the benchmarks ran with, so results of different machines are not mixed up."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_benchmarks(
+    sizes: list = DEFAULT_SIZES,
+    repeat: int = 1,
+    seed: int = 0,
+    formats: list = IO_FORMATS,
+) -> dict:
+    """Run the benchmarks for the data sizes 'sizes' (keys of SIZES).
+
+    Returns:
+    ----------
+    results : dict
+        'environment' (see environment) and 'results', which maps every size to its number of rows and its
+        timings in seconds: 'generate', the steps of the pipeline (see time_preprocessing) and the I/O (see time_io).
+    """
+    results = {}
+    for size in sizes:
+        started = time.perf_counter()
+        df = make_king_county_data(SIZES[size], seed=seed)
+        timings = {"generate": time.perf_counter() - started}
+        timings.update(time_preprocessing(df, repeat))
+        with tempfile.TemporaryDirectory() as directory:
+            timings.update(time_io(df, directory, formats))
+        rows_out = timings.pop("rows_out")
+        results[size] = {"rows": len(df), "rows_out": rows_out, "timings": timings}
+    return {"environment": environment(), "results": results}
+
+
+def compare_to_baseline(
+    results: dict,
+    baseline: dict,
+    tolerance: float = TOLERANCE,
+    min_seconds: float = MIN_SECONDS,
+) -> list:
+    """Find the timings of 'results' that are slower than in 'baseline'.
+
+    Parameters:
+    ----------
+    results, baseline : dict
+        Results of run_benchmarks. Only sizes and timings present in both are compared.
+    tolerance : float
+        Allowed relative slowdown (0.25 allows 25 % more time).
+    min_seconds : float
+        Allowed absolute slowdown, so the noise of very short timings is not flagged.
+
+    Returns:
+    ----------
+    regressions : list of dict
+        The size, timing, baseline and current seconds and their ratio of every regression.
+    """
+    regressions = []
+    for size, result in results["results"].items():
+        if size not in baseline["results"]:
+            continue
+        baseline_timings = baseline["results"][size]["timings"]
+        for name, seconds in result["timings"].items():
+            if name.startswith("size_mb_") or name not in baseline_timings:
+                continue
+            reference = baseline_timings[name]
+            if (
+                seconds > reference * (1 + tolerance)
+                and seconds - reference > min_seconds
+            ):
+                regressions.append(
+                    {
+                        "size": size,
+                        "timing": name,
+                        "baseline": reference,
+                        "current": seconds,
+                        "ratio": seconds / reference if reference else np.inf,
+                    }
+                )
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    """Print the timings of every size as a table with one column per size."""
+    table = pd.DataFrame(
+        {size: result["timings"] for size, result in results["results"].items()}
+    )
+    with pd.option_context("display.float_format", "{:.4f}".format):
+        print(table)
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    """Parse the command-line arguments of the benchmark script."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the King County preprocessing pipeline on synthetic data."
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=list(SIZES),
+        default=DEFAULT_SIZES,
+        help=f"Data sizes to benchmark (default: {' '.join(DEFAULT_SIZES)}).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Number of runs of the pipeline per size, the fastest is reported (default: 1).",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the synthetic data."
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="*",
+        choices=list(OUTPUT_FORMATS),
+        default=IO_FORMATS,
+        help=f"File formats of the I/O benchmark (default: {' '.join(IO_FORMATS)}).",
+    )
+    parser.add_argument(
+        "--output", help="Path of the JSON file the results are written to."
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON results of an earlier run. Regressions are printed and make the script exit with status 1.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help=f"Allowed relative slowdown compared to the baseline (default: {TOLERANCE}).",
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None) -> None:
+    args = parse_args(args)
+    results = run_benchmarks(args.sizes, args.repeat, args.seed, args.formats)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(
+                "Regression: {size} {timing} took {current:.4f} s "
+                "instead of {baseline:.4f} s ({ratio:.2f}x)".format(**regression)
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Synthetic King County house data for benchmarks.
+
+The generated DataFrames have the columns and dtypes of the King County dataset and follow its distributions: the
+share of waterfront properties and of missing values, the spread of the coordinates around Seattle (waterfront
+properties lie further west, towards the Puget Sound) and the value ranges of the rooms, areas and years. The values
+are not realistic houses, but every step of the pipeline has the same amount of work per row as on the real data.
+"""
+import numpy as np
+import pandas as pd
+
+ZIPCODES = [
+    98001, 98002, 98003, 98004, 98005, 98006, 98007, 98008, 98010, 98011,
+    98014, 98019, 98022, 98023, 98024, 98027, 98028, 98029, 98030, 98031,
+    98032, 98033, 98034, 98038, 98039, 98040, 98042, 98045, 98052, 98053,
+    98055, 98056, 98058, 98059, 98065, 98070, 98072, 98074, 98075, 98077,
+    98092, 98102, 98103, 98105, 98106, 98107, 98108, 98109, 98112, 98115,
+    98116, 98117, 98118, 98119, 98122, 98125, 98126, 98133, 98136, 98144,
+    98146, 98148, 98155, 98166, 98168, 98177, 98178, 98188, 98198, 98199,
+]  # fmt: skip
+
+# Shares of the King County dataset
+WATERFRONT_RATIO = 0.0068
+WATERFRONT_MISSING_RATIO = 0.11
+VIEW_MISSING_RATIO = 0.003
+YR_RENOVATED_MISSING_RATIO = 0.178
+RENOVATED_RATIO = 0.034
+BASEMENT_RATIO = 0.39
+BASEMENT_UNKNOWN_RATIO = 0.021
+
+# Bounding box and spread (mean, standard deviation) of the coordinates
+LAT_RANGE = (47.1559, 47.7776)
+LONG_RANGE = (-122.519, -121.315)
+LOCATION = ((47.560, 0.139), (-122.214, 0.141))
+WATERFRONT_LOCATION = ((47.540, 0.114), (-122.278, 0.124))
+
+BEDROOMS = ([1, 2, 3, 4, 5, 6, 7], [0.01, 0.128, 0.455, 0.319, 0.074, 0.012, 0.002])
+FLOORS = ([1.0, 1.5, 2.0, 2.5, 3.0, 3.5], [0.494, 0.088, 0.381, 0.008, 0.028, 0.001])
+CONDITION = ([1, 2, 3, 4, 5], [0.001, 0.008, 0.649, 0.263, 0.079])
+GRADE = (
+    [4, 5, 6, 7, 8, 9, 10, 11, 12, 13],
+    [0.001, 0.011, 0.094, 0.416, 0.281, 0.121, 0.053, 0.018, 0.004, 0.001],
+)
+VIEW = ([0.0, 1.0, 2.0, 3.0, 4.0], [0.902, 0.015, 0.044, 0.024, 0.015])
+
+# The sales of the dataset span one year
+DATES = pd.date_range("2014-05-02", "2015-05-27")
+
+
+def _choice(rng: np.random.Generator, n_rows: int, values_and_probabilities):
+    values, probabilities = values_and_probabilities
+    probabilities = np.asarray(probabilities) / np.sum(probabilities)
+    return rng.choice(np.asarray(values), size=n_rows, p=probabilities)
+
+
+def _coordinates(rng: np.random.Generator, n_rows: int, location):
+    (lat_mean, lat_std), (long_mean, long_std) = location
+    lat = np.clip(rng.normal(lat_mean, lat_std, n_rows), *LAT_RANGE)
+    long = np.clip(rng.normal(long_mean, long_std, n_rows), *LONG_RANGE)
+    return lat.round(4), long.round(3)
+
+
+def _missing(rng: np.random.Generator, values: np.ndarray, ratio: float):
+    values = values.astype(float)
+    values[rng.random(len(values)) < ratio] = np.nan
+    return values
+
+
+def _as_strings(values: np.ndarray, formatter) -> np.ndarray:
+    """Format only the distinct values, so millions of rows are converted quickly."""
+    unique, inverse = np.unique(values, return_inverse=True)
+    return np.array([formatter(value) for value in unique], dtype=object)[inverse]
+
+
+def make_king_county_data(
+    n_rows: int, seed: int = 0, waterfront_ratio: float = WATERFRONT_RATIO
+) -> pd.DataFrame:
+    """Generate synthetic King County house data.
+
+    Parameters:
+    ----------
+    n_rows : int
+        Number of rows.
+    seed : int
+        Seed of the random number generator, the same seed always gives the same data.
+    waterfront_ratio : float
+        Share of waterfront properties among the rows with a known 'waterfront' value.
+
+    Returns:
+    ----------
+    df : DataFrame
+        DataFrame with the raw columns and dtypes of the King County dataset.
+    """
+    rng = np.random.default_rng(seed)
+
+    waterfront = (rng.random(n_rows) < waterfront_ratio).astype(float)
+    lat, long = _coordinates(rng, n_rows, LOCATION)
+    water_lat, water_long = _coordinates(rng, n_rows, WATERFRONT_LOCATION)
+    lat = np.where(waterfront == 1, water_lat, lat)
+    long = np.where(waterfront == 1, water_long, long)
+    waterfront = _missing(rng, waterfront, WATERFRONT_MISSING_RATIO)
+
+    bedrooms = _choice(rng, n_rows, BEDROOMS)
+    bathrooms = np.clip(
+        np.round((0.6 * bedrooms + rng.normal(0.3, 0.6, n_rows)) * 4) / 4, 0.5, 8
+    )
+    sqft_living = np.clip(rng.lognormal(np.log(1900), 0.42, n_rows), 370, 13540).astype(
+        np.int64
+    )
+    sqft_basement = np.where(
+        rng.random(n_rows) < BASEMENT_RATIO,
+        (sqft_living * rng.uniform(0.2, 0.5, n_rows)).round(-1),
+        0,
+    ).astype(np.int64)
+    sqft_lot = np.clip(rng.lognormal(np.log(7600), 0.9, n_rows), 520, 1651359)
+    price = np.clip(
+        rng.lognormal(np.log(450000), 0.5, n_rows) * (sqft_living / 1900) ** 0.5,
+        78000,
+        7700000,
+    ).round(-2)
+
+    yr_built = rng.integers(1900, 2016, n_rows)
+    renovated = rng.random(n_rows) < RENOVATED_RATIO
+    yr_renovated = np.where(
+        renovated, rng.integers(yr_built, 2016), 0
+    )  # renovations happen after the house was built
+    yr_renovated = _missing(rng, yr_renovated, YR_RENOVATED_MISSING_RATIO)
+
+    sqft_basement_str = _as_strings(sqft_basement, lambda value: f"{value:.1f}")
+    sqft_basement_str[rng.random(n_rows) < BASEMENT_UNKNOWN_RATIO] = "?"
+    dates = _as_strings(
+        rng.integers(0, len(DATES), n_rows),
+        lambda i: f"{DATES[i].month}/{DATES[i].day}/{DATES[i].year}",
+    )
+
+    return pd.DataFrame(
+        {
+            "id": rng.permutation(n_rows) * 97 + 1_000_102,
+            "date": dates,
+            "price": price,
+            "bedrooms": bedrooms,
+            "bathrooms": bathrooms,
+            "sqft_living": sqft_living,
+            "sqft_lot": sqft_lot.astype(np.int64),
+            "floors": _choice(rng, n_rows, FLOORS),
+            "waterfront": waterfront,
+            "view": _missing(rng, _choice(rng, n_rows, VIEW), VIEW_MISSING_RATIO),
+            "condition": _choice(rng, n_rows, CONDITION),
+            "grade": _choice(rng, n_rows, GRADE),
+            "sqft_above": sqft_living - sqft_basement,
+            "sqft_basement": sqft_basement_str,
+            "yr_built": yr_built,
+            "yr_renovated": yr_renovated,
+            "zipcode": rng.choice(np.asarray(ZIPCODES), size=n_rows),
+            "lat": lat,
+            "long": long,
+            "sqft_living15": np.clip(
+                sqft_living * rng.lognormal(0, 0.25, n_rows), 399, 6210
+            ).astype(np.int64),
+            "sqft_lot15": np.clip(
+                sqft_lot * rng.lognormal(0, 0.3, n_rows), 651, 871200
+            ).astype(np.int64),
+        }
+    )
@@ -3,14 +3,31 @@ from abc import ABC
 import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils.validation import check_is_fitted
+from spatial_index import NearestReferenceIndex
+
+# Centre of King County (downtown Seattle) and the latitude whose cosine corrects the longitude differences
+CENTER_LAT = 47.62774
+CENTER_LONG = -122.24194
+CENTER_REF_LAT = 47.6219
 
 
 class AbstractTransformer(ABC):
     """
     This (abstract) transformer is to be inherited by the other transformers.
-    It may not be instantiated on its own. Implements 'fit' method and checks whether 'X' is a DataFrame
+    It may not be instantiated on its own. Implements 'fit' method and checks whether 'X' is a DataFrame.
+    With 'copy=False' (default) the transformers modify 'X' in place, with 'copy=True' they work on a copy of 'X'.
+    Transformers whose 'fit' learns from the values of the rows (not only from the columns) set 'learns_from_rows'.
+    Transformers whose results depend on the code of other modules list them in 'cache_dependencies' (see
+    step_cache.code_version), so the cached outputs are invalidated when these modules change.
     """
 
+    learns_from_rows = False
+    cache_dependencies = ()
+
+    def __init__(self, copy=False):
+        self.copy = copy
+
     def fit(self, X, y=None):
         if not isinstance(X, pd.DataFrame):
             raise TypeError("The input 'X' must be a pandas.DataFrame")
@@ -23,7 +40,7 @@ class SqftPriceCreator(BaseEstimator, TransformerMixin, AbstractTransformer):
     """
 
     def transform(self, X, y=None):
-        X.copy()
+        X = X.copy() if self.copy else X
         X["sqft_price"] = (X["price"] / (X["sqft_living"] + X["sqft_lot"])).round(2)
         return X
 
@@ -34,14 +51,17 @@ class CenterDistanceCreator(BaseEstimator, TransformerMixin, AbstractTransformer
     property in relation to a center location."""
 
     def transform(self, X, y=None):
-        X.copy()
+        X = X.copy() if self.copy else X
         # Absolute difference of latitude between centre and property
-        X["delta_lat"] = np.absolute(47.62774 - X["lat"])
+        X["delta_lat"] = np.absolute(CENTER_LAT - X["lat"])
         # Absolute difference of longitude between centre and property
-        X["delta_long"] = np.absolute(-122.24194 - X["long"])
+        X["delta_long"] = np.absolute(CENTER_LONG - X["long"])
         # Distance between centre and property
         X["center_distance"] = (
-            ((X["delta_long"] * np.cos(np.radians(47.6219))) ** 2 + X["delta_lat"] ** 2)
+            (
+                (X["delta_long"] * np.cos(np.radians(CENTER_REF_LAT))) ** 2
+                + X["delta_lat"] ** 2
+            )
             ** (1 / 2)
             * 2
             * np.pi
@@ -68,31 +88,55 @@ class WaterDistanceCreator(BaseEstimator, TransformerMixin, AbstractTransformer)
     """Transformer class to create the 'water_distance' feature based on waterfront proximity.
     Calculates the distance between each property and the waterfront. It creates a new feature called 'water_distance' that represents the
     minimum distance to the waterfront for each property.
+    'fit' learns the waterfront properties of the training data ('reference_points_') and builds their spatial index
+    ('index_'), which 'transform' reuses for new data. 'reference_points' (an array of long/lat pairs) fixes the
+    waterfront properties instead, e.g. when the data is transformed in chunks.
     """
 
+    learns_from_rows = True
+    cache_dependencies = (NearestReferenceIndex,)
+
+    def __init__(self, reference_points=None, copy=False):
+        self.reference_points = reference_points
+        self.copy = copy
+
+    def fit(self, X, y=None):
+        super().fit(X, y)
+        if self.reference_points is None:
+            water_list = X.query("waterfront == 1")
+            self.reference_points_ = water_list[["long", "lat"]].to_numpy(dtype=float)
+        else:
+            self.reference_points_ = np.asarray(self.reference_points, dtype=float)
+        self.index_ = NearestReferenceIndex(
+            self.reference_points_[:, 0], self.reference_points_[:, 1]
+        )
+        return self
+
     def transform(self, X, y=None):
-        X.copy()
-        water_list = X.query("waterfront == 1")
-
-        water_distance = []
-        # For each row in our data frame we now calculate the distance to the seafront
-        for idx, lat in X.lat.items():
-            ref_list = []
-            for i, j in zip(list(water_list.long), list(water_list.lat)):
-                ref_list.append(dist(X.long[idx], X.lat[idx], i, j).min())
-            water_distance.append(min(ref_list))
-        X["water_distance"] = water_distance
+        check_is_fitted(self, "index_")
+        X = X.copy() if self.copy else X
+        # One batched nearest-neighbour query for all rows instead of a loop over every pair
+        X["water_distance"] = self.index_.query(X.long, X.lat)
         return X
 
 
 class DropNoPredictionValues(BaseEstimator, TransformerMixin, AbstractTransformer):
     """Transformer class to drop irrelevant columns from a DataFrame. Drops specified columns from the DataFrame.
-    It is used to remove columns that are not relevant for prediction purposes.
+    It is used to remove columns that are not relevant for prediction purposes. 'fit' stores the remaining columns
+    ('features_'), so new data is transformed to the same columns in the same order as the training data.
     """
 
-    def transform(self, X, y=None):
-        X.copy()
-        drop_lst = ["sqft_price", "date", "delta_lat", "delta_long", "bath_bed_ratio"]
-        features_label = [x for x in X.columns if x not in drop_lst]
+    drop_lst = ["sqft_price", "date", "delta_lat", "delta_long", "bath_bed_ratio"]
 
-        return X[features_label]
+    def fit(self, X, y=None):
+        super().fit(X, y)
+        self.features_ = [x for x in X.columns if x not in self.drop_lst]
+        return self
+
+    def transform(self, X, y=None):
+        check_is_fitted(self, "features_")
+        X = X.copy() if self.copy else X
+        X.drop([x for x in self.drop_lst if x in X.columns], axis=1, inplace=True)
+        if list(X.columns) != self.features_:
+            X = X[self.features_]
+        return X
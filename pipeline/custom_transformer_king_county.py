@@ -8,9 +8,19 @@ from sklearn.base import BaseEstimator, TransformerMixin
 class AbstractTransformer(ABC):
     """
     This (abstract) transformer is to be inherited by the other transformers.
-    It may not be instantiated on its own. Implements 'fit' method and checks whether 'X' is a DataFrame
+    It may not be instantiated on its own. Implements 'fit' method and checks whether 'X' is a DataFrame.
+    With 'copy=False' (default) the transformers modify 'X' in place, with 'copy=True' they work on a copy of 'X'.
+    Transformers whose 'fit' learns from the values of the rows (not only from the columns) set 'learns_from_rows'.
+    Transformers whose results depend on the code of other modules list them in 'cache_dependencies' (see
+    step_cache.code_version), so the cached outputs are invalidated when these modules change.
     """
 
+    learns_from_rows = False
+    cache_dependencies = ()
+
+    def __init__(self, copy=False):
+        self.copy = copy
+
     def fit(self, X: pd.DataFrame, y=None):
         if not isinstance(X, pd.DataFrame):
             raise TypeError("The input 'X' must be a pandas.DataFrame")
@@ -20,17 +30,22 @@ class AbstractTransformer(ABC):
 class BathBedRoomTransformer(BaseEstimator, TransformerMixin, AbstractTransformer):
     """Transformer class to create the 'bath_bed_ratio' feature and filter data.
     Creates a new feature 'bath_bed_ratio' by dividing the number of bathrooms by the number of bedrooms. It also filters out rows
-    based on specific conditions of the 'bath_bed_ratio'.
+    based on specific conditions of the 'bath_bed_ratio'. The number of rows removed by each condition is stored in 'rows_removed_'.
     """
 
     def transform(self, X, y=None):
-        X.copy()
+        X = X.copy() if self.copy else X
         X["bath_bed_ratio"] = X["bathrooms"] / X["bedrooms"]
-        for idx, ratio in enumerate(X["bath_bed_ratio"]):
-            if ratio >= 2:
-                X.drop(idx, inplace=True)
-            elif ratio <= 0.10:
-                X.drop(idx, inplace=True)
+        # Positional boolean masks, so the filter does not depend on the index labels
+        too_high = (X["bath_bed_ratio"] >= 2).to_numpy()
+        too_low = (X["bath_bed_ratio"] <= 0.10).to_numpy()
+        self.rows_removed_ = {
+            "bath_bed_ratio >= 2": int(too_high.sum()),
+            "bath_bed_ratio <= 0.10": int(too_low.sum()),
+        }
+        outlier = too_high | too_low
+        if outlier.any():
+            X = X.take(np.flatnonzero(~outlier))
         return X
 
 
@@ -42,7 +57,7 @@ class SqftBasementTransformer(BaseEstimator, TransformerMixin, AbstractTransform
     """
 
     def transform(self, X, y=None):
-        X.copy()
+        X = X.copy() if self.copy else X
         X["sqft_basement"] = X["sqft_basement"].replace("?", np.nan)
         X["sqft_basement"] = X["sqft_living"] - X["sqft_above"]
         X["sqft_basement"] = X["sqft_basement"].astype(float)
@@ -55,7 +70,7 @@ class ViewWaterfrontTransformer(BaseEstimator, TransformerMixin, AbstractTransfo
     """
 
     def transform(self, X, y=None):
-        X.copy()
+        X = X.copy() if self.copy else X
         X["view"] = X["view"].fillna(0)
         X["waterfront"] = X["waterfront"].fillna(0)
         return X
@@ -70,14 +85,10 @@ class LastKnownChangeTransformer(BaseEstimator, TransformerMixin, AbstractTransf
     """
 
     def transform(self, X, y=None):
-        X.copy()
-        last_known_change = []
-        for idx, yr_re in X.yr_renovated.items():
-            if str(yr_re) == "nan" or yr_re == 0.0:
-                last_known_change.append(X.yr_built[idx])
-            else:
-                last_known_change.append(int(yr_re))
-        X["last_known_change"] = last_known_change
-        X.drop("yr_renovated", axis=1, inplace=True)
-        X.drop("yr_built", axis=1, inplace=True)
+        X = X.copy() if self.copy else X
+        not_renovated = X["yr_renovated"].isna() | (X["yr_renovated"] == 0.0)
+        X["last_known_change"] = np.where(
+            not_renovated, X["yr_built"], X["yr_renovated"]
+        ).astype(int)
+        X.drop(["yr_renovated", "yr_built"], axis=1, inplace=True)
         return X
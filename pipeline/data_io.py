@@ -0,0 +1,271 @@
+"""This script contains the functions to read and write King County data in the supported file formats.
+Parquet, Feather and Arrow IPC files are read and written with pyarrow, Arrow IPC and Feather files are memory-mapped."""
+import os
+import sys
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from schema_king_county import apply_dtypes
+
+ARROW_EXTENSIONS = (".feather", ".arrow", ".ipc")
+
+# Supported output formats and their file extensions
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "arrow": ".arrow",
+}
+
+
+def load_file_to_dataframe(
+    file_path: str, columns: list = None, dtypes: dict = None
+) -> pd.DataFrame:
+    """Load a file into a Pandas DataFrame.
+
+    This function reads the file located at the given file path and returns a Pandas DataFrame.
+    The file format is determined based on the file extension.
+
+    Parameters:
+    ----------
+    file_path : str
+        Path to the file to be loaded, or to a directory of Parquet or Arrow part files (see load_dataset_to_dataframe).
+    columns : list, optional
+        Only these columns are loaded. Columnar formats (Parquet, Feather, Arrow) and CSV files skip
+        the other columns while reading.
+    dtypes : dict, optional
+        Dtype schema the loaded columns are stored in (see schema_king_county.py).
+
+    Returns:
+    ----------
+    df : DataFrame
+        Loaded DataFrame.
+
+    Raises:
+    ----------
+    ValueError:
+        If the file extension is not supported.
+    """
+    _, file_extension = os.path.splitext(file_path)
+
+    if os.path.isdir(file_path):
+        df = load_dataset_to_dataframe(file_path, columns)
+    elif file_extension.lower() == ".csv":
+        df = pd.read_csv(file_path, usecols=columns)
+    elif file_extension.lower() == ".xlsx":
+        df = pd.read_excel(file_path, usecols=columns)
+    elif file_extension.lower() == ".json":
+        df = pd.read_json(file_path)
+    elif file_extension.lower() in (".jsonl", ".ndjson"):
+        df = pd.read_json(file_path, lines=True)
+    elif file_extension.lower() == ".pkl":
+        df = pd.read_pickle(file_path)
+    elif file_extension.lower() == ".parquet":
+        df = pd.read_parquet(file_path, columns=columns)
+    elif file_extension.lower() in ARROW_EXTENSIONS:
+        from pyarrow import feather
+
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        df = table.to_pandas(split_blocks=True)
+    else:
+        print(
+            "Invalid file extension. Supported formats: CSV, XLSX, JSON, JSONL, PKL, PARQUET, FEATHER, ARROW."
+        )
+        sys.exit(1)
+
+    if columns is not None and list(df.columns) != list(columns):
+        df = df[columns]
+    if dtypes:
+        df, _ = apply_dtypes(df, dtypes, inplace=True)
+    return df
+
+
+def load_dataset_to_dataframe(directory: str, columns: list = None) -> pd.DataFrame:
+    """Load a directory of Parquet or Arrow part files (e.g. the output of an incremental run) into one DataFrame.
+
+    The format is determined by the extension of the directory ('.parquet' or '.feather', '.arrow', '.ipc'). The
+    part files are concatenated in the order of their names, files starting with '.' or '_' are skipped.
+    """
+    from pyarrow import dataset
+
+    _, extension = os.path.splitext(directory)
+    file_format = "parquet" if extension.lower() == ".parquet" else "ipc"
+    table = dataset.dataset(directory, format=file_format).to_table(columns=columns)
+    return table.to_pandas(split_blocks=True)
+
+
+def _iter_raw_chunks(file_path: str, chunksize: int, columns: list = None):
+    _, file_extension = os.path.splitext(file_path)
+
+    if file_extension.lower() == ".csv":
+        with pd.read_csv(file_path, chunksize=chunksize, usecols=columns) as reader:
+            yield from reader
+    elif file_extension.lower() in (".jsonl", ".ndjson"):
+        with pd.read_json(file_path, lines=True, chunksize=chunksize) as reader:
+            yield from reader
+    elif file_extension.lower() == ".json":
+        # A JSON document cannot be parsed in parts, so it is read at once and only
+        # the pipeline runs in chunks. Use JSON lines to stream files that do not fit into memory.
+        df = pd.read_json(file_path)
+        if columns is not None:
+            df = df[columns]
+        for offset in range(0, len(df), chunksize):
+            yield df.iloc[offset : offset + chunksize]
+    elif file_extension.lower() == ".parquet":
+        import pyarrow as pa
+        from pyarrow import parquet
+
+        parquet_file = parquet.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield pa.Table.from_batches([batch]).to_pandas()
+    elif file_extension.lower() in ARROW_EXTENSIONS:
+        from pyarrow import feather
+
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        for offset in range(0, table.num_rows, chunksize):
+            yield table.slice(offset, chunksize).to_pandas(split_blocks=True)
+    else:
+        print(
+            "Invalid file extension for chunked reading. Supported formats: CSV, JSON, JSON lines, PARQUET, FEATHER, ARROW."
+        )
+        sys.exit(1)
+
+
+def iter_file_chunks(
+    file_path: str, chunksize: int, dtype: dict = None, columns: list = None
+) -> Iterator[pd.DataFrame]:
+    """Read a CSV, JSON, JSON-lines, Parquet, Feather or Arrow file in chunks of 'chunksize' rows.
+
+    A JSON document is loaded at once and then split into chunks, all other formats are streamed.
+
+    Parameters:
+    ----------
+    file_path : str
+        Path to the file to be read.
+    chunksize : int
+        Number of rows per chunk.
+    dtype : dict, optional
+        Column dtypes every chunk is cast to.
+    columns : list, optional
+        Only these columns are read.
+
+    Returns:
+    ----------
+    chunks : Iterator of DataFrame
+        The chunks of the file. Their index continues across chunks like the index of the whole file.
+    """
+    start = 0
+    for chunk in _iter_raw_chunks(file_path, chunksize, columns):
+        if columns is not None and list(chunk.columns) != list(columns):
+            chunk = chunk[columns]
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk if dtype is None else chunk.astype(dtype)
+
+
+def common_dtypes(chunks) -> dict:
+    """Determine for every column the dtype that can hold its values in all chunks
+    (e.g. float64 for a column that is int64 in chunks without and float64 in chunks with missing values).
+    """
+    dtypes = {}
+    for chunk in chunks:
+        update_common_dtypes(dtypes, chunk)
+    return dtypes
+
+
+def update_common_dtypes(dtypes: dict, chunk: pd.DataFrame) -> None:
+    """Promote the common dtypes 'dtypes' (see common_dtypes) in place, so they also hold the values of 'chunk'."""
+    for column, dtype in chunk.dtypes.items():
+        if column not in dtypes or dtypes[column] == dtype:
+            dtypes[column] = dtype
+            continue
+        try:
+            dtypes[column] = np.promote_types(dtypes[column], dtype)
+        except TypeError:
+            dtypes[column] = np.dtype(object)
+
+
+def get_output_format(output_path: str, output_format: str = None) -> str:
+    """Return 'output_format' or, if it is not given, the output format that belongs to the extension of 'output_path'."""
+    if output_format is not None:
+        return output_format
+    _, file_extension = os.path.splitext(output_path)
+    for name, extension in OUTPUT_FORMATS.items():
+        if file_extension.lower() == extension:
+            return name
+    if file_extension.lower() == ".ipc":
+        return "arrow"
+    print(
+        "Invalid output file extension. Supported formats: CSV, PARQUET, FEATHER, ARROW."
+    )
+    sys.exit(1)
+
+
+class DataFrameWriter:
+    """Writes DataFrames to a CSV, Parquet, Feather or Arrow IPC file piece by piece.
+
+    Every DataFrame passed to 'write' is appended to the file: CSV files get the header once, Parquet files a new
+    row group and Feather/Arrow files (both written as uncompressed Arrow IPC files, so they can be memory-mapped)
+    a new record batch. All pieces must have the columns and dtypes of the first one (or fit into 'schema'). Use it
+    as a context manager or call 'close' to finish the file.
+
+    Parameters:
+    ----------
+    output_path : str
+        Path of the file to be written.
+    output_format : str, optional
+        One of 'csv', 'parquet', 'feather' or 'arrow'. By default it is determined by the extension of 'output_path'.
+    schema : pyarrow.Schema, optional
+        Schema of Parquet, Feather and Arrow files, by default the schema of the first DataFrame.
+    """
+
+    def __init__(self, output_path: str, output_format: str = None, schema=None):
+        self.output_path = output_path
+        self.output_format = get_output_format(output_path, output_format)
+        self._writer = None
+        self._schema = schema
+        self._header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.output_format == "csv":
+            df.to_csv(
+                self.output_path,
+                mode="w" if self._header else "a",
+                header=self._header,
+                index=False,
+            )
+            self._header = False
+            return
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            if self.output_format == "parquet":
+                from pyarrow import parquet
+
+                self._writer = parquet.ParquetWriter(self.output_path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.output_path, self._schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save_dataframe(
+    df: pd.DataFrame, output_path: str, output_format: str = None, schema=None
+) -> None:
+    """Save a DataFrame as CSV, Parquet, Feather or Arrow IPC file (see DataFrameWriter)."""
+    with DataFrameWriter(output_path, output_format, schema) as writer:
+        writer.write(df)
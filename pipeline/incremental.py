@@ -0,0 +1,423 @@
+"""Incremental preprocessing of source files that grow by appending new sales.
+
+Next to the output file a watermark ('<output>.watermark.json') remembers how far the source file was processed
+(number of rows, the byte offset of the last processed line of CSV files and a fingerprint of that row), the
+waterfront reference set of the water distance step and a fingerprint of the pipeline. The next incremental run only
+reads and transforms the rows after the watermark and appends them to the output. CSV outputs are appended to,
+Parquet, Feather and Arrow outputs are directories of part files ('<output>/part-00000.parquet', ...) that get a new
+part per run, so the rows written before are neither read nor written again (see data_io.load_dataset_to_dataframe).
+
+The rows already written only depend on the waterfront reference set. If the new rows contain waterfront houses,
+their water distance to the existing rows is checked: as long as none of them is closer to an existing row than
+the water distance already written, the reference set is extended and the output stays identical to a full
+recompute. Otherwise, and whenever the watermark does not match (missing output, changed pipeline, rewritten
+source history), the whole file is processed again and the reason is reported.
+"""
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from data_io import (
+    OUTPUT_FORMATS,
+    get_output_format,
+    load_file_to_dataframe,
+    save_dataframe,
+)
+from schema_king_county import apply_dtypes
+from spatial_index import NearestReferenceIndex
+from step_cache import code_version, content_hash, value_key
+
+WATERMARK_VERSION = 2
+WATERMARK_SUFFIX = ".watermark.json"
+
+# Bytes read at once while searching the last line of a CSV file
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def watermark_path(output_path: str) -> str:
+    return output_path + WATERMARK_SUFFIX
+
+
+def read_watermark(output_path: str) -> dict:
+    """Return the watermark of 'output_path', None if there is none."""
+    path = watermark_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_watermark(output_path: str, watermark: dict) -> None:
+    path = watermark_path(output_path)
+    with open(path + ".tmp", "w") as file:
+        json.dump(watermark, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def pipeline_fingerprint(preprocessor, columns: list, output_format: str) -> str:
+    """Hash of everything besides the source rows the output depends on: the classes, parameters (except the
+    waterfront reference set) and code of the steps, the dtype schema, the input columns and the output format.
+    """
+    parts = [value_key(preprocessor.dtypes), columns, output_format]
+    for _, stage in preprocessor.preprocessor_pipe.steps:
+        for name, step in stage.steps:
+            params = step.get_params(deep=False)
+            params.pop("reference_points", None)
+            parts += [
+                name,
+                type(step).__qualname__,
+                value_key(params),
+                code_version(step),
+            ]
+    return content_hash(WATERMARK_VERSION, *parts)
+
+
+def _row_fingerprint(row: pd.DataFrame) -> str:
+    return content_hash(*row.iloc[0].astype(str))
+
+
+def _line_fingerprint(line: bytes) -> str:
+    return content_hash(line.rstrip(b"\r\n"))
+
+
+def _is_csv(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() == ".csv"
+
+
+def _last_line_offset(file_path: str) -> tuple:
+    """Byte offset and content of the last non-empty line of a file."""
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        end = size
+        tail = b""
+        while end > 0:
+            start = max(0, end - TAIL_BLOCK_SIZE)
+            file.seek(start)
+            tail = file.read(end - start) + tail
+            end = start
+            stripped = tail.rstrip(b"\r\n")
+            newline = stripped.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1, stripped[newline + 1 :]
+        stripped = tail.rstrip(b"\r\n")
+        return 0, stripped
+
+
+def source_position(file_path: str, n_rows: int, columns: list = None) -> dict:
+    """Watermark of a source file of which all 'n_rows' rows were processed."""
+    position = {"rows": n_rows}
+    if _is_csv(file_path):
+        offset, line = _last_line_offset(file_path)
+        position.update(offset=offset, last_row=_line_fingerprint(line))
+    elif n_rows:
+        last_row = _read_rows(file_path, n_rows - 1, columns)
+        position["last_row"] = _row_fingerprint(last_row.iloc[:1])
+    return position
+
+
+def _read_rows(file_path: str, start: int, columns: list = None) -> pd.DataFrame:
+    """Rows 'start:' of a source file. Parquet files skip the row groups before 'start', Arrow and Feather
+    files are memory-mapped, other formats are read completely."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".parquet":
+        from pyarrow import parquet
+
+        parquet_file = parquet.ParquetFile(file_path)
+        first_row = 0
+        row_groups = []
+        for i in range(parquet_file.num_row_groups):
+            n_rows = parquet_file.metadata.row_group(i).num_rows
+            if first_row + n_rows > start:
+                row_groups.append(i)
+            else:
+                first_row += n_rows
+        if not row_groups:
+            return load_file_to_dataframe(file_path, columns).iloc[:0]
+        table = parquet_file.read_row_groups(row_groups, columns=columns)
+        df = table.slice(start - first_row).to_pandas()
+    elif extension in (".feather", ".arrow", ".ipc"):
+        from pyarrow import feather
+
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        df = table.slice(start).to_pandas(split_blocks=True)
+    else:
+        df = load_file_to_dataframe(file_path, columns).iloc[start:]
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def _read_csv_rows(file_path: str, offset: int, columns: list = None):
+    """Rows of a CSV file from the line starting at byte 'offset' (the last processed line) to the end.
+
+    Returns:
+    ----------
+    first_line : bytes
+        The line at 'offset'.
+    df : DataFrame
+        The rows after it.
+    last_line : tuple
+        Byte offset and content of the last line (None if there are no rows after the first line).
+    """
+    with open(file_path, "rb") as file:
+        header = file.readline()
+        file.seek(offset)
+        data = file.read()
+    first_end = data.find(b"\n") + 1 or len(data)
+    first_line, rest = data[:first_end], data[first_end:]
+    if not rest.strip():
+        return first_line, None, None
+    df = pd.read_csv(io.BytesIO(header + rest), usecols=columns)
+    return first_line, df, _last_line_offset(file_path)
+
+
+def read_new_rows(file_path: str, watermark: dict, columns: list = None):
+    """Read the rows of the source file after the watermark.
+
+    Returns:
+    ----------
+    new_rows : DataFrame or None
+        The new rows, None if the processed rows of the source file changed.
+    position : dict
+        Position of the source file after the new rows (see source_position).
+    """
+    n_rows = watermark["rows"]
+    if _is_csv(file_path):
+        if os.path.getsize(file_path) < watermark["offset"]:
+            return None, None
+        first_line, df, last_line = _read_csv_rows(
+            file_path, watermark["offset"], columns
+        )
+        if _line_fingerprint(first_line) != watermark["last_row"]:
+            return None, None
+        if df is None:
+            return pd.DataFrame(), watermark
+        df.index = pd.RangeIndex(n_rows, n_rows + len(df))
+        offset, line = last_line
+        return df, {
+            "rows": n_rows + len(df),
+            "offset": offset,
+            "last_row": _line_fingerprint(line),
+        }
+
+    df = _read_rows(file_path, max(n_rows - 1, 0), columns)
+    if n_rows:
+        if df.empty or _row_fingerprint(df.iloc[:1]) != watermark["last_row"]:
+            return None, None
+        df = df.iloc[1:]
+    if df.empty:
+        return df, watermark
+    return df, {"rows": n_rows + len(df), "last_row": _row_fingerprint(df.iloc[-1:])}
+
+
+def _cast_like_history(df: pd.DataFrame, source_dtypes: dict) -> pd.DataFrame:
+    """Cast the new rows to the dtypes the columns had in the whole source file (e.g. float for a column without
+    missing values in the new rows), so they are written like the rows before."""
+    for column, dtype in source_dtypes.items():
+        if column in df.columns and str(df[column].dtype) != dtype:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
+
+
+def _waterfront_points(df: pd.DataFrame) -> np.ndarray:
+    return df.loc[df["waterfront"] == 1, ["long", "lat"]].to_numpy(dtype=float)
+
+
+def _new_points(points: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Points that are not part of the reference set yet."""
+    if len(points) == 0:
+        return points
+    known = {tuple(point) for point in reference}
+    return np.unique(
+        np.array([point for point in points if tuple(point) not in known]).reshape(
+            -1, 2
+        ),
+        axis=0,
+    )
+
+
+def _rows_closer_to(points: np.ndarray, output_path: str) -> int:
+    """Number of rows of the output that are closer to one of 'points' than their written water distance."""
+    existing = load_file_to_dataframe(output_path, ["long", "lat", "water_distance"])
+    distance = NearestReferenceIndex(points[:, 0], points[:, 1]).query(
+        existing["long"], existing["lat"]
+    )
+    return int((distance < existing["water_distance"].to_numpy()).sum())
+
+
+def _part_path(output_path: str, output_format: str, part: int) -> str:
+    return os.path.join(output_path, f"part-{part:05d}{OUTPUT_FORMATS[output_format]}")
+
+
+def _reset_output(output_path: str, output_format: str) -> str:
+    """Remove the output of previous runs and return the path the whole file is written to: the output itself for
+    CSV, otherwise the first part file of the output directory."""
+    if os.path.isdir(output_path):
+        shutil.rmtree(output_path)
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+    if output_format == "csv":
+        return output_path
+    os.makedirs(output_path)
+    return _part_path(output_path, output_format, 0)
+
+
+def _append_output(
+    df: pd.DataFrame, output_path: str, output_format: str, dtypes: dict, part: int
+) -> bool:
+    """Append the transformed new rows to the output: to the CSV file or as part file number 'part' of the output
+    directory. The rows are stored in the dtypes of the output; returns False if they do not fit into them.
+    """
+    if output_format == "csv":
+        df.to_csv(output_path, mode="a", header=False, index=False)
+        return True
+    import pyarrow as pa
+    from pyarrow import dataset
+
+    df, _ = apply_dtypes(df.reset_index(drop=True), dtypes, inplace=True)
+    file_format = "parquet" if output_format == "parquet" else "ipc"
+    # The parts must share a schema, so the new part is written in the schema of the output
+    schema = dataset.dataset(output_path, format=file_format).schema
+    temporary_path = os.path.join(output_path, ".part.tmp")
+    try:
+        save_dataframe(df, temporary_path, output_format, schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return False
+    os.replace(temporary_path, _part_path(output_path, output_format, part))
+    return True
+
+
+def process_incrementally(
+    file_path: str,
+    output_path: str,
+    preprocessor,
+    output_format: str = None,
+    columns: list = None,
+    full_run=None,
+) -> dict:
+    """Preprocess the rows appended to 'file_path' since the last run and append them to 'output_path'.
+
+    Parameters:
+    ----------
+    file_path : str
+        Path to the source file.
+    output_path : str
+        Path of the output file with its watermark. Parquet, Feather and Arrow outputs are directories of part files.
+    preprocessor : PreprocessingKingCountyData
+        Preprocessor used to transform the rows.
+    output_format : str, optional
+        Format of the output file, by default determined by the extension of 'output_path'.
+    columns : list, optional
+        Only these columns of the source file are read.
+    full_run : callable, optional
+        Function (file_path, output_path, output_format, columns) that processes the whole file with 'preprocessor'
+        and returns the number of source rows and the dtypes of the source columns, e.g. to process it in chunks.
+        By default the file is loaded at once.
+
+    Returns:
+    ----------
+    report : dict
+        'mode' ('incremental' or 'full'), 'reason' of a full recompute, the number of 'new_rows' read and the
+        number of 'rows_written' to the output.
+    """
+    output_format = get_output_format(output_path, output_format)
+    fingerprint = pipeline_fingerprint(preprocessor, columns, output_format)
+    watermark = read_watermark(output_path)
+
+    reason = None
+    if watermark is None or not os.path.exists(output_path):
+        reason = "no previous output"
+    elif (
+        watermark.get("version") != WATERMARK_VERSION
+        or watermark["source"] != os.path.abspath(file_path)
+        or watermark["pipeline"] != fingerprint
+    ):
+        reason = "the source file or the pipeline changed"
+    else:
+        new_rows, position = read_new_rows(file_path, watermark, columns)
+        if new_rows is None:
+            reason = "the rows already processed changed"
+
+    if reason is None:
+        if new_rows.empty:
+            return {
+                "mode": "incremental",
+                "reason": None,
+                "new_rows": 0,
+                "rows_written": 0,
+            }
+        new_rows = _cast_like_history(new_rows, watermark["source_dtypes"])
+        reference = np.array(watermark["waterfront_reference"], dtype=float).reshape(
+            -1, 2
+        )
+        preprocessor.set_water_reference(reference)
+        transformed = preprocessor.preprocess_fit_transform(new_rows)
+        added = _new_points(_waterfront_points(transformed), reference)
+        if len(added):
+            changed = _rows_closer_to(added, output_path)
+            if changed:
+                reason = f"{len(added)} new waterfront house(s) change the water distance of {changed} existing row(s)"
+            else:
+                reference = np.concatenate([reference, added])
+                preprocessor.set_water_reference(reference)
+                transformed = preprocessor.preprocess_fit_transform(new_rows)
+
+    if reason is None:
+        if _append_output(
+            transformed,
+            output_path,
+            output_format,
+            preprocessor.dtypes_,
+            watermark["parts"],
+        ):
+            watermark.update(position)
+            watermark["waterfront_reference"] = reference.tolist()
+            watermark["output_rows"] += len(transformed)
+            watermark["parts"] += 1
+            write_watermark(output_path, watermark)
+            return {
+                "mode": "incremental",
+                "reason": None,
+                "new_rows": len(new_rows),
+                "rows_written": len(transformed),
+            }
+        reason = "the new rows do not fit into the dtypes of the output"
+
+    preprocessor.set_water_reference(None)
+    full_output_path = _reset_output(output_path, output_format)
+    if full_run is None:
+        df = load_file_to_dataframe(file_path, columns)
+        source_dtypes = {column: str(dtype) for column, dtype in df.dtypes.items()}
+        transformed = preprocessor.preprocess_fit_transform(df)
+        save_dataframe(transformed, full_output_path, output_format)
+        n_rows, output_rows = len(df), len(transformed)
+        del df, transformed
+    else:
+        n_rows, source_dtypes = full_run(
+            file_path, full_output_path, output_format, columns
+        )
+        source_dtypes = {column: str(dtype) for column, dtype in source_dtypes.items()}
+        output_rows = len(load_file_to_dataframe(full_output_path, ["waterfront"]))
+    water_step = preprocessor.feature_engineering_pipeline.named_steps["water_distance"]
+    watermark = {
+        "version": WATERMARK_VERSION,
+        "source": os.path.abspath(file_path),
+        "pipeline": fingerprint,
+        "source_dtypes": source_dtypes,
+        "waterfront_reference": water_step.reference_points_.tolist(),
+        "output_rows": output_rows,
+        "parts": 1,
+    }
+    watermark.update(source_position(file_path, n_rows, columns))
+    write_watermark(output_path, watermark)
+    return {
+        "mode": "full",
+        "reason": reason,
+        "new_rows": n_rows,
+        "rows_written": output_rows,
+    }
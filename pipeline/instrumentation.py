@@ -0,0 +1,193 @@
+"""Instrumentation callbacks of the King County preprocessing pipeline.
+
+PreprocessingKingCountyData calls every callback around each named step of its data cleaning and feature
+engineering pipelines. 'on_step_start' receives the name of the step ('<pipeline>__<step>') and its input,
+'on_step_end' the name, the output and a record of the step with these keys:
+
+    name, stage, step       full name, pipeline and name of the step
+    wall_s, cpu_s           wall and CPU time of the step in seconds
+    rows_in, rows_out       number of rows before and after the step
+    columns_added           columns the step created
+    columns_removed         columns the step dropped
+    memory_delta_mb         change of the DataFrame size in MiB
+    peak_mb                 peak memory allocated by the step in MiB (only with 'track_memory=True')
+
+'on_run_end' receives the records of all steps of the run. The callbacks below log, trace and profile the steps.
+"""
+import cProfile
+import importlib.util
+import io
+import json
+import logging
+import os
+import pstats
+import time
+
+LOGGER = logging.getLogger("preprocessing_king_county")
+
+
+class StepCallback:
+    """Base class of the instrumentation callbacks, every hook does nothing by default."""
+
+    def on_step_start(self, name: str, df) -> None:
+        pass
+
+    def on_step_end(self, name: str, df, record: dict) -> None:
+        pass
+
+    def on_run_end(self, records: list) -> None:
+        pass
+
+
+def _share(record: dict, records: list) -> float:
+    total = sum(other["wall_s"] for other in records)
+    return 100 * record["wall_s"] / total if total else 0.0
+
+
+def format_record(record: dict) -> str:
+    """Describe a step record in one line."""
+    line = (
+        f"{record['name']}: {record['wall_s']:.3f} s wall, {record['cpu_s']:.3f} s CPU, "
+        f"{record['rows_in']} -> {record['rows_out']} rows"
+    )
+    if record["rows_in"] != record["rows_out"]:
+        line += f" ({record['rows_out'] - record['rows_in']:+d})"
+    if record["columns_added"]:
+        line += f", added {', '.join(record['columns_added'])}"
+    if record["columns_removed"]:
+        line += f", removed {', '.join(record['columns_removed'])}"
+    line += f", frame {record['memory_delta_mb']:+.2f} MiB"
+    if "peak_mb" in record:
+        line += f", peak {record['peak_mb']:.2f} MiB"
+    return line
+
+
+class LogCallback(StepCallback):
+    """Logs one line per step and, at the end of the run, the share of every step in the total wall time.
+
+    Parameters:
+    ----------
+    logger : logging.Logger, optional
+        Logger the lines are written to, by default the 'preprocessing_king_county' logger.
+    level : int
+        Level of the log lines.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or LOGGER
+        self.level = level
+
+    def on_step_end(self, name: str, df, record: dict) -> None:
+        self.logger.log(self.level, format_record(record))
+
+    def on_run_end(self, records: list) -> None:
+        if not records:
+            return
+        total = sum(record["wall_s"] for record in records)
+        shares = ", ".join(
+            f"{record['step']} {_share(record, records):.0f} %"
+            for record in sorted(records, key=lambda record: -record["wall_s"])
+        )
+        self.logger.log(self.level, f"Run took {total:.3f} s: {shares}")
+
+
+class JsonTraceCallback(StepCallback):
+    """Writes the records of every run to a JSON file in the Trace Event Format, which can be opened
+    in chrome://tracing or https://ui.perfetto.dev. Every step is an event with its record as arguments.
+
+    Parameters:
+    ----------
+    path : str
+        Path of the trace file, rewritten at the end of every run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._started = {}
+
+    def on_step_start(self, name: str, df) -> None:
+        self._started[name] = time.time()
+
+    def on_run_end(self, records: list) -> None:
+        events = [
+            {
+                "name": record["step"],
+                "cat": record["stage"],
+                "ph": "X",
+                "ts": self._started.get(record["name"], 0) * 1e6,
+                "dur": record["wall_s"] * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": dict(record, share_percent=_share(record, records)),
+            }
+            for record in records
+        ]
+        with open(self.path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, indent=2)
+        self._started = {}
+
+
+class ProfileCallback(StepCallback):
+    """Profiles one chosen step with cProfile or pyinstrument.
+
+    Parameters:
+    ----------
+    step : str
+        Name of the step, either the full name (e.g. 'feature_engineering__water_distance') or the name within
+        its pipeline (e.g. 'water_distance').
+    path : str, optional
+        File the profile of the last run of the step is written to: cProfile statistics (readable with pstats or
+        snakeviz) or, for pyinstrument, an HTML report.
+    profiler : str
+        'cprofile' (default) or 'pyinstrument' (has to be installed).
+    """
+
+    PROFILERS = ("cprofile", "pyinstrument")
+
+    def __init__(self, step: str, path: str = None, profiler: str = "cprofile"):
+        if profiler not in self.PROFILERS:
+            raise ValueError(f"'profiler' must be one of {', '.join(self.PROFILERS)}")
+        if (
+            profiler == "pyinstrument"
+            and importlib.util.find_spec("pyinstrument") is None
+        ):
+            raise ImportError("profiler='pyinstrument' requires pyinstrument")
+        self.step = step
+        self.path = path
+        self.profiler = profiler
+        self.report = None
+        self._profile = None
+
+    def _matches(self, name: str) -> bool:
+        return self.step in (name, name.split("__", 1)[-1])
+
+    def on_step_start(self, name: str, df) -> None:
+        if not self._matches(name):
+            return
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._profile = Profiler()
+            self._profile.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def on_step_end(self, name: str, df, record: dict) -> None:
+        if not self._matches(name) or self._profile is None:
+            return
+        if self.profiler == "pyinstrument":
+            self._profile.stop()
+            self.report = self._profile.output_text()
+            if self.path:
+                with open(self.path, "w") as file:
+                    file.write(self._profile.output_html())
+        else:
+            self._profile.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(20)
+            self.report = stream.getvalue()
+            if self.path:
+                stats.dump_stats(self.path)
+        self._profile = None
@@ -0,0 +1,184 @@
+"""Multi-core transformation of King County DataFrames.
+
+The input DataFrame is split into row partitions that are transformed in a process pool. Numeric columns (and a
+numeric index) are placed in shared memory once, so every worker only attaches to the buffers and copies its own
+rows instead of receiving a pickled DataFrame. Only the remaining (e.g. string) columns are pickled per partition.
+"""
+import copy
+import math
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Partitions smaller than this are not worth the overhead of a worker process
+MIN_ROWS_PER_JOB = 10_000
+
+# Preprocessor of the worker process, unpickled once by the pool initializer
+_WORKER_PREPROCESSOR = None
+
+
+def effective_n_jobs(n_jobs: int) -> int:
+    """Translate 'n_jobs' into a number of processes (-1 means all CPUs, -2 all but one, ...)."""
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def n_partitions(n_rows: int, n_jobs: int) -> int:
+    """Number of row partitions 'n_rows' rows are split into for 'n_jobs' processes."""
+    return max(1, min(effective_n_jobs(n_jobs), math.ceil(n_rows / MIN_ROWS_PER_JOB)))
+
+
+def _is_shareable(values) -> bool:
+    return isinstance(values, np.ndarray) and values.dtype.kind in "biufmM"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing shared memory block. The pool workers share the resource tracker of the
+    parent process, which unlinks the block once the transformation is done.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrame:
+    """Context manager that places the numeric columns and the index of a DataFrame in shared memory.
+
+    'spec' describes the shared buffers and is small enough to be sent to every worker, 'local_columns'
+    lists the columns that could not be shared and have to be sent with each partition.
+    """
+
+    INDEX = "__index__"
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        self.n_rows = len(df)
+        self.blocks = []
+        self.spec = {"n_rows": self.n_rows, "columns": self.columns, "shared": {}}
+        self.local_columns = []
+        arrays = {self.INDEX: df.index.to_numpy()}
+        arrays.update({column: df[column].to_numpy() for column in self.columns})
+        for column, values in arrays.items():
+            if not _is_shareable(values):
+                if column != self.INDEX:
+                    self.local_columns.append(column)
+                continue
+            shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+            self.blocks.append(shm)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+            self.spec["shared"][column] = (shm.name, values.dtype.str)
+        self.spec["index_name"] = df.index.name
+        self.spec["local_index"] = self.INDEX not in self.spec["shared"]
+        self._df = df
+
+    def local_part(self, start: int, stop: int) -> pd.DataFrame:
+        """Columns (and index if not numeric) of the rows start:stop that are sent to the worker."""
+        part = self._df.iloc[start:stop][self.local_columns]
+        if not self.spec["local_index"]:
+            part = part.reset_index(drop=True)
+        return part
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+        self._df = None
+
+
+def read_partition(spec: dict, start: int, stop: int, local: pd.DataFrame):
+    """Rebuild the rows start:stop of a SharedFrame in a worker process as a DataFrame of its own."""
+    data = {}
+    index = local.index
+    for column, (name, dtype) in spec["shared"].items():
+        shm = _attach(name)
+        try:
+            values = np.ndarray(
+                (spec["n_rows"],), dtype=np.dtype(dtype), buffer=shm.buf
+            )
+            part = values[start:stop].copy()
+            del values
+        finally:
+            shm.close()
+        if column == SharedFrame.INDEX:
+            index = pd.Index(part, name=spec["index_name"])
+        else:
+            data[column] = part
+    for column in local.columns:
+        data[column] = local[column].to_numpy()
+    return pd.DataFrame(data, index=index, columns=spec["columns"])
+
+
+def _init_worker(pickled_preprocessor: bytes) -> None:
+    global _WORKER_PREPROCESSOR
+    _WORKER_PREPROCESSOR = pickle.loads(pickled_preprocessor)
+
+
+def _transform_partition(spec: dict, start: int, stop: int, local: pd.DataFrame):
+    df = read_partition(spec, start, stop, local)
+    result = _WORKER_PREPROCESSOR.preprocess_transform(df)
+    return result, _WORKER_PREPROCESSOR.filter_report()
+
+
+def transform_in_parallel(preprocessor, df: pd.DataFrame, n_jobs: int):
+    """Transform 'df' with a fitted preprocessor in up to 'n_jobs' processes.
+
+    Parameters:
+    ----------
+    preprocessor : PreprocessingKingCountyData
+        Fitted preprocessor. Every worker receives a copy that transforms its partition on a single core.
+    df : DataFrame
+        Input DataFrame.
+    n_jobs : int
+        Maximum number of worker processes.
+
+    Returns:
+    ----------
+    preprocessed_df : DataFrame
+        The transformed partitions, concatenated in the order of the input rows.
+    filter_report : dict
+        The rows removed by each filter, summed over all partitions.
+    """
+    n_parts = n_partitions(len(df), n_jobs)
+    bounds = np.linspace(0, len(df), n_parts + 1).astype(int)
+
+    worker_preprocessor = copy.copy(preprocessor)
+    worker_preprocessor.n_jobs = 1
+    worker_preprocessor.callbacks = None
+    # The partitions are private copies already
+    worker_preprocessor.copy = "none"
+    with SharedFrame(df) as shared, ProcessPoolExecutor(
+        max_workers=n_parts,
+        initializer=_init_worker,
+        initargs=(pickle.dumps(worker_preprocessor),),
+    ) as pool:
+        futures = [
+            pool.submit(
+                _transform_partition,
+                shared.spec,
+                start,
+                stop,
+                shared.local_part(start, stop),
+            )
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        results = [future.result() for future in futures]
+
+    filter_report = {}
+    for _, report in results:
+        for step, counts in report.items():
+            merged = filter_report.setdefault(step, dict.fromkeys(counts, 0))
+            for condition, count in counts.items():
+                merged[condition] += count
+    return pd.concat([result for result, _ in results]), filter_report
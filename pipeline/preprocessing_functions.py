@@ -1,17 +1,14 @@
 """This script contains all the functions used in the transformer classes for data cleaning and in the creator classes for feature engineering."""
 import numpy as np
 import pandas as pd
+from spatial_index import NearestReferenceIndex
 
 
 def bath_bed_ratio_outlier(df):
     df.copy()
     df["bath_bed_ratio"] = df["bathrooms"] / df["bedrooms"]
-    for idx, ratio in enumerate(df["bath_bed_ratio"]):
-        if ratio >= 2:
-            df.drop(idx, inplace=True)
-        elif ratio <= 0.10:
-            df.drop(idx, inplace=True)
-    return df
+    outlier = ((df["bath_bed_ratio"] >= 2) | (df["bath_bed_ratio"] <= 0.10)).to_numpy()
+    return df.take(np.flatnonzero(~outlier))
 
 
 def sqft_basement(df):
@@ -31,15 +28,11 @@ def fill_missings_view_wf(df):
 
 def calculate_last_change(df):
     df.copy()
-    last_known_change = []
-    for idx, yr_re in df.yr_renovated.items():
-        if str(yr_re) == "nan" or yr_re == 0.0:
-            last_known_change.append(df.yr_built[idx])
-        else:
-            last_known_change.append(int(yr_re))
-    df["last_known_change"] = last_known_change
-    df.drop("yr_renovated", axis=1, inplace=True)
-    df.drop("yr_built", axis=1, inplace=True)
+    not_renovated = df["yr_renovated"].isna() | (df["yr_renovated"] == 0.0)
+    df["last_known_change"] = np.where(
+        not_renovated, df["yr_built"], df["yr_renovated"]
+    ).astype(int)
+    df.drop(["yr_renovated", "yr_built"], axis=1, inplace=True)
     return df
 
 
@@ -84,12 +77,7 @@ def calculate_water_distance(df):
     df.copy()
     water_list = df.query("waterfront == 1")
 
-    water_distance = []
-    # For each row in our data frame we now calculate the distance to the seafront
-    for idx, lat in df.lat.items():
-        ref_list = []
-        for i, j in zip(list(water_list.long), list(water_list.lat)):
-            ref_list.append(dist(df.long[idx], df.lat[idx], i, j).min())
-        water_distance.append(min(ref_list))
-    df["water_distance"] = water_distance
+    # One batched nearest-neighbour query for all rows instead of a loop over every pair
+    water_index = NearestReferenceIndex(water_list.long, water_list.lat)
+    df["water_distance"] = water_index.query(df.long, df.lat)
     return df
@@ -1,4 +1,10 @@
+import copy
+import time
+import tracemalloc
+
+import numpy as np
 import pandas as pd
+from artifact import load_artifact, save_artifact
 from custom_creator_king_county import (
     CenterDistanceCreator,
     DropNoPredictionValues,
@@ -11,7 +17,20 @@ from custom_transformer_king_county import (
     SqftBasementTransformer,
     ViewWaterfrontTransformer,
 )
+from parallel import n_partitions, transform_in_parallel
+from schema_king_county import (
+    apply_dtypes,
+    declared_dtypes,
+    memory_usage_mb,
+    resolve_dtypes,
+)
 from sklearn.pipeline import Pipeline
+from step_cache import StepCache, code_version, frame_key, value_key
+
+
+def waterfront_points(df: pd.DataFrame) -> np.ndarray:
+    """The long/lat pairs of the waterfront properties of 'df'."""
+    return df.loc[df["waterfront"] == 1, ["long", "lat"]].to_numpy()
 
 
 class PreprocessingKingCountyData:
@@ -19,31 +38,123 @@ class PreprocessingKingCountyData:
        It consists of two main pipelines: data cleaning pipeline and feature engineering pipeline.
 
 
+    Parameters:
+    ----------
+    copy : str
+        Copy policy of the pipeline. 'none' transforms the input DataFrame in place without any copy,
+        'once' (default) makes a single defensive copy of the input before the first step and 'per_step'
+        lets every step work on its own copy (useful for debugging).
+    track_memory : bool
+        If True, the peak memory allocated by every step is traced with tracemalloc and reported by 'memory_report'.
+    n_jobs : int
+        Number of processes used to transform large DataFrames (-1 uses all CPUs). The rows are split into partitions
+        that are transformed in parallel from shared memory and concatenated in their original order. The input is
+        never modified in place and no memory report is recorded in this case.
+    dtypes : str, dict or None
+        Dtype schema the columns are stored in (see schema_king_county.py). 'exact' (default) uses small integer
+        columns for counts and years and keeps the values of all other columns, 'compact' also stores prices,
+        coordinates and distances in float32 (which rounds them) and the zipcode as category, and None keeps the
+        dtypes of the input. A dict declares the dtype of every column directly. The schema is applied to the input
+        and kept after every step.
+    callbacks : list of StepCallback, optional
+        Instrumentation callbacks called around every step with its wall and CPU time, rows, columns and memory
+        (see instrumentation.py), e.g. LogCallback, JsonTraceCallback or ProfileCallback. They are not called
+        when the data is transformed in several processes.
+    cache : StepCache, optional
+        On-disk cache of the outputs and fitted steps of the stages (see step_cache.py). 'preprocess_fit_transform'
+        serves the longest unchanged prefix of the stages from the cache and only runs the stages after it. It is
+        not used by 'preprocess_fit' and 'preprocess_transform'.
+
     Methods:
     ----------
+    preprocess_fit(df):
+        Fit the preprocessing pipeline to the input DataFrame.
     preprocess_fit_transform(df):
         Fit and transform the input DataFrame using the preprocessing pipeline.
     preprocess_transform(df):
         Transform the input DataFrame using the preprocessing pipeline.
+    filter_report():
+        Number of rows removed by each filtering step during the last run.
+    memory_report():
+        Peak memory and resulting DataFrame size of each step and of the dtype conversion during the last run.
+    timing_report():
+        Wall time of each step and of the dtype conversion during the last run.
+    water_reference_points(chunks):
+        Collect the waterfront reference points of data that is processed in chunks.
+    set_water_reference(points):
+        Fix the waterfront reference points used by the water distance step.
+    resolve_dtypes(chunks):
+        Resolve the dtype schema for data that is processed in chunks.
+    save(path, model):
+        Save the fitted preprocessor and a model to a versioned artifact.
+    load(path):
+        Load a fitted preprocessor (and its model as 'model_') from an artifact.
 
     """
 
-    def __init__(self):
+    COPY_MODES = ("none", "once", "per_step")
+
+    # Raw columns the pipeline uses, either in its steps or as features. 'id', 'date', 'sqft_living15'
+    # and 'sqft_lot15' are never used and do not need to be read.
+    INPUT_COLUMNS = [
+        "price",
+        "bedrooms",
+        "bathrooms",
+        "sqft_living",
+        "sqft_lot",
+        "floors",
+        "waterfront",
+        "view",
+        "condition",
+        "grade",
+        "sqft_above",
+        "sqft_basement",
+        "yr_built",
+        "yr_renovated",
+        "zipcode",
+        "lat",
+        "long",
+    ]
+
+    def __init__(
+        self,
+        copy: str = "once",
+        track_memory: bool = False,
+        n_jobs: int = 1,
+        dtypes: str = "exact",
+        callbacks: list = None,
+        cache: StepCache = None,
+    ):
+        if copy not in self.COPY_MODES:
+            raise ValueError(f"'copy' must be one of {', '.join(self.COPY_MODES)}")
+        self.copy = copy
+        self.track_memory = track_memory
+        self.n_jobs = n_jobs
+        self.dtypes = dtypes
+        self.callbacks = callbacks
+        self.cache = cache
+        self.cached_steps_ = []
+        self.model_ = None
+        self.dtypes_ = declared_dtypes(dtypes) if dtypes else {}
+        self.memory_report_ = {}
+        self.timing_report_ = {}
+        step_copy = copy == "per_step"
+
         self.data_cleaning_pipeline = Pipeline(
             [
-                ("bathroom_bedroom_ratio", BathBedRoomTransformer()),
-                ("sqft_basement", SqftBasementTransformer()),
-                ("view_and_waterfront", ViewWaterfrontTransformer()),
-                ("last_known_change", LastKnownChangeTransformer()),
+                ("bathroom_bedroom_ratio", BathBedRoomTransformer(copy=step_copy)),
+                ("sqft_basement", SqftBasementTransformer(copy=step_copy)),
+                ("view_and_waterfront", ViewWaterfrontTransformer(copy=step_copy)),
+                ("last_known_change", LastKnownChangeTransformer(copy=step_copy)),
             ]
         )
 
         self.feature_engineering_pipeline = Pipeline(
             [
-                ("sqft_price", SqftPriceCreator()),
-                ("center_distance", CenterDistanceCreator()),
-                ("water_distance", WaterDistanceCreator()),
-                ("no_pred_values", DropNoPredictionValues()),
+                ("sqft_price", SqftPriceCreator(copy=step_copy)),
+                ("center_distance", CenterDistanceCreator(copy=step_copy)),
+                ("water_distance", WaterDistanceCreator(copy=step_copy)),
+                ("no_pred_values", DropNoPredictionValues(copy=step_copy)),
             ]
         )
 
@@ -54,7 +165,30 @@ class PreprocessingKingCountyData:
             ]
         )
 
-    def preprocess_fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    def preprocess_fit(self, df: pd.DataFrame) -> "PreprocessingKingCountyData":
+        """Fit the preprocessing pipeline to the input DataFrame.
+
+        Every step learns its state (e.g. the waterfront reference points of the water distance step) from the
+        output of the previous steps. The fitted preprocessor transforms new data with 'preprocess_transform'
+        exactly like the training data. Once every step that learns from the values of the rows is fitted, the
+        remaining steps only need the columns and are run on the first row.
+
+        Parameters:
+        ----------
+        df : DataFrame
+            Input DataFrame.
+
+        Returns:
+        ----------
+        self : PreprocessingKingCountyData
+            The fitted preprocessor.
+        """
+        self._run_steps(df, fit=True, fit_only=True)
+        return self
+
+    def preprocess_fit_transform(
+        self, df: pd.DataFrame, input_key: str = None
+    ) -> pd.DataFrame:
         """Fit and transform the input DataFrame using the preprocessing pipeline.
 
         This method fits the preprocessing pipeline to the input DataFrame and applies the transformations.
@@ -63,18 +197,24 @@ class PreprocessingKingCountyData:
         ----------
         df : DataFrame
             Input DataFrame.
+        input_key : str, optional
+            Key of the input data in the step cache, e.g. step_cache.file_key of the file 'df' was loaded from.
+            By default the key is a hash of the content of 'df'.
 
         Returns:
         ----------
         preprocessed_df : DataFrame
             Preprocessed DataFrame after fitting and transforming the data.
         """
-        return self.preprocessor_pipe.fit_transform(df)
+        if n_partitions(len(df), self.n_jobs) > 1:
+            return self._fit_transform_in_parallel(df, input_key)
+        return self._run_steps(df, fit=True, input_key=input_key)
 
     def preprocess_transform(self, df: pd.DataFrame) -> pd.DataFrame:
         """Transform the input DataFrame using the preprocessing pipeline.
 
-        This method applies the transformations from the preprocessing pipeline to the input DataFrame.
+        This method applies the transformations from the preprocessing pipeline to the input DataFrame,
+        reusing the state learned by 'preprocess_fit' or 'preprocess_fit_transform'.
 
         Parameters:
         ----------
@@ -86,4 +226,378 @@ class PreprocessingKingCountyData:
         preprocessed_df : DataFrame
             Preprocessed DataFrame after transforming the data.
         """
-        return self.preprocessor_pipe.transform(df)
+        if n_partitions(len(df), self.n_jobs) > 1:
+            self.memory_report_ = {}
+            self.timing_report_ = {}
+            df, filter_report = transform_in_parallel(self, df, self.n_jobs)
+            cleaning_steps = self.data_cleaning_pipeline.named_steps
+            for name, rows_removed in filter_report.items():
+                cleaning_steps[name].rows_removed_ = rows_removed
+            return df
+        return self._run_steps(df, fit=False)
+
+    def _run_steps(
+        self,
+        df: pd.DataFrame,
+        fit: bool,
+        fit_only: bool = False,
+        input_key: str = None,
+    ) -> pd.DataFrame:
+        """Run the steps of the nested pipelines one by one, applying the copy policy and the dtype schema, timing
+        them and tracing memory. With 'fit_only' the steps after the last one that learns from the rows only see the first row.
+        """
+        if fit:
+            self.dtypes_ = declared_dtypes(self.dtypes) if self.dtypes else {}
+        self.memory_report_ = {}
+        self.timing_report_ = {}
+        self.cached_steps_ = []
+        records = []
+        stages = self._stages()
+        steps = [step for _, stage_steps in stages for step in stage_steps]
+        last_learning_step = max(
+            (i for i, (_, step) in enumerate(steps) if step.learns_from_rows),
+            default=-1,
+        )
+        # Maps the position of the last step of every stage that is run to the cache key and the steps of the stage
+        keys = {}
+        if self.cache is not None and fit and not fit_only:
+            stage_keys = self.cache.stage_keys(
+                input_key or frame_key(df), self._cache_context(), stages
+            )
+            n_cached, df = self._load_cached_stages(stage_keys, stages, df)
+            steps = steps[len(self.cached_steps_) :]
+            end = 0
+            for key, (_, stage_steps) in list(zip(stage_keys, stages))[n_cached:]:
+                end += len(stage_steps)
+                keys[end - 1] = (key, [step for _, step in stage_steps])
+        start_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        try:
+            if self.track_memory:
+                input_mb = memory_usage_mb(df)
+                traced_before = self._reset_peak()
+            started = time.perf_counter()
+            input_df = df
+            # Casting to the schema without 'inplace' already returns a new DataFrame
+            df = self._apply_dtypes(df, fit, inplace=self.copy == "none")
+            if self.copy == "once" and df is input_df and not self.cached_steps_:
+                df = df.copy()
+            self.timing_report_["dtypes"] = time.perf_counter() - started
+            if self.track_memory:
+                self._record_memory("dtypes", df, traced_before)
+                self.memory_report_["dtypes"]["input_frame_mb"] = input_mb
+
+            for i, (name, step) in enumerate(steps):
+                if self.track_memory:
+                    traced_before = self._reset_peak()
+                if self.callbacks:
+                    df_in = (len(df), list(df.columns), memory_usage_mb(df))
+                    for callback in self.callbacks:
+                        callback.on_step_start(name, df)
+                    cpu_started = time.process_time()
+                started = time.perf_counter()
+                if fit_only and i == last_learning_step:
+                    df = step.fit(df).transform(df.iloc[:1].copy())
+                else:
+                    df = step.fit_transform(df) if fit else step.transform(df)
+                df = self._apply_dtypes(df, fit, inplace=True)
+                self.timing_report_[name] = time.perf_counter() - started
+                if i in keys:
+                    key, stage_steps = keys[i]
+                    self.cache.store(
+                        key, df, {"steps": stage_steps, "dtypes": self.dtypes_}
+                    )
+                if self.track_memory:
+                    self._record_memory(name, df, traced_before)
+                if self.callbacks:
+                    cpu_s = time.process_time() - cpu_started
+                    records.append(self._step_record(name, df_in, df, cpu_s))
+                    for callback in self.callbacks:
+                        callback.on_step_end(name, df, records[-1])
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+        for callback in self.callbacks or []:
+            callback.on_run_end(records)
+        return df
+
+    def _fit_transform_in_parallel(
+        self, df: pd.DataFrame, input_key: str = None
+    ) -> pd.DataFrame:
+        """Fit and transform 'df' stage by stage, with every step running once on every row.
+
+        The dtypes of the raw columns are resolved over all rows. The steps of a stage only learn from the columns,
+        apart from the water distance step, whose reference points are the waterfront properties of the cleaned
+        rows. So every stage is fitted on its first input row and then transforms the partitions in parallel.
+        The stages found in the step cache are not run.
+        """
+        self.dtypes_ = self.resolve_dtypes([df])
+        self.memory_report_ = {}
+        self.timing_report_ = {}
+        self.cached_steps_ = []
+        stages = self._stages()
+        keys = [None] * len(stages)
+        n_cached = 0
+        if self.cache is not None:
+            keys = self.cache.stage_keys(
+                input_key or frame_key(df), self._cache_context(), stages
+            )
+            n_cached, df = self._load_cached_stages(keys, stages, df)
+        for key, (stage_name, stage_steps) in list(zip(keys, stages))[n_cached:]:
+            self._fit_stage(stage_steps, df)
+            df = self._stage(stage_name).preprocess_transform(df)
+            # The dtypes of the columns created by the stage are resolved over all partitions
+            df = self._apply_dtypes(df, fit=True, inplace=True)
+            if key is not None:
+                self.cache.store(
+                    key,
+                    df,
+                    {
+                        "steps": [step for _, step in stage_steps],
+                        "dtypes": self.dtypes_,
+                    },
+                )
+        return df
+
+    def _fit_stage(self, stage_steps: list, df: pd.DataFrame) -> None:
+        """Fit the steps of a stage to its input 'df' on the first row, see '_fit_transform_in_parallel'."""
+        water_distance = self.feature_engineering_pipeline.named_steps["water_distance"]
+        reference_points = water_distance.reference_points
+        if reference_points is None and any(
+            step is water_distance for _, step in stage_steps
+        ):
+            self.set_water_reference(waterfront_points(df))
+        try:
+            sample = df.iloc[:1].copy()
+            for _, step in stage_steps:
+                sample = step.fit_transform(sample)
+        finally:
+            self.set_water_reference(reference_points)
+
+    def _stages(self) -> list:
+        """The stages with the '<pipeline>__<step>' names of their steps."""
+        return [
+            (
+                stage_name,
+                [(f"{stage_name}__{name}", step) for name, step in stage.steps],
+            )
+            for stage_name, stage in self.preprocessor_pipe.steps
+        ]
+
+    def _stage(self, stage_name: str) -> "PreprocessingKingCountyData":
+        """Shallow copy of the preprocessor that only runs the stage 'stage_name', sharing its steps."""
+        stage = copy.copy(self)
+        stage.preprocessor_pipe = Pipeline(
+            [(stage_name, self.preprocessor_pipe.named_steps[stage_name])]
+        )
+        return stage
+
+    def _cache_context(self) -> str:
+        """Everything besides the input and the steps the cached outputs depend on: the dtype schema and the code of
+        schema_king_county.py, which casts the output of every step."""
+        return f"{value_key(self.dtypes)}|{code_version(apply_dtypes)}"
+
+    def _load_cached_stages(self, keys: list, stages: list, df: pd.DataFrame):
+        """Restore the fitted steps of the longest prefix of the stages found in the cache.
+
+        Returns:
+        ----------
+        n_cached : int
+            Number of stages served from the cache.
+        df : DataFrame
+            Cached output of the last of these stages, 'df' if no stage was found.
+        """
+        for last in reversed(range(len(keys))):
+            if keys[last] not in self.cache:
+                continue
+            states = [self.cache.load_state(key) for key in keys[: last + 1]]
+            if any(state is None for state in states):
+                continue
+            for (_, stage_steps), state in zip(stages, states):
+                for (name, step), cached_step in zip(stage_steps, state["steps"]):
+                    step.__dict__.update(cached_step.__dict__)
+                    self.cached_steps_.append(name)
+            self.dtypes_ = states[-1]["dtypes"]
+            return last + 1, self.cache.load_frame(keys[last])
+        return 0, df
+
+    def _step_record(
+        self, name: str, df_in: tuple, df: pd.DataFrame, cpu_s: float
+    ) -> dict:
+        """Record of a step for the instrumentation callbacks. 'df_in' holds the rows, columns and size of the input."""
+        rows_in, columns_in, frame_mb_in = df_in
+        stage, step = name.split("__", 1)
+        record = {
+            "name": name,
+            "stage": stage,
+            "step": step,
+            "wall_s": self.timing_report_[name],
+            "cpu_s": cpu_s,
+            "rows_in": rows_in,
+            "rows_out": len(df),
+            "columns_added": [
+                column for column in df.columns if column not in columns_in
+            ],
+            "columns_removed": [
+                column for column in columns_in if column not in df.columns
+            ],
+            "memory_delta_mb": memory_usage_mb(df) - frame_mb_in,
+        }
+        if self.track_memory:
+            record["peak_mb"] = self.memory_report_[name]["peak_mb"]
+        return record
+
+    def _apply_dtypes(self, df: pd.DataFrame, fit: bool, inplace: bool) -> pd.DataFrame:
+        """Store the columns in the dtypes of the schema. While fitting, the resolved dtypes (e.g. the categories
+        of 'zipcode') are kept, so new data is transformed to the same dtypes."""
+        if not self.dtypes_:
+            return df
+        df, resolved = apply_dtypes(df, self.dtypes_, inplace)
+        if fit:
+            self.dtypes_.update(resolved)
+        return df
+
+    @staticmethod
+    def _reset_peak() -> int:
+        tracemalloc.reset_peak()
+        traced, _ = tracemalloc.get_traced_memory()
+        return traced
+
+    def _record_memory(self, name: str, df: pd.DataFrame, traced_before: int) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        self.memory_report_[name] = {
+            "peak_mb": (peak - traced_before) / 2**20,
+            "frame_mb": memory_usage_mb(df),
+        }
+
+    def resolve_dtypes(self, chunks) -> dict:
+        """Resolve the dtype schema for data that is processed in chunks.
+
+        The schema of a single DataFrame depends on its values (e.g. the categories of 'zipcode' or integer columns
+        with missing values). Resolving it over all chunks gives dtypes every chunk can be stored in, so all
+        transformed chunks share the same dtypes.
+
+        Parameters:
+        ----------
+        chunks : iterable of DataFrame
+            Raw data in chunks.
+
+        Returns:
+        ----------
+        dtypes : dict
+            The declared dtype of every column, resolved for the raw columns of the chunks.
+        """
+        dtypes = declared_dtypes(self.dtypes) if self.dtypes else {}
+        for chunk in chunks:
+            dtypes.update(resolve_dtypes(chunk, dtypes))
+        return dtypes
+
+    def save(self, path: str, model=None) -> None:
+        """Save the fitted preprocessor and a model trained on its output to a versioned artifact (see artifact.py).
+
+        Parameters:
+        ----------
+        path : str
+            Directory of the artifact, replaced if it exists.
+        model : estimator, optional
+            Model stored with skops, by default the model loaded with the preprocessor ('model_').
+        """
+        save_artifact(path, self, self.model_ if model is None else model)
+
+    @classmethod
+    def load(
+        cls, path: str, mmap: bool = True, trusted: list = None
+    ) -> "PreprocessingKingCountyData":
+        """Load a fitted preprocessor from an artifact written by 'save'. It transforms new data without being
+        fitted again, the model saved with it is available as 'model_'.
+
+        Parameters:
+        ----------
+        path : str
+            Directory of the artifact.
+        mmap : bool
+            If True (default) the arrays of the fitted state are memory-mapped instead of read into memory.
+        trusted : list, optional
+            Types of the model besides the scikit-learn and numpy types that may be loaded (see skops.io.load).
+
+        Returns:
+        ----------
+        preprocessor : PreprocessingKingCountyData
+            The fitted preprocessor.
+        """
+        preprocessor = cls()
+        preprocessor.model_ = load_artifact(path, preprocessor, mmap, trusted)
+        return preprocessor
+
+    def filter_report(self) -> dict:
+        """Report how many rows each filter of the data cleaning pipeline removed during the last run.
+
+        Returns:
+        ----------
+        report : dict
+            Maps the name of every filtering step to a dict of its filter conditions and the number of rows each removed.
+        """
+        return {
+            name: step.rows_removed_
+            for _, stage in self.preprocessor_pipe.steps
+            for name, step in stage.steps
+            if hasattr(step, "rows_removed_")
+        }
+
+    def memory_report(self) -> dict:
+        """Report the memory used by each step during the last run. Requires 'track_memory=True'.
+
+        Returns:
+        ----------
+        report : dict
+            Maps '<pipeline>__<step>' to the peak memory allocated while the step ran ('peak_mb')
+            and the size of the resulting DataFrame ('frame_mb'), both in MiB. The entry 'dtypes' reports the
+            conversion of the input to the dtype schema and also contains the size of the input ('input_frame_mb').
+        """
+        return self.memory_report_
+
+    def timing_report(self) -> dict:
+        """Report the wall time of each step during the last run.
+
+        Returns:
+        ----------
+        report : dict
+            Maps 'dtypes' (the conversion of the input to the dtype schema) and '<pipeline>__<step>' to the
+            seconds the step took. Empty if the data was transformed in several processes.
+        """
+        return self.timing_report_
+
+    def water_reference_points(self, chunks) -> np.ndarray:
+        """Collect the waterfront reference points of data that is processed in chunks.
+
+        Every chunk is cleaned with the data cleaning pipeline and only the coordinates of its waterfront
+        properties are kept, so the memory needed does not depend on the number of chunks.
+
+        Parameters:
+        ----------
+        chunks : iterable of DataFrame
+            Raw data in chunks.
+
+        Returns:
+        ----------
+        points : ndarray
+            Array of shape (n, 2) with the long/lat pairs of all waterfront properties after data cleaning.
+        """
+        dtypes = declared_dtypes(self.dtypes) if self.dtypes else {}
+        points = [np.empty((0, 2))]
+        for chunk in chunks:
+            # The reference points have the precision of the coordinates in the dtype schema
+            chunk, _ = apply_dtypes(chunk, dtypes)
+            for _, step in self.data_cleaning_pipeline.steps:
+                chunk = step.transform(chunk)
+            points.append(waterfront_points(chunk))
+        return np.concatenate(points)
+
+    def set_water_reference(self, points) -> None:
+        """Fix the waterfront reference points (array of long/lat pairs) used by the water distance step.
+        The points take effect with the next fit. With 'None' the waterfront properties are learned from the fitted DataFrame again.
+        """
+        self.feature_engineering_pipeline.set_params(
+            water_distance__reference_points=points
+        )
@@ -1,48 +1,289 @@
-import os
+import argparse
+import logging
 import sys
+from functools import partial
 
-import pandas as pd
+from data_io import (
+    OUTPUT_FORMATS,
+    DataFrameWriter,
+    common_dtypes,
+    get_output_format,
+    iter_file_chunks,
+    load_file_to_dataframe,
+    save_dataframe,
+    update_common_dtypes,
+)
+from incremental import process_incrementally
+from instrumentation import JsonTraceCallback, LogCallback, ProfileCallback
 from preprocessing_king_county import PreprocessingKingCountyData
+from step_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_MB, StepCache, file_key
 
 PREPROCESSOR = PreprocessingKingCountyData()
 
+OUTPUT_NAME = "transformed_data"
+OUTPUT_PATH = OUTPUT_NAME + OUTPUT_FORMATS["csv"]
 
-def load_file_to_dataframe(file_path: str) -> pd.DataFrame:
-    """Load a file into a Pandas DataFrame.
 
-    This function reads the file located at the given file path and returns a Pandas DataFrame.
-    The file format is determined based on the file extension.
+def process_file_in_chunks(
+    file_path: str,
+    chunksize: int,
+    output_path: str = OUTPUT_PATH,
+    preprocessor: PreprocessingKingCountyData = PREPROCESSOR,
+    output_format: str = None,
+    columns: list = None,
+) -> tuple:
+    """Preprocess a file chunk by chunk and append the result to 'output_path', so the memory needed does not
+    depend on the size of the file.
+
+    The first passes over the file collect the state that depends on the whole file: the common dtypes of the
+    columns, the dtype schema of the preprocessor (e.g. all categories of 'zipcode') and the waterfront reference
+    points of the water distance step. The preprocessor is fitted with this state and the last pass transforms
+    every chunk, so the output is identical to preprocessing the whole file at once and all chunks are written
+    with the same dtypes. The parameters of the preprocessor are left unchanged, only its fitted state is replaced.
 
     Parameters:
     ----------
     file_path : str
-        Path to the file to be loaded.
+        Path to the CSV, JSON lines, Parquet, Feather or Arrow file to be preprocessed.
+    chunksize : int
+        Number of rows per chunk.
+    output_path : str
+        Path of the file the preprocessed data is written to.
+    preprocessor : PreprocessingKingCountyData
+        Preprocessor used to transform the chunks.
+    output_format : str, optional
+        Format of the output file, by default determined by the extension of 'output_path'.
+    columns : list, optional
+        Only these columns of the input file are read.
 
     Returns:
     ----------
-    df : DataFrame
-        Loaded DataFrame.
+    n_rows : int
+        Number of rows of the input file.
+    dtypes : dict
+        Common dtypes of the columns of the input file.
+    """
+    dtypes = {}
+    n_rows = 0
 
-    Raises:
+    def first_pass():
+        nonlocal n_rows
+        for chunk in iter_file_chunks(file_path, chunksize, columns=columns):
+            update_common_dtypes(dtypes, chunk)
+            n_rows += len(chunk)
+            yield chunk
+
+    schema = preprocessor.resolve_dtypes(first_pass())
+    # The schema and the reference points of this file are only set to fit the preprocessor, its parameters are
+    # restored afterwards, so they do not leak into the next file
+    dtypes_param = preprocessor.dtypes
+    water_distance = preprocessor.feature_engineering_pipeline.named_steps[
+        "water_distance"
+    ]
+    reference_param = water_distance.reference_points
+    try:
+        if preprocessor.dtypes:
+            preprocessor.dtypes = schema
+        preprocessor.set_water_reference(
+            preprocessor.water_reference_points(
+                iter_file_chunks(file_path, chunksize, dtypes, columns)
+            )
+        )
+        preprocessor.preprocess_fit(
+            next(iter_file_chunks(file_path, chunksize, dtypes, columns))
+        )
+    finally:
+        preprocessor.dtypes = dtypes_param
+        preprocessor.set_water_reference(reference_param)
+
+    with DataFrameWriter(output_path, output_format) as writer:
+        for chunk in iter_file_chunks(file_path, chunksize, dtypes, columns):
+            writer.write(preprocessor.preprocess_transform(chunk))
+    return n_rows, dtypes
+
+
+def transform_file_in_chunks(
+    file_path: str,
+    chunksize: int,
+    output_path: str,
+    preprocessor: PreprocessingKingCountyData,
+    output_format: str = None,
+    columns: list = None,
+) -> None:
+    """Transform a file chunk by chunk with a preprocessor that is already fitted (e.g. loaded from an artifact).
+    The first pass over the file determines the common dtypes of the columns, so all chunks have the same dtypes.
+
+    Parameters:
     ----------
-    ValueError:
-        If the file extension is not supported.
+    file_path : str
+        Path to the CSV, JSON lines, Parquet, Feather or Arrow file to be preprocessed.
+    chunksize : int
+        Number of rows per chunk.
+    output_path : str
+        Path of the file the preprocessed data is written to.
+    preprocessor : PreprocessingKingCountyData
+        Fitted preprocessor used to transform the chunks.
+    output_format : str, optional
+        Format of the output file, by default determined by the extension of 'output_path'.
+    columns : list, optional
+        Only these columns of the input file are read.
     """
-    _, file_extension = os.path.splitext(file_path)
-
-    if file_extension.lower() == ".csv":
-        df = pd.read_csv(file_path)
-    elif file_extension.lower() == ".xlsx":
-        df = pd.read_excel(file_path)
-    elif file_extension.lower() == ".json":
-        df = pd.read_json(file_path)
-    elif file_extension.lower() == ".pkl":
-        df = pd.read_pickle(file_path)
-    else:
-        print("Invalid file extension. Supported formats: CSV, XLSX, JSON, PKL.")
-        sys.exit(1)
+    dtypes = common_dtypes(iter_file_chunks(file_path, chunksize, columns=columns))
+    with DataFrameWriter(output_path, output_format) as writer:
+        for chunk in iter_file_chunks(file_path, chunksize, dtypes, columns):
+            writer.write(preprocessor.preprocess_transform(chunk))
+
+
+def print_memory_report(report: dict) -> None:
+    """Print the memory report of the preprocessor (see PreprocessingKingCountyData.memory_report)."""
+    if not report:
+        print(
+            "No memory report recorded (the data was transformed in several processes)."
+        )
+        return
+    if "dtypes" in report:
+        print(
+            f"DataFrame size: {report['dtypes']['input_frame_mb']:.2f} MiB as loaded, "
+            f"{report['dtypes']['frame_mb']:.2f} MiB in the dtype schema"
+        )
+    for name, step in report.items():
+        print(
+            f"{name}: peak {step['peak_mb']:.2f} MiB, DataFrame {step['frame_mb']:.2f} MiB"
+        )
+
+
+def run_in_chunks(file_path, output_path, output_format, columns, chunksize):
+    """Full run of the incremental mode in chunks (see incremental.process_incrementally)."""
+    return process_file_in_chunks(
+        file_path, chunksize, output_path, PREPROCESSOR, output_format, columns
+    )
+
 
-    return df
+def print_incremental_report(report: dict, output_path: str) -> None:
+    if report["mode"] == "full":
+        print(f"Processed the whole file again, because {report['reason']}.")
+    print(
+        f"{report['new_rows']} rows read, {report['rows_written']} rows written to {output_path}."
+    )
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    """Parse the command-line arguments of the data preprocessing script."""
+    parser = argparse.ArgumentParser(
+        description="Preprocess King County house data for modeling."
+    )
+    parser.add_argument("file_path", help="Path to the file to be preprocessed.")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="Stream the file in chunks of this many rows instead of loading it at once.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to transform the data (-1 uses all CPUs, default: 1).",
+    )
+    parser.add_argument(
+        "--output",
+        help=f"Path of the resulting file (default: {OUTPUT_NAME} with the extension of the output format).",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=list(OUTPUT_FORMATS),
+        help="Format of the resulting file (default: determined by the extension of --output, otherwise csv).",
+    )
+    parser.add_argument(
+        "--input-columns",
+        action="store_true",
+        help="Read only the columns the pipeline uses (skips e.g. id, date, sqft_living15 and sqft_lot15).",
+    )
+    parser.add_argument(
+        "--dtypes",
+        choices=["exact", "compact", "none"],
+        default="exact",
+        help="Dtype schema of the data: small integer columns with float64 prices, coordinates and distances "
+        "(exact, default), also float32 and category columns (compact) or the dtypes of the input file (none).",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Print the size of the data before and after the dtype conversion and the peak memory of every step.",
+    )
+    parser.add_argument(
+        "--log-steps",
+        action="store_true",
+        help="Log the wall and CPU time, rows, columns and memory of every step and the share of every step in the run.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write the records of every step to this JSON trace file (viewable in chrome://tracing or Perfetto).",
+    )
+    parser.add_argument(
+        "--profile-step",
+        help="Profile this step (e.g. water_distance) and print the profile.",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=ProfileCallback.PROFILERS,
+        default="cprofile",
+        help="Profiler used by --profile-step (default: cprofile).",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="Write the profile of --profile-step to this file (cProfile statistics or a pyinstrument HTML report).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only preprocess the rows appended to the file since the last run and append them to the output "
+        "(Parquet, Feather and Arrow outputs are directories with a part file per run). The whole file is processed again when the new rows change existing rows or the pipeline changed.",
+    )
+    parser.add_argument(
+        "--artifact",
+        help="Transform the file with the fitted preprocessor saved in this artifact directory instead of fitting it.",
+    )
+    parser.add_argument(
+        "--save-artifact",
+        help="Save the fitted preprocessor to this artifact directory (see artifact.py).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory of the step cache (default: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=float,
+        default=DEFAULT_MAX_SIZE_MB,
+        help=f"Size limit of the step cache in MiB, least recently used entries are removed (default: {DEFAULT_MAX_SIZE_MB}).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Run every step instead of serving unchanged stages from the step cache.",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all entries of the step cache before the run.",
+    )
+    return parser.parse_args(args)
+
+
+def build_callbacks(args: argparse.Namespace) -> list:
+    """Instrumentation callbacks selected by the command-line arguments."""
+    callbacks = []
+    if args.log_steps:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        callbacks.append(LogCallback())
+    if args.trace:
+        callbacks.append(JsonTraceCallback(args.trace))
+    if args.profile_step:
+        callbacks.append(
+            ProfileCallback(args.profile_step, args.profile_output, args.profiler)
+        )
+    return callbacks
 
 
 def main() -> None:
@@ -50,22 +291,88 @@ def main() -> None:
 
     This function is the entry point of the script. It expects the file path to be specified as a command-line argument.
     The file is loaded into a Pandas DataFrame, preprocessed using the predefined PREPROCESSOR, and the transformed DataFrame
-    is saved as a CSV file.
+    is saved as a CSV, Parquet, Feather or Arrow file. With '--chunksize' the file is streamed through the PREPROCESSOR in chunks instead.
+    The outputs of the stages are cached on disk, so a rerun on an unchanged file only runs the stages that changed
+    (the cache is not used in chunked mode). With '--artifact'
+    a preprocessor fitted before is loaded and the file is only transformed, '--save-artifact' saves the fitted preprocessor.
 
     Raises:
     ----------
     ValueError:
         If the file path is not provided as an argument.
     """
-    if len(sys.argv) < 2:
-        print("Please specify the file path as an argument.")
+    args = parse_args()
+    if args.incremental and (args.artifact or args.save_artifact):
+        print("--incremental cannot be combined with --artifact or --save-artifact.")
         sys.exit(1)
+    if args.artifact:
+        # The dtype schema is part of the fitted state of the artifact
+        preprocessor = PreprocessingKingCountyData.load(args.artifact)
+    else:
+        preprocessor = PREPROCESSOR
+        preprocessor.dtypes = None if args.dtypes == "none" else args.dtypes
+    preprocessor.n_jobs = args.jobs
+    preprocessor.track_memory = args.memory_report
+    preprocessor.callbacks = build_callbacks(args)
+    if args.clear_cache:
+        StepCache(args.cache_dir).clear()
+    preprocessor.cache = (
+        None if args.no_cache else StepCache(args.cache_dir, args.cache_size_mb)
+    )
+    output_format = args.output_format
+    output_path = args.output
+    if output_path is None:
+        output_format = output_format or "csv"
+        output_path = OUTPUT_NAME + OUTPUT_FORMATS[output_format]
+    output_format = get_output_format(output_path, output_format)
+    columns = preprocessor.INPUT_COLUMNS if args.input_columns else None
 
-    file_path = sys.argv[1]
-    df = load_file_to_dataframe(file_path)
+    if args.incremental:
+        report = process_incrementally(
+            args.file_path,
+            output_path,
+            preprocessor,
+            output_format,
+            columns,
+            full_run=partial(run_in_chunks, chunksize=args.chunksize)
+            if args.chunksize
+            else None,
+        )
+        print_incremental_report(report, output_path)
+    elif args.chunksize and args.artifact:
+        transform_file_in_chunks(
+            args.file_path,
+            args.chunksize,
+            output_path,
+            preprocessor,
+            output_format,
+            columns,
+        )
+    elif args.chunksize:
+        process_file_in_chunks(
+            args.file_path,
+            args.chunksize,
+            output_path,
+            output_format=output_format,
+            columns=columns,
+        )
+    else:
+        df = load_file_to_dataframe(args.file_path, columns)
 
-    transformed_df = PREPROCESSOR.preprocess_fit_transform(df)
-    transformed_df.to_csv("transformed_data.csv", index=False)
+        if args.artifact:
+            transformed_df = preprocessor.preprocess_transform(df)
+        else:
+            transformed_df = preprocessor.preprocess_fit_transform(
+                df, file_key(args.file_path, columns)
+            )
+        save_dataframe(transformed_df, output_path, output_format)
+    if args.save_artifact:
+        preprocessor.save(args.save_artifact)
+    if args.memory_report:
+        print_memory_report(preprocessor.memory_report())
+    for callback in preprocessor.callbacks:
+        if isinstance(callback, ProfileCallback) and callback.report:
+            print(callback.report)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+"""Row mode of the King County pipeline: the features of a single house without pandas.
+
+Online scoring transforms one house at a time, where building a DataFrame and running it through the eight
+transformers costs milliseconds. RowFeaturizer computes the same features from a dict (or a record of a NumPy
+structured array) with NumPy scalars in a few microseconds. It is built from a fitted PreprocessingKingCountyData
+and reproduces 'preprocess_transform' exactly: like in the pipeline, the values are stored in the dtypes of the
+fitted schema ('dtypes_') before and after every step, and NumPy scalars follow the same type promotion as the
+columns, so every intermediate result is rounded the same way. The water distance is answered by the fitted
+spatial index of the water distance step.
+"""
+import numpy as np
+import pandas as pd
+from custom_creator_king_county import (
+    CENTER_LAT,
+    CENTER_LONG,
+    CENTER_REF_LAT,
+    CenterDistanceCreator,
+    DropNoPredictionValues,
+    SqftPriceCreator,
+    WaterDistanceCreator,
+)
+from custom_transformer_king_county import (
+    BathBedRoomTransformer,
+    LastKnownChangeTransformer,
+    SqftBasementTransformer,
+    ViewWaterfrontTransformer,
+)
+from sklearn.utils.validation import check_is_fitted
+
+# The steps whose logic the row mode implements, in the order of the pipeline
+ROW_MODE_STEPS = (
+    BathBedRoomTransformer,
+    SqftBasementTransformer,
+    ViewWaterfrontTransformer,
+    LastKnownChangeTransformer,
+    SqftPriceCreator,
+    CenterDistanceCreator,
+    WaterDistanceCreator,
+    DropNoPredictionValues,
+)
+
+# A Python float like in CenterDistanceCreator, where pandas does not promote float32 columns multiplied with it
+CENTER_COS_LAT = float(np.cos(np.radians(CENTER_REF_LAT)))
+
+
+def _scalar_type(dtype):
+    """NumPy scalar type of the declared 'dtype', None for categories (and undeclared columns)."""
+    if dtype is None or isinstance(dtype, pd.CategoricalDtype) or dtype == "category":
+        return None
+    return np.dtype(dtype).type
+
+
+class RowFeaturizer:
+    """Computes the features of single houses exactly like 'preprocess_transform' of a fitted preprocessor.
+
+    Parameters:
+    ----------
+    preprocessor : PreprocessingKingCountyData
+        The fitted preprocessor. Its steps have to be the King County steps the row mode implements.
+
+    Attributes:
+    ----------
+    features : list
+        The features in the order of the columns of 'preprocess_transform'.
+    """
+
+    def __init__(self, preprocessor):
+        steps = [
+            step
+            for _, stage in preprocessor.preprocessor_pipe.steps
+            for _, step in stage.steps
+        ]
+        if tuple(type(step) for step in steps) != ROW_MODE_STEPS:
+            raise ValueError(
+                "The row mode only supports the steps of PreprocessingKingCountyData"
+            )
+        check_is_fitted(steps[-1])
+        self.features = list(steps[-1].features_)
+        self.index = steps[-2].index_
+        self._types = {
+            column: _scalar_type(dtype)
+            for column, dtype in preprocessor.dtypes_.items()
+        }
+
+    def _cast(self, column: str, value):
+        """Store 'value' in the dtype of 'column' like apply_dtypes. Missing values of integer columns become
+        float32, strings are kept and values of undeclared columns get the dtype pandas would infer.
+        """
+        if value is None:
+            value = np.nan
+        if isinstance(value, str):
+            return value
+        scalar_type = self._types.get(column)
+        if scalar_type is None:
+            if isinstance(value, (bool, str, np.generic)):
+                return value
+            if isinstance(value, int):
+                return np.int64(value)
+            return np.float64(value)
+        if issubclass(scalar_type, np.integer) and value != value:
+            return np.float32(value)
+        return scalar_type(value)
+
+    def transform(self, row) -> dict:
+        """Return the features of one house, None if the data cleaning removes it (bathroom/bedroom ratio).
+
+        Parameters:
+        ----------
+        row : dict or numpy.void
+            The raw columns of the house, e.g. a dict or a record of a structured array. 'price' and
+            'sqft_basement' may be missing, like 'view', 'waterfront' and 'yr_renovated', which are
+            treated as missing values then.
+
+        Returns:
+        ----------
+        features : dict or None
+            Maps every feature to its value (a NumPy scalar, the category value for 'zipcode').
+        """
+        names = row.keys() if isinstance(row, dict) else row.dtype.names
+        cast = self._cast
+        x = {name: cast(name, row[name]) for name in names}
+        for column in ("price", "view", "waterfront", "yr_renovated"):
+            if column not in x:
+                x[column] = cast(column, np.nan)
+
+        # BathBedRoomTransformer
+        bedrooms = x["bedrooms"]
+        if bedrooms == 0:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = x["bathrooms"] / bedrooms
+        else:
+            ratio = x["bathrooms"] / bedrooms
+        ratio = cast("bath_bed_ratio", ratio)
+        if ratio >= 2 or ratio <= 0.10:
+            return None
+        x["bath_bed_ratio"] = ratio
+        # SqftBasementTransformer
+        x["sqft_basement"] = cast(
+            "sqft_basement", np.float64(x["sqft_living"] - x["sqft_above"])
+        )
+        # ViewWaterfrontTransformer
+        for column in ("view", "waterfront"):
+            value = x[column]
+            x[column] = cast(column, 0) if value != value else value
+        # LastKnownChangeTransformer: np.where promotes both years to a common type first
+        yr_renovated = x.pop("yr_renovated")
+        yr_built = x.pop("yr_built")
+        year_type = np.result_type(yr_built, yr_renovated).type
+        not_renovated = yr_renovated != yr_renovated or yr_renovated == 0.0
+        year = year_type(yr_built if not_renovated else yr_renovated)
+        x["last_known_change"] = cast("last_known_change", np.int64(year))
+        # SqftPriceCreator
+        x["sqft_price"] = cast(
+            "sqft_price", np.round(x["price"] / (x["sqft_living"] + x["sqft_lot"]), 2)
+        )
+        # CenterDistanceCreator
+        delta_lat = np.absolute(CENTER_LAT - x["lat"])
+        delta_long = np.absolute(CENTER_LONG - x["long"]) * CENTER_COS_LAT
+        # Arrays square and take '** (1 / 2)' exactly rounded, scalar powers may differ in the last bit
+        center_distance = (
+            np.sqrt(delta_long * delta_long + delta_lat * delta_lat)
+            * 2
+            * np.pi
+            * 6378
+            / 360
+        )
+        x["center_distance"] = cast("center_distance", center_distance)
+        # WaterDistanceCreator
+        water_distance = self.index.query_point(float(x["long"]), float(x["lat"]))
+        x["water_distance"] = cast("water_distance", water_distance)
+        # DropNoPredictionValues
+        return {feature: x[feature] for feature in self.features}
+
+    def feature_matrix(self, rows, features: list = None):
+        """Transform many houses into a float64 matrix, e.g. as input of a model.
+
+        Parameters:
+        ----------
+        rows : iterable of dict or structured array
+            The raw columns of the houses.
+        features : list, optional
+            Columns of the matrix, by default all features.
+
+        Returns:
+        ----------
+        matrix : ndarray
+            Array of shape (n, len(features)), NaN in the rows of the houses the data cleaning removes.
+        kept : ndarray
+            Boolean mask of the houses that are not removed.
+        """
+        features = self.features if features is None else features
+        rows = list(rows)
+        matrix = np.full((len(rows), len(features)), np.nan)
+        kept = np.zeros(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            values = self.transform(row)
+            if values is not None:
+                matrix[i] = [values[feature] for feature in features]
+                kept[i] = True
+        return matrix, kept
@@ -0,0 +1,200 @@
+"""Nearest-reference-point engine used by the distance features of the King County pipeline.
+
+The distances follow the equirectangular formula of 'dist' in custom_creator_king_county.py: the longitude
+difference is corrected with the cosine of the reference latitude and the result is converted to km.
+"""
+
+import numpy as np
+
+try:
+    import scipy
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover - scipy is listed in requirements.txt
+    cKDTree = None
+
+# Conversion factor from degrees to km used throughout the notebook (earth radius of 6378 km)
+KM_PER_DEGREE = 2 * np.pi * 6378 / 360
+
+# Upper bound for the number of (row, reference) pairs evaluated at once by the brute-force path
+BRUTE_FORCE_BLOCK_SIZE = 2_000_000
+
+
+def equirectangular_distance(long, lat, ref_long, ref_lat):
+    """Vectorized version of 'dist'. Computes the distance in km between the locations (long, lat) and the
+    reference locations (ref_long, ref_lat). All inputs are broadcast against each other.
+    """
+    delta_long = long - ref_long
+    delta_lat = lat - ref_lat
+    delta_long_corr = delta_long * np.cos(np.radians(ref_lat))
+    return ((delta_long_corr) ** 2 + (delta_lat) ** 2) ** (1 / 2) * KM_PER_DEGREE
+
+
+class NearestReferenceIndex:
+    """Answers "distance to the nearest reference point" for many locations in one batched query.
+
+    The reference points are deduplicated, projected onto a plane (longitude scaled with the cosine of their
+    mean latitude) and stored in a KD-tree. For every query location the k nearest candidates of the tree are
+    re-scored with the exact equirectangular formula. Because the projection distorts distances by at most the
+    spread of the cosine over the reference latitudes, a candidate is only accepted if no point outside the k
+    candidates can be closer; the remaining rows are queried again with more candidates and finally answered by
+    the exact brute-force path. The result therefore equals the brute-force minimum over all reference points up
+    to floating point rounding (absolute error < 1e-9 km).
+
+    Parameters:
+    ----------
+    ref_long, ref_lat : array-like
+        Longitude and latitude of the reference points.
+    method : str
+        'kdtree', 'brute' or 'auto' (KD-tree when scipy is available, brute force otherwise).
+    k : int
+        Number of KD-tree candidates re-scored with the exact formula per query location.
+    """
+
+    def __init__(self, ref_long, ref_lat, method="auto", k=8):
+        self.ref_long = np.asarray(ref_long, dtype=float)
+        self.ref_lat = np.asarray(ref_lat, dtype=float)
+        if self.ref_long.shape != self.ref_lat.shape or self.ref_long.ndim != 1:
+            raise ValueError(
+                "'ref_long' and 'ref_lat' must be one-dimensional and of equal length"
+            )
+        if len(self.ref_long) == 0:
+            raise ValueError("The reference set is empty")
+        # Duplicated points do not change the nearest distance but would crowd out the candidates
+        self.ref_long, self.ref_lat = np.unique(
+            np.column_stack((self.ref_long, self.ref_lat)), axis=0
+        ).T
+        if method not in ("auto", "kdtree", "brute"):
+            raise ValueError("'method' must be one of 'auto', 'kdtree' or 'brute'")
+        if method == "kdtree" and cKDTree is None:
+            raise ImportError("method='kdtree' requires scipy")
+        if method == "auto":
+            method = "kdtree" if cKDTree is not None else "brute"
+        self.method = method
+        self.k = k
+        self._build_tree()
+
+    def _build_tree(self):
+        self.tree = None
+        if self.method == "kdtree":
+            ref_cos = np.cos(np.radians(self.ref_lat))
+            self._cos_lat0 = np.cos(np.radians(self.ref_lat.mean()))
+            # Lower bound of exact distance / projected distance over all reference points
+            self._distortion = min(1.0, ref_cos.min() / self._cos_lat0)
+            self.tree = cKDTree(self._project(self.ref_long, self.ref_lat))
+
+    def state(self) -> dict:
+        """Settings and arrays of the index, from which 'from_state' restores it without deduplicating the
+        reference points or building the KD-tree again. The KD-tree is described by the arrays of its pickled
+        state, which only the same scipy version can restore."""
+        state = {
+            "method": self.method,
+            "k": self.k,
+            "ref_long": self.ref_long,
+            "ref_lat": self.ref_lat,
+        }
+        if self.tree is not None:
+            state["tree"] = {
+                "scipy_version": scipy.__version__,
+                "cos_lat0": float(self._cos_lat0),
+                "distortion": float(self._distortion),
+                "state": list(self.tree.__getstate__()),
+            }
+        return state
+
+    @classmethod
+    def from_state(cls, state: dict) -> "NearestReferenceIndex":
+        """Restore an index from its 'state'. The arrays are used as they are, so memory-mapped arrays stay on disk.
+        The KD-tree is built again if it was stored by another scipy version."""
+        index = cls.__new__(cls)
+        index.method = state["method"]
+        index.k = state["k"]
+        index.ref_long = state["ref_long"]
+        index.ref_lat = state["ref_lat"]
+        tree = state.get("tree")
+        if index.method == "kdtree" and (
+            tree is None or tree["scipy_version"] != scipy.__version__
+        ):
+            index._build_tree()
+        elif index.method == "kdtree":
+            index._cos_lat0 = tree["cos_lat0"]
+            index._distortion = tree["distortion"]
+            index.tree = cKDTree.__new__(cKDTree)
+            index.tree.__setstate__(tuple(tree["state"]))
+        else:
+            index.tree = None
+        return index
+
+    def __len__(self):
+        return len(self.ref_long)
+
+    def _project(self, long, lat):
+        return np.column_stack((long * self._cos_lat0, lat))
+
+    def query(self, long, lat) -> np.ndarray:
+        """Return the distance in km from every location (long, lat) to its nearest reference point.
+        Locations with missing coordinates get NaN.
+        """
+        long = np.asarray(long, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        result = np.full(long.shape, np.nan)
+        valid = np.isfinite(long) & np.isfinite(lat)
+        if self.method == "brute":
+            result[valid] = self._query_brute(long[valid], lat[valid])
+        else:
+            result[valid] = self._query_kdtree(long[valid], lat[valid])
+        return result
+
+    def query_point(self, long: float, lat: float) -> float:
+        """Distance in km from the location (long, lat) to its nearest reference point, like 'query' for a
+        single location but without the overhead of the batch (NaN for missing coordinates).
+        """
+        if not (np.isfinite(long) and np.isfinite(lat)):
+            return np.nan
+        k = min(self.k, len(self))
+        while self.method == "kdtree" and k < len(self):
+            projected, candidates = self.tree.query((long * self._cos_lat0, lat), k=k)
+            projected, candidates = np.atleast_1d(projected, candidates)
+            result = equirectangular_distance(
+                long, lat, self.ref_long[candidates], self.ref_lat[candidates]
+            ).min()
+            if result <= self._distortion * projected[-1] * KM_PER_DEGREE:
+                return result
+            k = min(k * 4, len(self))
+        return equirectangular_distance(long, lat, self.ref_long, self.ref_lat).min()
+
+    def _query_brute(self, long, lat):
+        result = np.empty(len(long))
+        block = max(1, BRUTE_FORCE_BLOCK_SIZE // len(self))
+        for start in range(0, len(long), block):
+            stop = start + block
+            result[start:stop] = equirectangular_distance(
+                long[start:stop, None],
+                lat[start:stop, None],
+                self.ref_long,
+                self.ref_lat,
+            ).min(axis=1)
+        return result
+
+    def _query_kdtree(self, long, lat, k=None):
+        if len(long) == 0:
+            return np.empty(0)
+        k = min(k or self.k, len(self))
+        if k == len(self):
+            return self._query_brute(long, lat)
+        projected, candidates = self.tree.query(self._project(long, lat), k=k)
+        projected = projected.reshape(len(long), k)
+        candidates = candidates.reshape(len(long), k)
+        result = equirectangular_distance(
+            long[:, None],
+            lat[:, None],
+            self.ref_long[candidates],
+            self.ref_lat[candidates],
+        ).min(axis=1)
+        # Any reference point outside the candidates is at least this far away
+        unchecked = self._distortion * projected[:, -1] * KM_PER_DEGREE
+        uncertain = result > unchecked
+        if uncertain.any():
+            result[uncertain] = self._query_kdtree(
+                long[uncertain], lat[uncertain], k * 4
+            )
+        return result
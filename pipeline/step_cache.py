@@ -0,0 +1,218 @@
+"""Content-addressed on-disk cache of the outputs of the pipeline stages.
+
+The pipeline is cached at the boundaries of its stages (data cleaning and feature engineering): the outputs of the
+single steps are intermediate frames that are cheap to recompute compared to writing and reading them. The key of a
+stage combines the key of its input (the key of the previous stage, the first stage starts from the key of the input
+data) and the name, class and parameters of each of its steps and the version of their code (a hash of the source
+of their modules and of the modules they depend on). A changed step therefore changes the key of its stage and of
+all later stages, while the outputs of the unchanged stages before it are still found. Every entry holds the output
+DataFrame as uncompressed Arrow IPC file, which is read memory-mapped, and the fitted steps of the stage. When the
+cache grows beyond its size limit, the least recently used entries are removed.
+"""
+import hashlib
+import inspect
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Changing the layout of the entries invalidates all of them
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "king_county")
+DEFAULT_MAX_SIZE_MB = 2048
+
+_CODE_VERSIONS = {}
+
+
+def content_hash(*parts) -> str:
+    """SHA-256 of the string representations of 'parts'."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def value_key(value) -> str:
+    """Key of a parameter value. Arrays are hashed by their content, as their repr is truncated."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        value = value.to_numpy()
+    if isinstance(value, np.ndarray):
+        return content_hash(
+            value.dtype, value.shape, hashlib.sha256(value.tobytes()).hexdigest()
+        )
+    if isinstance(value, dict):
+        return content_hash(
+            *(f"{key}={value_key(item)}" for key, item in sorted(value.items()))
+        )
+    return repr(value)
+
+
+def code_version(obj) -> str:
+    """Hash of the source code of the module 'obj' or of the module that defines the function, class or
+    (for instances) the class of 'obj'. Objects whose results depend on the code of other modules list these
+    modules (or functions and classes of them) in 'cache_dependencies', whose code versions are included.
+    """
+    dependencies = getattr(obj, "cache_dependencies", ())
+    if not (inspect.ismodule(obj) or inspect.isfunction(obj) or inspect.isclass(obj)):
+        obj = type(obj)
+    module = inspect.getmodule(obj)
+    if module.__name__ not in _CODE_VERSIONS:
+        try:
+            source = inspect.getsource(module)
+        except (OSError, TypeError):
+            source = getattr(module, "__version__", module.__name__)
+        _CODE_VERSIONS[module.__name__] = content_hash(source)
+    if not dependencies:
+        return _CODE_VERSIONS[module.__name__]
+    return content_hash(
+        _CODE_VERSIONS[module.__name__],
+        *(code_version(dependency) for dependency in dependencies),
+    )
+
+
+def frame_key(df: pd.DataFrame) -> str:
+    """Key of the content of a DataFrame: its columns, dtypes, index and values."""
+    values = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return content_hash(
+        list(df.columns),
+        list(df.dtypes.astype(str)),
+        hashlib.sha256(values).hexdigest(),
+    )
+
+
+def file_key(file_path: str, columns: list = None) -> str:
+    """Key of the data of a file that is cheaper to compute than its content: path, modification time and size."""
+    stat = os.stat(file_path)
+    return content_hash(
+        os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, columns
+    )
+
+
+class StepCache:
+    """On-disk cache of the outputs and fitted steps of the pipeline stages.
+
+    Parameters:
+    ----------
+    directory : str
+        Directory of the cache entries, created if it does not exist.
+    max_size_mb : float
+        Size limit of the cache in MiB. The least recently used entries are removed when it is exceeded.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+    ):
+        self.directory = directory
+        self.max_size_mb = max_size_mb
+
+    def stage_keys(self, input_key: str, context: str, stages: list) -> list:
+        """Chain the keys of the stages: every key depends on the key of the input and all steps up to the end of
+        the stage.
+
+        Parameters:
+        ----------
+        input_key : str
+            Key of the input data (see frame_key and file_key).
+        context : str
+            Everything else the outputs depend on (e.g. the dtype schema).
+        stages : list of (name, steps)
+            The stages in the order they are run, each with its list of (name, step).
+        """
+        key = content_hash(CACHE_VERSION, input_key, context)
+        keys = []
+        for stage_name, steps in stages:
+            parts = [key, stage_name]
+            for name, step in steps:
+                parts += [
+                    name,
+                    type(step).__qualname__,
+                    value_key(step.get_params(deep=False)),
+                    code_version(step),
+                ]
+            key = content_hash(*parts)
+            keys.append(key)
+        return keys
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + ".arrow", base + ".pkl"
+
+    def __contains__(self, key: str) -> bool:
+        return all(os.path.exists(path) for path in self._paths(key))
+
+    def load_frame(self, key: str) -> pd.DataFrame:
+        """Return the DataFrame stored under 'key' and mark the entry as recently used."""
+        from pyarrow import feather
+
+        frame_path, _ = self._paths(key)
+        df = feather.read_table(frame_path, memory_map=True).to_pandas()
+        os.utime(frame_path)
+        return df
+
+    def load_state(self, key: str):
+        """Return the state stored under 'key' (None if there is none) and mark the entry as recently used."""
+        _, state_path = self._paths(key)
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, "rb") as file:
+            state = pickle.load(file)
+        os.utime(state_path)
+        return state
+
+    def store(self, key: str, df: pd.DataFrame, state) -> None:
+        """Store a DataFrame and a picklable state under 'key' and evict old entries if the cache is too large."""
+        import pyarrow as pa
+
+        os.makedirs(self.directory, exist_ok=True)
+        frame_path, state_path = self._paths(key)
+        # Written to temporary files first, so an interrupted run never leaves a broken entry
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        with pa.OSFile(frame_path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        with open(state_path + ".tmp", "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(frame_path + ".tmp", frame_path)
+        os.replace(state_path + ".tmp", state_path)
+        self.evict()
+
+    def _entries(self) -> dict:
+        """Size in bytes and time of the last use of every entry."""
+        entries = {}
+        if not os.path.isdir(self.directory):
+            return entries
+        for file_name in os.listdir(self.directory):
+            key, extension = os.path.splitext(file_name)
+            if extension not in (".arrow", ".pkl"):
+                continue
+            stat = os.stat(os.path.join(self.directory, file_name))
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        return entries
+
+    def size_mb(self) -> float:
+        return sum(size for size, _ in self._entries().values()) / 2**20
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits into 'max_size_mb'."""
+        entries = self._entries()
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+            if total <= self.max_size_mb * 2**20:
+                break
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all entries (other files in the directory are kept)."""
+        for key in self._entries():
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
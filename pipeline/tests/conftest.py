@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+PIPELINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(
+    PIPELINE_DIR, "..", "data", "King_County_House_prices_dataset.csv"
+)
+
+# The pipeline modules import each other as top-level modules
+sys.path.insert(0, PIPELINE_DIR)
+
+
+@pytest.fixture(scope="session")
+def raw_data_session():
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture
+def raw_data(raw_data_session):
+    return raw_data_session.copy()
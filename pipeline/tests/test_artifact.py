@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from artifact import MANIFEST_NAME
+from preprocessing_king_county import PreprocessingKingCountyData
+from sklearn.linear_model import LinearRegression
+
+
+def test_loaded_artifact_transforms_like_the_fitted_preprocessor(raw_data, tmp_path):
+    preprocessor = PreprocessingKingCountyData()
+    transformed = preprocessor.preprocess_fit_transform(raw_data)
+    features = ["bedrooms", "grade", "water_distance"]
+    model = LinearRegression().fit(transformed[features], transformed["price"])
+    preprocessor.save(str(tmp_path / "artifact"), model)
+
+    loaded = PreprocessingKingCountyData.load(str(tmp_path / "artifact"))
+
+    water_step = loaded.feature_engineering_pipeline.named_steps["water_distance"]
+    assert isinstance(water_step.reference_points_, np.memmap)
+    assert isinstance(water_step.index_.tree.data, np.memmap)
+    new_rows = raw_data.sample(500, random_state=0)
+    result = loaded.preprocess_transform(new_rows)
+    pd.testing.assert_frame_equal(result, preprocessor.preprocess_transform(new_rows))
+    np.testing.assert_array_equal(
+        loaded.model_.predict(result[features]), model.predict(result[features])
+    )
+
+
+def test_artifact_of_another_pipeline_version_is_rejected(raw_data, tmp_path):
+    path = tmp_path / "artifact"
+    PreprocessingKingCountyData().preprocess_fit(raw_data).save(str(path))
+    manifest = json.loads((path / MANIFEST_NAME).read_text())
+    manifest["pipeline"] = "0" * 64
+    (path / MANIFEST_NAME).write_text(json.dumps(manifest))
+
+    with pytest.raises(ValueError, match="another version of the pipeline"):
+        PreprocessingKingCountyData.load(str(path))
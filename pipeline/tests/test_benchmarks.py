@@ -0,0 +1,29 @@
+import pandas as pd
+from benchmarks.run_benchmarks import compare_to_baseline, run_benchmarks
+from benchmarks.synthetic import make_king_county_data
+
+
+def test_synthetic_data_is_shaped_like_king_county(raw_data):
+    df = make_king_county_data(20_000, seed=1)
+
+    pd.testing.assert_series_equal(df.dtypes, raw_data.dtypes)
+    assert df["waterfront"].isna().mean() > 0.05
+    assert 0.003 < (df["waterfront"] == 1).mean() < 0.012
+    assert df["lat"].between(raw_data.lat.min(), raw_data.lat.max()).all()
+    assert df["long"].between(raw_data.long.min(), raw_data.long.max()).all()
+    pd.testing.assert_frame_equal(df, make_king_county_data(20_000, seed=1))
+
+
+def test_benchmark_times_every_step_and_flags_regressions():
+    results = run_benchmarks(["10k"], formats=["parquet"])
+
+    timings = results["results"]["10k"]["timings"]
+    assert "data_cleaning__bathroom_bedroom_ratio" in timings
+    assert "feature_engineering__water_distance" in timings
+    assert {"generate", "total", "write_parquet", "read_parquet"} <= set(timings)
+    assert compare_to_baseline(results, results) == []
+
+    slower = {"results": {"10k": {"timings": dict(timings)}}}
+    slower["results"]["10k"]["timings"]["total"] += 1
+    regressions = compare_to_baseline(slower, results)
+    assert [regression["timing"] for regression in regressions] == ["total"]
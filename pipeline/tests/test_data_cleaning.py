@@ -0,0 +1,41 @@
+import numpy as np
+from custom_transformer_king_county import (
+    BathBedRoomTransformer,
+    LastKnownChangeTransformer,
+)
+from preprocessing_king_county import PreprocessingKingCountyData
+
+
+def test_bath_bed_filter_is_index_independent(raw_data):
+    expected = BathBedRoomTransformer().fit_transform(raw_data.copy())
+
+    shuffled = raw_data.sample(frac=1, random_state=0)
+    shuffled.index = np.arange(len(shuffled))[::-1] * 7
+    result = BathBedRoomTransformer().fit_transform(shuffled)
+
+    assert sorted(result["id"]) == sorted(expected["id"])
+    ratio = result["bath_bed_ratio"]
+    assert ((ratio < 2) & (ratio > 0.10) | ratio.isna()).all()
+
+
+def test_last_known_change(raw_data):
+    result = LastKnownChangeTransformer().fit_transform(raw_data.copy())
+
+    renovated = raw_data["yr_renovated"].fillna(0) > 0
+    assert (
+        result.loc[renovated, "last_known_change"]
+        == raw_data.loc[renovated, "yr_renovated"]
+    ).all()
+    assert (
+        result.loc[~renovated, "last_known_change"]
+        == raw_data.loc[~renovated, "yr_built"]
+    ).all()
+    assert "yr_renovated" not in result and "yr_built" not in result
+
+
+def test_filter_report(raw_data):
+    preprocessor = PreprocessingKingCountyData()
+    result = preprocessor.preprocess_fit_transform(raw_data)
+
+    report = preprocessor.filter_report()["bathroom_bedroom_ratio"]
+    assert sum(report.values()) == len(raw_data) - len(result)
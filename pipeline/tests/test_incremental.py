@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from data_io import load_file_to_dataframe
+from incremental import process_incrementally, read_watermark
+from preprocessing_king_county import PreprocessingKingCountyData
+
+
+def full_output(raw_rows, tmp_path):
+    expected = PreprocessingKingCountyData().preprocess_fit_transform(raw_rows)
+    path = tmp_path / "expected.csv"
+    expected.to_csv(path, index=False)
+    return path.read_text()
+
+
+def test_appended_rows_are_transformed_incrementally(raw_data, tmp_path):
+    history = raw_data.iloc[:5000]
+    appended = raw_data.iloc[5000:5200].query("waterfront != 1")
+    source, output = tmp_path / "houses.csv", str(tmp_path / "transformed.csv")
+    history.to_csv(source, index=False)
+
+    report = process_incrementally(str(source), output, PreprocessingKingCountyData())
+    assert report["mode"] == "full" and report["new_rows"] == 5000
+
+    appended.to_csv(source, mode="a", header=False, index=False)
+    report = process_incrementally(str(source), output, PreprocessingKingCountyData())
+
+    assert report["mode"] == "incremental"
+    assert report["new_rows"] == len(appended)
+    assert read_watermark(output)["rows"] == 5000 + len(appended)
+    combined = pd.concat([history, appended], ignore_index=True)
+    assert (tmp_path / "transformed.csv").read_text() == full_output(combined, tmp_path)
+
+
+def test_full_recompute_when_global_state_changes(raw_data, tmp_path):
+    source, output = tmp_path / "houses.csv", str(tmp_path / "transformed.csv")
+    raw_data.iloc[:5000].to_csv(source, index=False)
+    process_incrementally(str(source), output, PreprocessingKingCountyData())
+
+    # A new waterfront house right next to existing houses changes their water distance
+    new_house = raw_data.iloc[[5000]].assign(waterfront=1.0, lat=47.5112, long=-122.256)
+    new_house.to_csv(source, mode="a", header=False, index=False)
+    report = process_incrementally(str(source), output, PreprocessingKingCountyData())
+
+    assert report["mode"] == "full"
+    assert "waterfront" in report["reason"]
+    combined = pd.concat([raw_data.iloc[:5000], new_house], ignore_index=True)
+    assert (tmp_path / "transformed.csv").read_text() == full_output(combined, tmp_path)
+
+    # Rewriting rows that were already processed is detected as well
+    raw_data.iloc[1:5002].to_csv(source, index=False)
+    report = process_incrementally(str(source), output, PreprocessingKingCountyData())
+    assert report["mode"] == "full"
+    assert report["reason"] == "the rows already processed changed"
+
+
+@pytest.mark.parametrize("output_name", ["transformed.parquet", "transformed.arrow"])
+def test_columnar_output_gets_a_part_per_run(raw_data, tmp_path, output_name):
+    history = raw_data.iloc[:5000]
+    appended = raw_data.iloc[5000:5200].query("waterfront != 1")
+    source, output = tmp_path / "houses.csv", tmp_path / output_name
+    history.to_csv(source, index=False)
+    process_incrementally(str(source), str(output), PreprocessingKingCountyData())
+    first_part = sorted(output.iterdir())[0]
+    first_part_stat = first_part.stat()
+
+    appended.to_csv(source, mode="a", header=False, index=False)
+    report = process_incrementally(
+        str(source), str(output), PreprocessingKingCountyData()
+    )
+
+    assert report["mode"] == "incremental"
+    assert len(list(output.iterdir())) == 2
+    assert first_part.stat().st_mtime_ns == first_part_stat.st_mtime_ns
+    preprocessor = PreprocessingKingCountyData()
+    combined = pd.concat([history, appended], ignore_index=True)
+    expected = preprocessor.preprocess_fit_transform(combined)
+    pd.testing.assert_frame_equal(
+        load_file_to_dataframe(str(output)), expected.reset_index(drop=True)
+    )
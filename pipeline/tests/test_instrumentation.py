@@ -0,0 +1,61 @@
+import json
+import logging
+
+from instrumentation import (
+    JsonTraceCallback,
+    LogCallback,
+    ProfileCallback,
+    StepCallback,
+)
+from preprocessing_king_county import PreprocessingKingCountyData
+
+
+class RecordingCallback(StepCallback):
+    def __init__(self):
+        self.started = []
+        self.records = []
+
+    def on_step_start(self, name, df):
+        self.started.append(name)
+
+    def on_step_end(self, name, df, record):
+        self.records.append(record)
+
+
+def test_callbacks_receive_a_record_of_every_step(raw_data):
+    callback = RecordingCallback()
+    preprocessor = PreprocessingKingCountyData(callbacks=[callback])
+    preprocessor.preprocess_fit_transform(raw_data)
+
+    records = {record["name"]: record for record in callback.records}
+    assert callback.started == list(records) == list(preprocessor.timing_report())[1:]
+    ratio = records["data_cleaning__bathroom_bedroom_ratio"]
+    assert ratio["rows_in"] - ratio["rows_out"] == sum(
+        preprocessor.filter_report()["bathroom_bedroom_ratio"].values()
+    )
+    assert ratio["columns_added"] == ["bath_bed_ratio"]
+    change = records["data_cleaning__last_known_change"]
+    assert change["columns_removed"] == ["yr_built", "yr_renovated"]
+    assert all(
+        record["wall_s"] >= 0 and record["cpu_s"] >= 0 for record in records.values()
+    )
+
+
+def test_log_trace_and_profile_sinks(raw_data, tmp_path, caplog):
+    trace_path = tmp_path / "trace.json"
+    profile = ProfileCallback("water_distance", str(tmp_path / "water.prof"))
+    preprocessor = PreprocessingKingCountyData(
+        callbacks=[LogCallback(), JsonTraceCallback(str(trace_path)), profile]
+    )
+    with caplog.at_level(logging.INFO, logger="preprocessing_king_county"):
+        preprocessor.preprocess_fit_transform(raw_data)
+
+    assert "water_distance" in caplog.messages[-1]
+    assert "(-13)" in caplog.messages[0]
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [event["name"] for event in events][-2:] == [
+        "water_distance",
+        "no_pred_values",
+    ]
+    assert "spatial_index" in profile.report
+    assert (tmp_path / "water.prof").exists()
@@ -0,0 +1,124 @@
+import pandas as pd
+import parallel
+import pytest
+from custom_transformer_king_county import BathBedRoomTransformer
+from preprocessing_king_county import PreprocessingKingCountyData
+from sklearn.exceptions import NotFittedError
+
+
+@pytest.mark.parametrize("copy", ["once", "per_step"])
+def test_copy_modes_keep_input_untouched(raw_data, copy):
+    original = raw_data.copy()
+
+    PreprocessingKingCountyData(copy=copy).preprocess_fit_transform(raw_data)
+
+    pd.testing.assert_frame_equal(raw_data, original)
+
+
+def test_copy_modes_give_same_result(raw_data):
+    expected = PreprocessingKingCountyData(copy="once").preprocess_fit_transform(
+        raw_data
+    )
+    result = PreprocessingKingCountyData(copy="none").preprocess_fit_transform(raw_data)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_memory_report(raw_data):
+    preprocessor = PreprocessingKingCountyData(track_memory=True)
+    preprocessor.preprocess_fit_transform(raw_data)
+
+    report = preprocessor.memory_report()
+    assert list(report) == ["dtypes"] + [
+        f"{stage}__{name}"
+        for stage, pipe in preprocessor.preprocessor_pipe.steps
+        for name, _ in pipe.steps
+    ]
+    assert all(
+        step["peak_mb"] >= 0 and step["frame_mb"] > 0 for step in report.values()
+    )
+
+
+def test_invalid_copy_mode():
+    with pytest.raises(ValueError):
+        PreprocessingKingCountyData(copy="always")
+
+
+def test_fitted_preprocessor_transforms_new_rows_like_training_data(raw_data):
+    preprocessor = PreprocessingKingCountyData()
+    expected = preprocessor.preprocess_fit_transform(raw_data)
+
+    new_rows = raw_data.loc[expected.index].sample(25, random_state=1)
+    result = preprocessor.preprocess_transform(new_rows)
+    pd.testing.assert_frame_equal(result, expected.loc[new_rows.index])
+
+    single_row = preprocessor.preprocess_transform(new_rows.iloc[[0]])
+    pd.testing.assert_frame_equal(single_row, expected.loc[new_rows.index[:1]])
+
+
+def test_transform_requires_fit(raw_data):
+    with pytest.raises(NotFittedError):
+        PreprocessingKingCountyData().preprocess_transform(raw_data)
+
+
+def test_parallel_transform_matches_serial(raw_data, monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_ROWS_PER_JOB", 2000)
+    shuffled = raw_data.sample(frac=1, random_state=0)
+    serial = PreprocessingKingCountyData()
+    expected = serial.preprocess_fit_transform(shuffled)
+
+    preprocessor = PreprocessingKingCountyData(n_jobs=3)
+    result = preprocessor.preprocess_fit_transform(shuffled)
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert preprocessor.filter_report() == serial.filter_report()
+    assert preprocessor.dtypes_ == serial.dtypes_
+    new_rows = shuffled.loc[expected.index[:50]]
+    pd.testing.assert_frame_equal(
+        preprocessor.preprocess_transform(new_rows),
+        serial.preprocess_transform(new_rows),
+    )
+
+
+def test_parallel_fit_transform_cleans_every_row_once(raw_data, monkeypatch, tmp_path):
+    monkeypatch.setattr(parallel, "MIN_ROWS_PER_JOB", 2000)
+    # The rows every call of the first cleaning step sees, written to a file by the worker processes
+    rows_log = tmp_path / "rows.log"
+    transform = BathBedRoomTransformer.transform
+
+    def logged_transform(self, X, y=None):
+        with open(rows_log, "a") as file:
+            file.write(f"{len(X)}\n")
+        return transform(self, X, y)
+
+    monkeypatch.setattr(BathBedRoomTransformer, "transform", logged_transform)
+
+    PreprocessingKingCountyData(n_jobs=3).preprocess_fit_transform(raw_data)
+
+    rows = [int(line) for line in rows_log.read_text().split()]
+    # Apart from the first row the steps are fitted on, every row is cleaned once
+    assert sum(n for n in rows if n > 1) == len(raw_data)
+
+
+def test_compact_dtypes_shrink_the_data(raw_data):
+    preprocessor = PreprocessingKingCountyData(track_memory=True, dtypes="compact")
+    result = preprocessor.preprocess_fit_transform(raw_data)
+
+    conversion = preprocessor.memory_report()["dtypes"]
+    assert conversion["frame_mb"] < conversion["input_frame_mb"] / 1.5
+    assert result["zipcode"].dtype == "category"
+    assert result["price"].dtype == "float32"
+    assert result["water_distance"].dtype == "float32"
+
+
+def test_exact_dtypes_are_the_default_and_keep_the_values(raw_data):
+    result = PreprocessingKingCountyData().preprocess_fit_transform(raw_data)
+    unconverted = PreprocessingKingCountyData(dtypes=None).preprocess_fit_transform(
+        raw_data
+    )
+
+    for column in ["price", "lat", "long", "water_distance"]:
+        assert result[column].dtype == "float64"
+        pd.testing.assert_series_equal(result[column], unconverted[column])
+    assert result["zipcode"].dtype == "int32"
+    assert (result["zipcode"] == unconverted["zipcode"]).all()
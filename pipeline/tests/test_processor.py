@@ -0,0 +1,80 @@
+import sys
+
+import pandas as pd
+import processor
+import pytest
+from data_io import load_file_to_dataframe, save_dataframe
+from preprocessing_king_county import PreprocessingKingCountyData
+from processor import process_file_in_chunks
+
+
+@pytest.mark.parametrize(
+    "input_name, output_name",
+    [
+        ("houses.csv", "transformed.csv"),
+        ("houses.parquet", "transformed.parquet"),
+        ("houses.arrow", "transformed.feather"),
+    ],
+)
+def test_chunked_output_matches_whole_file(raw_data, tmp_path, input_name, output_name):
+    input_path = str(tmp_path / input_name)
+    save_dataframe(raw_data.head(5000), input_path)
+    expected = PreprocessingKingCountyData().preprocess_fit_transform(
+        load_file_to_dataframe(input_path)
+    )
+
+    output_path = str(tmp_path / output_name)
+    preprocessor = PreprocessingKingCountyData()
+    process_file_in_chunks(input_path, 701, output_path, preprocessor)
+
+    pd.testing.assert_frame_equal(
+        load_file_to_dataframe(output_path, dtypes=preprocessor.dtypes_),
+        expected.reset_index(drop=True),
+    )
+
+
+def test_chunked_run_keeps_the_parameters_of_the_preprocessor(raw_data, tmp_path):
+    first_path = str(tmp_path / "first.csv")
+    second_path = str(tmp_path / "second.csv")
+    save_dataframe(raw_data.head(2000), first_path)
+    save_dataframe(raw_data.tail(2000), second_path)
+    expected = PreprocessingKingCountyData().preprocess_fit_transform(
+        load_file_to_dataframe(second_path)
+    )
+
+    preprocessor = PreprocessingKingCountyData()
+    process_file_in_chunks(first_path, 701, str(tmp_path / "out.csv"), preprocessor)
+
+    assert preprocessor.dtypes == "exact"
+    water_distance = preprocessor.feature_engineering_pipeline["water_distance"]
+    assert water_distance.reference_points is None
+    pd.testing.assert_frame_equal(
+        preprocessor.preprocess_fit_transform(load_file_to_dataframe(second_path)),
+        expected,
+    )
+
+
+def test_column_projection(raw_data, tmp_path):
+    input_path = str(tmp_path / "houses.parquet")
+    save_dataframe(raw_data.head(100), input_path)
+
+    df = load_file_to_dataframe(input_path, PreprocessingKingCountyData.INPUT_COLUMNS)
+
+    assert list(df.columns) == PreprocessingKingCountyData.INPUT_COLUMNS
+    PreprocessingKingCountyData().preprocess_fit_transform(df)
+
+
+def test_chunked_run_of_a_json_document(raw_data, tmp_path, monkeypatch):
+    input_path = str(tmp_path / "houses.json")
+    raw_data.head(2000).to_json(input_path, orient="records")
+    expected = PreprocessingKingCountyData().preprocess_fit_transform(
+        load_file_to_dataframe(input_path)
+    )
+
+    output_path = str(tmp_path / "transformed.parquet")
+    argv = ["processor.py", input_path, "--chunksize", "701", "--output", output_path]
+    monkeypatch.setattr(sys, "argv", argv + ["--no-cache"])
+    processor.main()
+
+    transformed = load_file_to_dataframe(output_path)
+    pd.testing.assert_frame_equal(transformed, expected.reset_index(drop=True))
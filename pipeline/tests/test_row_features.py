@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from preprocessing_king_county import PreprocessingKingCountyData
+from row_features import RowFeaturizer
+
+
+@pytest.mark.parametrize("dtypes", ["compact", "exact", None])
+def test_row_mode_matches_preprocess_transform(raw_data, dtypes):
+    preprocessor = PreprocessingKingCountyData(dtypes=dtypes).preprocess_fit(raw_data)
+    expected = preprocessor.preprocess_transform(raw_data)
+    featurizer = RowFeaturizer(preprocessor)
+
+    rows = {}
+    for i, row in enumerate(raw_data.to_dict("records")):
+        features = featurizer.transform(row)
+        if features is not None:
+            rows[i] = features
+    result = pd.DataFrame.from_dict(rows, orient="index")
+
+    assert featurizer.features == list(expected.columns)
+    assert list(result.index) == list(expected.index)
+    for column in expected.columns:
+        # Exactly equal, not only close: the row mode rounds like the pipeline
+        np.testing.assert_array_equal(
+            result[column].to_numpy(dtype=float),
+            expected[column].to_numpy(dtype=float),
+            err_msg=column,
+        )
+
+
+def test_row_mode_accepts_records_of_structured_arrays(raw_data):
+    preprocessor = PreprocessingKingCountyData().preprocess_fit(raw_data)
+    houses = raw_data.drop(columns=["date", "sqft_basement"]).head(50)
+    records = houses.to_records(index=False)
+    featurizer = RowFeaturizer(preprocessor)
+
+    matrix, kept = featurizer.feature_matrix(records)
+    expected = preprocessor.preprocess_transform(
+        houses.assign(sqft_basement=np.nan, date=raw_data["date"].head(50))
+    )
+
+    np.testing.assert_array_equal(kept, np.isin(np.arange(50), expected.index))
+    np.testing.assert_array_equal(
+        matrix[kept], expected[featurizer.features].to_numpy(dtype=float)
+    )
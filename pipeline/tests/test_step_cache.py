@@ -0,0 +1,95 @@
+import pandas as pd
+import parallel
+import spatial_index
+import step_cache
+from custom_creator_king_county import SqftPriceCreator, WaterDistanceCreator
+from preprocessing_king_county import PreprocessingKingCountyData
+from step_cache import StepCache, code_version
+
+
+def step_names(preprocessor):
+    return [
+        f"{stage}__{name}"
+        for stage, pipe in preprocessor.preprocessor_pipe.steps
+        for name, _ in pipe.steps
+    ]
+
+
+def test_cached_run_restores_outputs_and_fitted_steps(raw_data, tmp_path):
+    cache = StepCache(str(tmp_path))
+    first = PreprocessingKingCountyData(cache=cache)
+    expected = first.preprocess_fit_transform(raw_data)
+    assert first.cached_steps_ == []
+
+    second = PreprocessingKingCountyData(cache=cache)
+    result = second.preprocess_fit_transform(raw_data)
+
+    assert second.cached_steps_ == step_names(second)
+    pd.testing.assert_frame_equal(result, expected)
+    assert second.filter_report() == first.filter_report()
+    new_rows = raw_data.loc[expected.index[:50]]
+    pd.testing.assert_frame_equal(
+        second.preprocess_transform(new_rows), first.preprocess_transform(new_rows)
+    )
+
+
+def test_changed_step_reruns_only_the_steps_from_the_change(raw_data, tmp_path):
+    cache = StepCache(str(tmp_path))
+    PreprocessingKingCountyData(cache=cache).preprocess_fit_transform(raw_data)
+
+    preprocessor = PreprocessingKingCountyData(cache=cache)
+    preprocessor.set_water_reference([[-122.4, 47.6]])
+    result = preprocessor.preprocess_fit_transform(raw_data)
+
+    names = step_names(preprocessor)
+    features = names.index("feature_engineering__sqft_price")
+    assert preprocessor.cached_steps_ == names[:features]
+    assert list(preprocessor.timing_report())[1:] == names[features:]
+    expected = PreprocessingKingCountyData()
+    expected.set_water_reference([[-122.4, 47.6]])
+    pd.testing.assert_frame_equal(result, expected.preprocess_fit_transform(raw_data))
+
+
+def test_cache_evicts_least_recently_used_entries(raw_data, tmp_path):
+    cache = StepCache(str(tmp_path), max_size_mb=4)
+    PreprocessingKingCountyData(cache=cache).preprocess_fit_transform(raw_data)
+
+    assert 0 < cache.size_mb() <= 4
+    cache.clear()
+    assert cache.size_mb() == 0
+
+
+def test_cache_stores_one_entry_per_stage(raw_data, tmp_path):
+    cache = StepCache(str(tmp_path))
+    preprocessor = PreprocessingKingCountyData(cache=cache)
+    preprocessor.preprocess_fit_transform(raw_data)
+
+    assert len(list(tmp_path.glob("*.arrow"))) == len(
+        preprocessor.preprocessor_pipe.steps
+    )
+
+
+def test_code_version_includes_cache_dependencies(monkeypatch):
+    water_distance = code_version(WaterDistanceCreator())
+    sqft_price = code_version(SqftPriceCreator())
+
+    # A changed source of spatial_index.py
+    monkeypatch.setitem(step_cache._CODE_VERSIONS, spatial_index.__name__, "changed")
+
+    assert code_version(WaterDistanceCreator()) != water_distance
+    assert code_version(SqftPriceCreator()) == sqft_price
+
+
+def test_parallel_run_uses_the_cache(raw_data, tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_ROWS_PER_JOB", 2000)
+    cache = StepCache(str(tmp_path))
+    expected = PreprocessingKingCountyData().preprocess_fit_transform(raw_data)
+    PreprocessingKingCountyData(n_jobs=3, cache=cache).preprocess_fit_transform(
+        raw_data, input_key="king_county"
+    )
+
+    preprocessor = PreprocessingKingCountyData(n_jobs=3, cache=cache)
+    result = preprocessor.preprocess_fit_transform(raw_data, input_key="king_county")
+
+    assert preprocessor.cached_steps_ == step_names(preprocessor)
+    pd.testing.assert_frame_equal(result, expected)
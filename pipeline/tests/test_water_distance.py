@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from custom_creator_king_county import WaterDistanceCreator, dist
+from spatial_index import NearestReferenceIndex
+
+
+def loop_water_distance(X, rows):
+    """The original double loop of WaterDistanceCreator, evaluated for the given rows only."""
+    water_list = X.query("waterfront == 1")
+    water_distance = []
+    for idx in rows:
+        ref_list = []
+        for i, j in zip(list(water_list.long), list(water_list.lat)):
+            ref_list.append(dist(X.long[idx], X.lat[idx], i, j).min())
+        water_distance.append(min(ref_list))
+    return np.array(water_distance)
+
+
+def test_water_distance_matches_loop(raw_data):
+    rows = raw_data.sample(300, random_state=42).index
+    expected = loop_water_distance(raw_data, rows)
+
+    transformed = WaterDistanceCreator().fit_transform(raw_data)
+
+    np.testing.assert_allclose(
+        transformed.loc[rows, "water_distance"], expected, rtol=0, atol=1e-9
+    )
+
+
+@pytest.mark.parametrize("k", [1, 2, 8])
+def test_kdtree_matches_brute_force(raw_data, k):
+    water_list = raw_data.query("waterfront == 1")
+    kdtree = NearestReferenceIndex(
+        water_list.long, water_list.lat, method="kdtree", k=k
+    )
+    brute = NearestReferenceIndex(water_list.long, water_list.lat, method="brute")
+
+    np.testing.assert_allclose(
+        kdtree.query(raw_data.long, raw_data.lat),
+        brute.query(raw_data.long, raw_data.lat),
+        rtol=0,
+        atol=1e-9,
+    )
+
+
+def test_missing_coordinates_and_empty_reference_set():
+    index = NearestReferenceIndex([-122.3], [47.6])
+    result = index.query([np.nan, -122.3], [47.6, 47.6])
+    assert np.isnan(result[0])
+    assert result[1] == 0
+
+    with pytest.raises(ValueError):
+        NearestReferenceIndex([], [])
+
+
+def test_query_point_matches_query(raw_data):
+    water_list = raw_data.query("waterfront == 1")
+    index = NearestReferenceIndex(water_list.long, water_list.lat, k=1)
+    rows = raw_data.sample(300, random_state=0)
+
+    expected = index.query(rows.long, rows.lat)
+
+    np.testing.assert_array_equal(
+        [index.query_point(long, lat) for long, lat in zip(rows.long, rows.lat)],
+        expected,
+    )
+    assert np.isnan(index.query_point(np.nan, 47.6))
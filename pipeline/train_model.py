@@ -0,0 +1,91 @@
+import argparse
+
+import pandas as pd
+from data_io import load_file_to_dataframe
+from preprocessing_king_county import PreprocessingKingCountyData
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.linear_model import ElasticNet
+from sklearn.model_selection import GridSearchCV
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+LABEL = "price"
+
+# Hyperparameters searched with 5-fold cross-validation. The penalty 'alpha' is in units of the standardized price.
+PARAM_GRID = {
+    "regressor__elastic__alpha": [0.001, 0.01, 0.1],
+    "regressor__elastic__l1_ratio": [1, 0.5, 0],
+}
+
+
+def model_features(df: pd.DataFrame) -> pd.DataFrame:
+    """The features of the model: every preprocessed column except the label, as float64."""
+    return df.drop(columns=LABEL).astype(float)
+
+
+def train_model(df: pd.DataFrame, n_jobs: int = -1) -> TransformedTargetRegressor:
+    """Train the price model of the notebook: an ElasticNet on the features and their squares and products,
+    regularized with the hyperparameters that score best in cross-validation. The polynomial features and the price
+    are standardized, so the penalties of the grid are on the scale of the data and every fit converges with the
+    default tolerance of the ElasticNet. The predictions are transformed back to prices.
+
+    Parameters:
+    ----------
+    df : DataFrame
+        Preprocessed King County data including the label 'price'.
+    n_jobs : int
+        Number of processes of the grid search (-1 uses all CPUs).
+
+    Returns:
+    ----------
+    model : TransformedTargetRegressor
+        The model refitted on all rows with the best hyperparameters.
+    """
+    model = TransformedTargetRegressor(
+        Pipeline(
+            [
+                ("poly", PolynomialFeatures(2)),
+                ("scaler", StandardScaler()),
+                ("elastic", ElasticNet(max_iter=50000)),
+            ]
+        ),
+        transformer=StandardScaler(),
+    )
+    search = GridSearchCV(model, PARAM_GRID, cv=5, n_jobs=n_jobs)
+    search.fit(model_features(df), df[LABEL])
+    return search.best_estimator_
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    """Parse the command-line arguments of the training script."""
+    parser = argparse.ArgumentParser(
+        description="Fit the King County preprocessing, train the price model and save both to an artifact."
+    )
+    parser.add_argument("file_path", help="Path to the raw King County data.")
+    parser.add_argument(
+        "artifact", help="Directory the artifact is written to (see artifact.py)."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=-1,
+        help="Number of processes of the grid search (-1 uses all CPUs, default: -1).",
+    )
+    return parser.parse_args(args)
+
+
+def main() -> None:
+    """Fit the preprocessor on the file, train the model on its output and save both to the artifact, which the
+    API loads at startup to predict prices."""
+    args = parse_args()
+    preprocessor = PreprocessingKingCountyData()
+    df = preprocessor.preprocess_fit_transform(
+        load_file_to_dataframe(args.file_path, preprocessor.INPUT_COLUMNS)
+    )
+    model = train_model(df, args.jobs)
+    preprocessor.save(args.artifact, model)
+    print(f"Saved the preprocessor and the model to {args.artifact}.")
+
+
+if __name__ == "__main__":
+    main()
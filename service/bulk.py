@@ -0,0 +1,114 @@
+"""Bulk insertion of houses, used by POST /houses/bulk and the CSV loader load_houses.py.
+
+The houses are validated with the HousePost schema and inserted in batches, every batch in a transaction of its
+own: with PostgreSQL (psycopg2) by COPY, otherwise by one executemany INSERT, which SQLAlchemy sends as
+multi-row INSERTs. The transaction also logs the zipcodes of the batch for the refresh of the statistics (see
+crud.py). Invalid houses are skipped and a failing batch is rolled back; both are reported in the result while
+the remaining batches are still inserted.
+"""
+import csv
+import io
+from itertools import count, islice
+
+import models
+import schemas
+from crud import stale_zipcode_rows
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+# Number of houses inserted per transaction
+BATCH_SIZE = 5000
+
+HOUSE_FIELDS = list(schemas.HousePost.model_fields)
+
+
+def _validate(house) -> dict:
+    if not isinstance(house, dict):
+        raise TypeError("a house must be an object")
+    return schemas.HousePost(**house).model_dump()
+
+
+def _error_detail(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, item['loc']))}: {item['msg']}"
+            for item in error.errors()
+        )
+    return str(error).splitlines()[0]
+
+
+def _copy_houses(connection, houses: list) -> None:
+    """Insert 'houses' with COPY, the fastest way to load rows into PostgreSQL."""
+    buffer = io.StringIO()
+    # Missing values are written as unquoted empty fields, which COPY reads as NULL
+    csv.writer(buffer).writerows(
+        [house[field] for field in HOUSE_FIELDS] for house in houses
+    )
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {models.House.__tablename__} ({', '.join(HOUSE_FIELDS)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def insert_batch(engine, houses: list) -> None:
+    """Insert the validated 'houses' in one transaction."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql" and connection.dialect.driver == (
+            "psycopg2"
+        ):
+            _copy_houses(connection, houses)
+        else:
+            connection.execute(insert(models.House), houses)
+        connection.execute(
+            insert(models.StaleZipcode),
+            stale_zipcode_rows(house["zipcode"] for house in houses),
+        )
+
+
+def insert_houses(engine, houses, batch_size: int = BATCH_SIZE) -> dict:
+    """Validate and insert 'houses' in batches of 'batch_size'.
+
+    Args:
+    ------
+    - engine: The database engine.
+    - houses: An iterable of dicts with the fields of the HousePost schema, consumed one batch at a time.
+    - batch_size: The number of houses per batch.
+
+    Returns:
+    ------
+    - dict: The number of inserted houses and the errors, based on the BulkInsertResult schema. An error refers
+    to the position of an invalid house in 'houses' or to a batch that could not be inserted.
+    """
+    houses = iter(houses)
+    result = {"inserted": 0, "errors": []}
+    first_row = 0
+    for batch_number in count():
+        batch = list(islice(houses, batch_size))
+        if not batch:
+            break
+        valid = []
+        for row, house in enumerate(batch, first_row):
+            try:
+                valid.append(_validate(house))
+            except (TypeError, ValidationError) as error:
+                result["errors"].append(
+                    {"batch": batch_number, "row": row, "detail": _error_detail(error)}
+                )
+        if valid:
+            try:
+                insert_batch(engine, valid)
+                result["inserted"] += len(valid)
+            # COPY raises the errors of the driver, not of SQLAlchemy
+            except (SQLAlchemyError, engine.dialect.loaded_dbapi.Error) as error:
+                result["errors"].append(
+                    {"batch": batch_number, "row": None, "detail": _error_detail(error)}
+                )
+        first_row += len(batch)
+    return result
@@ -0,0 +1,218 @@
+"""Read-through cache of the single-house lookups of GET /houses/{id}.
+
+HouseCache is the interface of the cache backends. The default backend is LRUCache, an in-process LRU cache whose
+entries expire after a TTL. RedisCache implements the interface with a Redis-compatible server, for caches
+shared by several processes. The cache is configured from the environment:
+
+    HOUSE_CACHE_URL     URL of a Redis-compatible server, the in-process cache is used if it is not set
+    HOUSE_CACHE_SIZE    maximum number of houses of the in-process cache (0 disables the cache)
+    HOUSE_CACHE_TTL     seconds a cached house is valid
+
+Updates and deletes invalidate the key of their house after the commit. A lookup that loaded a house from the
+database while its key was invalidated does not cache it, so a stale house is never cached after an invalidation.
+The in-process cache notices the invalidations of its own process, RedisCache those of all processes.
+"""
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_URL = os.getenv("HOUSE_CACHE_URL")
+CACHE_SIZE = int(os.getenv("HOUSE_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("HOUSE_CACHE_TTL", "60"))
+
+
+class HouseCache(ABC):
+    """Interface of the cache backends: houses (dicts) stored by their ID, with hit, miss and eviction counters.
+
+    Parameters:
+    ----------
+    ttl : float
+        Seconds an entry is valid.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented by every invalidation of this process, see '_version'
+        self._generation = 0
+
+    @abstractmethod
+    async def get(self, key: int):
+        """The cached value of 'key', None if it is not cached or expired."""
+
+    @abstractmethod
+    async def set(self, key: int, value: dict) -> None:
+        """Cache 'value' under 'key' for 'ttl' seconds."""
+
+    @abstractmethod
+    async def _delete(self, keys: list) -> None:
+        """Remove 'keys' from the cache."""
+
+    async def _version(self, key: int):
+        """Token that changes when 'key' is invalidated. By default the number of invalidations of this process."""
+        return self._generation
+
+    async def _set_if_unchanged(self, key: int, value: dict, version) -> None:
+        """Cache 'value' under 'key' unless 'key' was invalidated since '_version' returned 'version'."""
+        if version == self._generation:
+            await self.set(key, value)
+
+    def size(self):
+        """Number of cached entries, None if the backend does not know it."""
+        return None
+
+    async def invalidate(self, *keys: int) -> None:
+        """Remove 'keys' from the cache, after their rows changed in the database."""
+        self._generation += 1
+        await self._delete(list(keys))
+
+    async def get_or_load(self, key: int, load):
+        """Return the cached value of 'key' or else load it with the coroutine function 'load' and cache it.
+        A value of None (no such house) is not cached."""
+        value = await self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        version = await self._version(key)
+        value = await load()
+        # An invalidation during the load may have removed a newer value, which the loaded one must not replace
+        if value is not None:
+            await self._set_if_unchanged(key, value, version)
+        return value
+
+    def stats(self) -> dict:
+        """The counters of the cache."""
+        return {
+            "backend": type(self).__name__,
+            "size": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class LRUCache(HouseCache):
+    """In-process cache, which evicts the least recently used entry when it is full. Entries expire after 'ttl'
+    seconds; expired entries count as evictions.
+
+    Parameters:
+    ----------
+    max_size : int
+        Maximum number of entries.
+    ttl : float
+        Seconds an entry is valid.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    async def get(self, key: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: int, value: dict) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _delete(self, keys: list) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(HouseCache):
+    """Cache on a Redis-compatible server (redis.asyncio client), shared by all processes of the service. The
+    server expires the entries after 'ttl' seconds and evicts them by its own policy, which the eviction counter
+    does not see.
+
+    Every invalidation increments a version key of the house on the server ('<prefix><id>:version', one counter
+    per changed house without expiry), and a loaded house is only cached in a transaction that watches this key,
+    so an invalidation by any process during the load prevents it from being cached.
+
+    Parameters:
+    ----------
+    url : str
+        URL of the server, e.g. redis://localhost:6379/0.
+    ttl : float
+        Seconds an entry is valid.
+    prefix : str
+        Prefix of the keys of the houses.
+    """
+
+    def __init__(self, url: str, ttl: float = CACHE_TTL, prefix: str = "house:"):
+        import redis.asyncio as redis
+
+        super().__init__(ttl)
+        self.prefix = prefix
+        self.client = redis.from_url(url)
+
+    def _version_key(self, key: int) -> str:
+        return f"{self.prefix}{key}:version"
+
+    async def get(self, key: int):
+        value = await self.client.get(f"{self.prefix}{key}")
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: int, value: dict) -> None:
+        await self.client.set(
+            f"{self.prefix}{key}", json.dumps(value), px=int(self.ttl * 1000)
+        )
+
+    async def _version(self, key: int):
+        return await self.client.get(self._version_key(key))
+
+    async def _set_if_unchanged(self, key: int, value: dict, version) -> None:
+        from redis.exceptions import WatchError
+
+        async with self.client.pipeline() as pipe:
+            await pipe.watch(self._version_key(key))
+            if await pipe.get(self._version_key(key)) != version:
+                return
+            pipe.multi()
+            pipe.set(f"{self.prefix}{key}", json.dumps(value), px=int(self.ttl * 1000))
+            try:
+                await pipe.execute()
+            except WatchError:
+                # Invalidated between the check and the write
+                pass
+
+    async def _delete(self, keys: list) -> None:
+        if keys:
+            async with self.client.pipeline() as pipe:
+                for key in keys:
+                    pipe.incr(self._version_key(key))
+                pipe.delete(*(f"{self.prefix}{key}" for key in keys))
+                await pipe.execute()
+
+
+def cache_from_environment() -> HouseCache:
+    """The cache configured by HOUSE_CACHE_URL, HOUSE_CACHE_SIZE and HOUSE_CACHE_TTL."""
+    if CACHE_URL:
+        return RedisCache(CACHE_URL, CACHE_TTL)
+    return LRUCache(CACHE_SIZE, CACHE_TTL)
@@ -0,0 +1,257 @@
+"""In-process spatial index of the houses for the comparable sales of GET /houses/{id}/comparables.
+
+Every house with coordinates is a point of its position in kilometers (an equirectangular projection around the
+mean latitude, accurate to a fraction of a percent within King County) and of its bedrooms, bathrooms and log
+price in standard deviations, multiplied by COMPARABLES_ATTRIBUTE_KM: one standard deviation of an attribute
+weighs as much as that many kilometers. The comparables of a house are its nearest points by Euclidean distance.
+
+The points are held in a KD-tree, which is static. Houses added, changed or deleted by the endpoints of this
+process are applied incrementally: changed and deleted houses are masked in the tree and the new points are kept
+in a small delta, which is searched by brute force next to the tree. The tree is built from the database in the
+background when the index starts (the index is not 'ready' until then), and rebuilt every
+COMPARABLES_REBUILD_INTERVAL seconds, when the delta exceeds COMPARABLES_MAX_DELTA houses and after bulk inserts;
+the rebuild also picks up changes of other processes. The houses are read as one float array with the columns
+INDEX_COLUMNS, streamed in batches, and the points and the KD-tree are computed in a worker thread; the changes
+made meanwhile are replayed on the new tree. Everything else runs on the event loop, so the index needs no
+locks.
+"""
+import asyncio
+import logging
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from scipy.spatial import cKDTree
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REBUILD_INTERVAL = float(os.getenv("COMPARABLES_REBUILD_INTERVAL", "300"))
+MAX_DELTA = int(os.getenv("COMPARABLES_MAX_DELTA", "1000"))
+ATTRIBUTE_KM = float(os.getenv("COMPARABLES_ATTRIBUTE_KM", "1.0"))
+
+KM_PER_DEGREE = 111.195
+# Latitude of the projection while the index is empty (King County)
+DEFAULT_LATITUDE = 47.56
+
+# Attributes of the houses besides the coordinates, normalized by their mean and standard deviation
+ATTRIBUTES = ["bedrooms", "bathrooms", "price"]
+# Columns of the array of houses the index is built from
+INDEX_COLUMNS = ["id", "lat", "long"] + ATTRIBUTES
+
+
+class ComparablesIndex:
+    """Nearest-neighbour index of the houses by position and attributes.
+
+    Parameters:
+    ----------
+    attribute_km : float
+        Kilometers of distance equivalent to one standard deviation of an attribute.
+    max_delta : int
+        Number of changed houses after which a rebuild is requested.
+    """
+
+    def __init__(self, attribute_km: float = ATTRIBUTE_KM, max_delta: int = MAX_DELTA):
+        self.attribute_km = attribute_km
+        self.max_delta = max_delta
+        self._ids = np.empty(0, dtype=np.int64)
+        self._points = np.empty((0, 2 + len(ATTRIBUTES)))
+        self._positions = {}
+        self._tree = None
+        self._cos_lat = np.cos(np.radians(DEFAULT_LATITUDE))
+        self._mean = np.zeros(len(ATTRIBUTES))
+        self._std = np.ones(len(ATTRIBUTES))
+        # Houses of the tree that changed or were deleted, and the points of the changed and added houses
+        self._masked = set()
+        self._delta = {}
+        # Changes made before the first build or during a rebuild, replayed on the new tree
+        self._log = []
+        self.ready = False
+        self._rebuild_requested = asyncio.Event()
+        self._worker = None
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._masked) + len(self._delta)
+
+    @staticmethod
+    def _attributes(values: np.ndarray) -> np.ndarray:
+        """The ATTRIBUTES in the columns of 'values' with the log of the price, NaN where missing."""
+        values = np.array(values, dtype=float)
+        price = values[..., 2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[..., 2] = np.where(price > 0, np.log(price), np.nan)
+        return values
+
+    def point(self, house: dict):
+        """The point of 'house' (a dict with lat, long and ATTRIBUTES), None without coordinates. Missing
+        attributes get the mean of the houses."""
+        if house.get("lat") is None or house.get("long") is None:
+            return None
+        values = [house.get(attribute) for attribute in ATTRIBUTES]
+        values = [np.nan if value is None else value for value in values]
+        normalized = (self._attributes(values) - self._mean) / self._std
+        return np.concatenate(
+            [
+                [
+                    house["lat"] * KM_PER_DEGREE,
+                    house["long"] * KM_PER_DEGREE * self._cos_lat,
+                ],
+                np.nan_to_num(normalized) * self.attribute_km,
+            ]
+        )
+
+    def point_of(self, id: int):
+        """The point of the house 'id' in the index, None if it is not indexed."""
+        if id in self._delta:
+            return self._delta[id]
+        if id in self._positions and id not in self._masked:
+            return self._points[self._positions[id]]
+        return None
+
+    def upsert(self, id: int, house: dict) -> None:
+        """Index the new or changed 'house' with the ID 'id'."""
+        self._apply(id, self.point(house))
+        if self._log is not None:
+            self._log.append((id, house))
+
+    def remove(self, id: int) -> None:
+        """Remove the house 'id' from the index."""
+        self._apply(id, None)
+        if self._log is not None:
+            self._log.append((id, None))
+
+    def _apply(self, id: int, point) -> None:
+        if id in self._positions:
+            self._masked.add(id)
+        if point is None:
+            self._delta.pop(id, None)
+        else:
+            self._delta[id] = point
+        if len(self._masked) + len(self._delta) > self.max_delta:
+            self.request_rebuild()
+
+    def query(self, point: np.ndarray, k: int, exclude: int = None) -> list:
+        """The 'k' houses nearest to 'point'.
+
+        Parameters:
+        ----------
+        point : ndarray
+            Point of the query, see 'point'.
+        k : int
+            Number of houses.
+        exclude : int, optional
+            ID of a house that is not returned, the house the comparables are searched for.
+
+        Returns:
+        ----------
+        neighbours : list of tuple
+            The ID of every house, its distance in kilometers and its distance in the index (position and
+            attributes), ordered by the latter.
+        """
+        candidates = []
+        if self._tree is not None:
+            n = min(len(self._ids), k + len(self._masked) + 1)
+            distances, positions = self._tree.query(point, k=n)
+            for distance, position in zip(
+                np.atleast_1d(distances), np.atleast_1d(positions)
+            ):
+                id = int(self._ids[position])
+                if id not in self._masked and id != exclude:
+                    candidates.append((float(distance), id, self._points[position]))
+        for id, delta_point in self._delta.items():
+            if id != exclude:
+                distance = float(np.linalg.norm(delta_point - point))
+                candidates.append((distance, id, delta_point))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [
+            (id, float(np.linalg.norm(neighbour[:2] - point[:2])), distance)
+            for distance, id, neighbour in candidates[:k]
+        ]
+
+    def request_rebuild(self) -> None:
+        """Rebuild the index from the database as soon as possible."""
+        self._rebuild_requested.set()
+
+    async def rebuild(self, load) -> None:
+        """Replace the index by the houses returned by the coroutine function 'load', a float array with the
+        columns INDEX_COLUMNS (NaN for missing values)."""
+        if self._log is None:
+            self._log = []
+        try:
+            houses = await load()
+            state = await asyncio.get_running_loop().run_in_executor(
+                None, self._build, houses
+            )
+        except BaseException:
+            # Before the first build the changes are kept for the next attempt
+            if self.ready:
+                self._log = None
+            raise
+        log, self._log = self._log, None
+        (
+            self._ids,
+            self._points,
+            self._positions,
+            self._tree,
+            self._cos_lat,
+            self._mean,
+            self._std,
+        ) = state
+        self._masked = set()
+        self._delta = {}
+        self.ready = True
+        for id, house in log:
+            self._apply(id, None if house is None else self.point(house))
+
+    def _build(self, houses: np.ndarray) -> tuple:
+        houses = np.asarray(houses, dtype=float).reshape(-1, len(INDEX_COLUMNS))
+        houses = houses[~np.isnan(houses[:, 1]) & ~np.isnan(houses[:, 2])]
+        ids = houses[:, 0].astype(np.int64)
+        latitudes, longitudes = houses[:, 1], houses[:, 2]
+        attributes = self._attributes(houses[:, 3:])
+        if len(houses):
+            cos_lat = np.cos(np.radians(latitudes.mean()))
+            with np.errstate(invalid="ignore"):
+                mean = np.nan_to_num(np.nanmean(attributes, axis=0))
+                std = np.nan_to_num(np.nanstd(attributes, axis=0), nan=1.0)
+            std[std == 0] = 1.0
+        else:
+            cos_lat, mean, std = self._cos_lat, self._mean, self._std
+        points = np.column_stack(
+            [
+                latitudes * KM_PER_DEGREE,
+                longitudes * KM_PER_DEGREE * cos_lat,
+                np.nan_to_num((attributes - mean) / std) * self.attribute_km,
+            ]
+        )
+        positions = dict(zip(ids.tolist(), range(len(ids))))
+        tree = cKDTree(points) if len(houses) else None
+        return ids, points, positions, tree, cos_lat, mean, std
+
+    def start(self, load, interval: float = REBUILD_INTERVAL) -> None:
+        """Build the index with 'load' in the background, then rebuild it every 'interval' seconds and when a
+        rebuild is requested, must be called from the event loop."""
+        self._worker = asyncio.create_task(self._run(load, interval))
+
+    async def stop(self) -> None:
+        """Stop the rebuilds."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self, load, interval: float) -> None:
+        while True:
+            self._rebuild_requested.clear()
+            try:
+                await self.rebuild(load)
+            except Exception:
+                logger.exception("Rebuild of the comparables index failed")
+            try:
+                await asyncio.wait_for(self._rebuild_requested.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
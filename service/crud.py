@@ -0,0 +1,298 @@
+"""Queries of the houses table shared by the endpoints.
+
+Updates and deletes take a single statement with RETURNING, which reports the changed rows in the same round trip
+as the change itself, for one house as well as for a batch of houses. A batch of updates joins the table with
+the new values, which are passed as one JSON array and unpacked by the database (jsonb_to_recordset in
+PostgreSQL, json_each in SQLite): houses with different new values are updated by one statement, and the
+statement is the same for every batch, so SQLAlchemy compiles it only once. Databases without RETURNING (SQLite
+before 3.35) read the changed rows with a second query in the same transaction instead.
+
+The price statistics per zipcode are kept in the summary table zipcode_stats. Every change of houses logs their
+zipcodes in stale_zipcodes in the same transaction, and 'refresh_zipcode_stats' recomputes the statistics of only
+these zipcodes in the database, reading their prices in order from the index on (zipcode, price). Several
+processes may refresh at the same time: the statistics are upserted (INSERT ... ON CONFLICT DO UPDATE), so a refresh
+never collides with the rows of another one, and in PostgreSQL the refreshes take turns on an advisory lock.
+"""
+import json
+import operator
+from functools import lru_cache
+
+import models
+import schemas
+from sqlalchemy import (
+    Integer,
+    String,
+    bindparam,
+    case,
+    cast,
+    column,
+    delete,
+    exists,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Only the columns of the response are read, the rows are not turned into ORM objects
+HOUSE_COLUMNS = [getattr(models.House, name) for name in schemas.HouseGet.model_fields]
+
+# Columns changed by updates
+UPDATE_FIELDS = list(schemas.HouseUpdate.model_fields)
+
+# Key of the PostgreSQL advisory lock held by a refresh of the zipcode statistics
+STATS_LOCK_KEY = 7_294_183_001
+
+# Columns of zipcode_stats set by a refresh
+STATS_COLUMNS = ["count", "mean_price", "median_price"]
+
+
+def _core(statement):
+    # The statements change rows of many houses, which the session does not need to look up afterwards
+    return statement.execution_options(synchronize_session=False)
+
+
+@lru_cache
+def _batch_update_statement(dialect: str):
+    """UPDATE of the houses in the JSON array of the parameter 'changes' with the fields 'id' and UPDATE_FIELDS."""
+    changes = bindparam("changes", type_=String)
+    fields = ["id"] + UPDATE_FIELDS
+    if dialect == "postgresql":
+        new_values = (
+            func.jsonb_to_recordset(cast(changes, JSONB))
+            .table_valued(*(column(field, Integer) for field in fields))
+            .render_derived(name="changes", with_types=True)
+        )
+    else:
+        rows = func.json_each(changes).table_valued("value")
+        new_values = select(
+            *(
+                func.json_extract(rows.c.value, f"$.{field}").label(field)
+                for field in fields
+            )
+        ).subquery("changes")
+    return (
+        update(models.House)
+        .where(models.House.id == new_values.c.id)
+        .values({field: new_values.c[field] for field in UPDATE_FIELDS})
+    )
+
+
+async def update_houses(db, changes: list) -> list:
+    """Apply 'changes' in one UPDATE statement, without committing.
+
+    Args:
+    ------
+    - db: The database session.
+    - changes: Dicts with the 'id' of a house and its new values of the fields of the HouseUpdate schema.
+
+    Returns:
+    ------
+    - list: The updated houses as dicts of their ID and the columns of the HouseGet schema, houses that do not
+    exist are missing."""
+    dialect = db.bind.dialect
+    if len(changes) == 1:
+        statement = (
+            update(models.House)
+            .where(models.House.id == changes[0]["id"])
+            .values({field: changes[0][field] for field in UPDATE_FIELDS})
+        )
+        parameters = {}
+    else:
+        statement = _batch_update_statement(dialect.name)
+        parameters = {
+            "changes": json.dumps(
+                [
+                    {key: change[key] for key in ["id"] + UPDATE_FIELDS}
+                    for change in changes
+                ]
+            )
+        }
+    statement = _core(statement)
+    if dialect.update_returning:
+        result = await db.execute(
+            statement.returning(models.House.id, *HOUSE_COLUMNS), parameters
+        )
+    else:
+        await db.execute(statement, parameters)
+        ids = [change["id"] for change in changes]
+        result = await db.execute(
+            select(models.House.id, *HOUSE_COLUMNS).where(models.House.id.in_(ids))
+        )
+    houses = [dict(row._mapping) for row in result.all()]
+    await mark_stale_zipcodes(db, [house["zipcode"] for house in houses])
+    return houses
+
+
+async def delete_houses(db, ids: list) -> list:
+    """Delete the houses with the given 'ids' in one DELETE statement, without committing.
+
+    Args:
+    ------
+    - db: The database session.
+    - ids: The IDs of the houses.
+
+    Returns:
+    ------
+    - list: The IDs of the deleted houses."""
+    statement = _core(delete(models.House).where(models.House.id.in_(ids)))
+    columns = [models.House.id, models.House.zipcode]
+    if db.bind.dialect.delete_returning:
+        deleted = (await db.execute(statement.returning(*columns))).all()
+    else:
+        deleted = (
+            await db.execute(select(*columns).where(models.House.id.in_(ids)))
+        ).all()
+        await db.execute(statement)
+    await mark_stale_zipcodes(db, [zipcode for _, zipcode in deleted])
+    return [id for id, _ in deleted]
+
+
+def create_schema(engine) -> None:
+    """Create the tables and indexes of the models, also the columns and indexes added to an existing houses
+    table. If the summary of the statistics is empty, all zipcodes are logged as stale, so the first refresh
+    fills it.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        existing = {
+            column["name"]
+            for column in inspect(connection).get_columns(models.House.__tablename__)
+        }
+        for column in models.House.__table__.columns:
+            if column.name not in existing:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {models.House.__tablename__} ADD COLUMN "
+                        f"{column.name} {column.type.compile(connection.dialect)}"
+                    )
+                )
+        for index in models.House.__table__.indexes:
+            index.create(connection, checkfirst=True)
+        summary_rows = connection.scalar(
+            select(func.count()).select_from(models.ZipcodeStats)
+        )
+        stale_rows = connection.scalar(
+            select(func.count()).select_from(models.StaleZipcode)
+        )
+        if summary_rows == 0 and stale_rows == 0:
+            zipcodes = select(models.House.zipcode).where(
+                models.House.zipcode.is_not(None)
+            )
+            connection.execute(
+                insert(models.StaleZipcode).from_select(
+                    ["zipcode"], zipcodes.distinct()
+                )
+            )
+
+
+def filter_conditions(
+    zipcode: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    bedrooms: int = None,
+    min_last_change: int = None,
+    max_last_change: int = None,
+) -> list:
+    """The WHERE conditions of the filters of the houses; filters that are None are not applied."""
+    house = models.House
+    filters = [
+        (operator.eq, house.zipcode, zipcode),
+        (operator.ge, house.price, min_price),
+        (operator.le, house.price, max_price),
+        (operator.eq, house.bedrooms, bedrooms),
+        (operator.ge, house.last_change, min_last_change),
+        (operator.le, house.last_change, max_last_change),
+    ]
+    return [
+        compare(column, value)
+        for compare, column, value in filters
+        if value is not None
+    ]
+
+
+def stale_zipcode_rows(zipcodes) -> list:
+    """The rows logging the changed 'zipcodes' in stale_zipcodes."""
+    return [{"zipcode": zipcode} for zipcode in set(zipcodes) if zipcode is not None]
+
+
+async def mark_stale_zipcodes(db, zipcodes) -> None:
+    """Log that the houses of 'zipcodes' changed, so their statistics are refreshed."""
+    rows = stale_zipcode_rows(zipcodes)
+    if rows:
+        await db.execute(insert(models.StaleZipcode), rows)
+
+
+def zipcode_stats_query(zipcodes):
+    """SELECT of the number of houses and the mean and median price per zipcode in the subquery 'zipcodes'.
+
+    The median is the mean of the middle prices of the zipcode, found with window functions, which PostgreSQL and
+    SQLite both support, unlike a median aggregate."""
+    house = models.House
+    ranked = (
+        select(
+            house.zipcode,
+            house.price,
+            func.row_number()
+            .over(partition_by=house.zipcode, order_by=house.price)
+            .label("price_rank"),
+            func.count().over(partition_by=house.zipcode).label("n"),
+        )
+        .where(house.zipcode.in_(zipcodes), house.price.is_not(None))
+        .subquery()
+    )
+    middle = ranked.c.price_rank.in_([(ranked.c.n + 1) // 2, (ranked.c.n + 2) // 2])
+    return select(
+        ranked.c.zipcode,
+        func.count(),
+        func.avg(ranked.c.price),
+        func.avg(case((middle, ranked.c.price))),
+    ).group_by(ranked.c.zipcode)
+
+
+async def refresh_zipcode_stats(db) -> None:
+    """Recompute the statistics of the zipcodes logged in stale_zipcodes and commit them.
+
+    The log is read up to its last row when the refresh starts, rows logged meanwhile stay for the next refresh.
+    A refresh in PostgreSQL first waits for the refreshes of other sessions, which may have emptied the log.
+    """
+    last_logged = select(func.max(models.StaleZipcode.id))
+    if await db.scalar(last_logged) is None:
+        return
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        # Released when the transaction ends
+        await db.execute(select(func.pg_advisory_xact_lock(STATS_LOCK_KEY)))
+    last = await db.scalar(last_logged)
+    if last is not None:
+        stale = (
+            select(models.StaleZipcode.zipcode)
+            .where(models.StaleZipcode.id <= last)
+            .distinct()
+            .scalar_subquery()
+        )
+        stats = models.ZipcodeStats
+        priced_houses = exists().where(
+            models.House.zipcode == stats.zipcode, models.House.price.is_not(None)
+        )
+        await db.execute(
+            _core(delete(stats).where(stats.zipcode.in_(stale), ~priced_houses))
+        )
+        upsert = (postgresql if dialect == "postgresql" else sqlite).insert(stats)
+        upsert = upsert.from_select(
+            ["zipcode"] + STATS_COLUMNS, zipcode_stats_query(stale)
+        )
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[stats.zipcode],
+                set_={column: upsert.excluded[column] for column in STATS_COLUMNS},
+            )
+        )
+        await db.execute(
+            _core(delete(models.StaleZipcode).where(models.StaleZipcode.id <= last))
+        )
+    await db.commit()
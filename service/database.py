@@ -1,21 +1,141 @@
 import os
+import time
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from metrics import POOL_CHECKOUT_DURATION, record_statement
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 load_dotenv()
 
 # Retrieve the database connection URL from an environment variable
 SQLALCHEMY_DATABASE_URL = os.getenv("DB_CONN")
 
+# Settings of the connection pools, configurable next to DB_CONN. Every engine (the async engine of the endpoints
+# and the sync engine of the bulk inserts) has a pool of its own.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a connection when the pool is exhausted
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this many seconds are replaced (-1 never replaces them)
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test every connection before it is used, so connections the database closed are replaced
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Maximum duration of a statement in milliseconds (PostgreSQL only, unset means no limit)
+STATEMENT_TIMEOUT_MS = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+
+# Drivers of the async engine for the databases of DB_CONN
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """The URL of 'url' with the async driver of its database, e.g. asyncpg instead of psycopg2."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for the database '{backend}'")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(
+        hide_password=False
+    )
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording the time to get a connection, the wait when all connections are checked out
+    included, in the metrics."""
+
+    engine_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_DURATION.observe(
+                (self.engine_label,), time.perf_counter() - start
+            )
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """The pool of the async engine with the timing of TimedQueuePool."""
+
+    engine_label = "async"
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Keyword arguments of the engine for 'url' with the pool and timeout settings of the environment."""
+    url = make_url(url)
+    options = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    # An in-memory SQLite database lives in its connection, so it keeps the pool SQLAlchemy picks for it
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(
+            poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+        )
+    if STATEMENT_TIMEOUT_MS and url.get_backend_name() == "postgresql":
+        if is_async:
+            settings = {"server_settings": {"statement_timeout": STATEMENT_TIMEOUT_MS}}
+        else:
+            settings = {"options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+        options["connect_args"] = settings
+    return options
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_statement(
+        statement, time.perf_counter() - conn.info["statement_start"].pop()
+    )
+
+
+def instrument(engine) -> None:
+    """Record the number and duration of the statements of 'engine' in the metrics (see metrics.py)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def pool_status(engine) -> dict:
+    """Statistics of the connection pool of 'engine' for monitoring."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": MAX_OVERFLOW,
+    }
+
+
 # Create a database engine using the SQLAlchemy create_engine function
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)
+)
 
 # Create a session maker using the SQLAlchemy sessionmaker function
 # This session maker will be used to create new sessions to interact with the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument(engine)
+
+# The async engine of the endpoints, so the number of concurrent requests is not limited by the threads
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL),
+    **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True),
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+instrument(async_engine.sync_engine)
 
 # Create a base class for declarative models using the SQLAlchemy declarative_base function
 # This base class will be used as the superclass for all the models in the application
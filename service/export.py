@@ -0,0 +1,107 @@
+"""Columnar export of the houses, used by GET /houses/export.
+
+The houses are read from a server-side cursor in batches, every batch is converted to an Arrow record batch and
+encoded right away: as a message of an Arrow IPC stream, as a row group of a Parquet file or as rows of a CSV
+file. The encoded bytes of every batch are sent before the next batch is read, so the memory stays flat for any
+number of houses and the rows never go through the pydantic schemas. The files can be read with data_io.py of
+the pipeline.
+"""
+import pyarrow as pa
+from database import async_engine
+from pyarrow import csv, ipc, parquet
+from sqlalchemy import Float, Integer
+
+# Houses read from the cursor and encoded at a time, also the size of the Parquet row groups
+EXPORT_BATCH_SIZE = 50_000
+
+# Media types and file extensions of the export formats
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrow"),
+    "csv": ("text/csv", ".csv"),
+}
+
+ARROW_TYPES = {Integer: pa.int64(), Float: pa.float64()}
+
+
+def arrow_schema(columns: list) -> pa.Schema:
+    """The Arrow schema of the SQLAlchemy 'columns'."""
+    return pa.schema(
+        [pa.field(column.key, ARROW_TYPES[type(column.type)]) for column in columns]
+    )
+
+
+class _ChunkSink:
+    """Writable file collecting the bytes the writers encode until they are taken."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        """The bytes written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _writer(format: str, sink, schema: pa.Schema):
+    if format == "parquet":
+        return parquet.ParquetWriter(sink, schema)
+    if format == "arrow":
+        return ipc.new_stream(sink, schema)
+    if format == "csv":
+        return csv.CSVWriter(sink, schema)
+    raise ValueError(f"Unknown export format '{format}'")
+
+
+async def export_houses(
+    query, columns: list, format: str, batch_size: int = EXPORT_BATCH_SIZE
+):
+    """Yield the rows of 'query' encoded in 'format', one chunk of bytes per batch of rows.
+
+    Parameters:
+    ----------
+    query : Select
+        SELECT of the 'columns' of the houses.
+    columns : list
+        The selected SQLAlchemy columns, which define the Arrow schema.
+    format : str
+        One of EXPORT_FORMATS.
+    batch_size : int
+        Number of rows read and encoded at a time.
+    """
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = _writer(format, pa.PythonFile(sink, mode="w"), schema)
+    # The generator opens its own connection, because the session of the request is closed before the response
+    # is streamed
+    async with async_engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            if format == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            yield sink.take()
+    writer.close()
+    yield sink.take()
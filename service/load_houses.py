@@ -0,0 +1,155 @@
+import argparse
+import sys
+import time
+
+import pandas as pd
+from bulk import BATCH_SIZE, insert_houses
+from crud import create_schema
+from database import engine
+from predictor import PIPELINE_DIR
+
+# Columns of the King County data the houses are built from
+CSV_COLUMNS = [
+    "price",
+    "bedrooms",
+    "bathrooms",
+    "floors",
+    "zipcode",
+    "yr_built",
+    "yr_renovated",
+    "sqft_living",
+    "sqft_above",
+    "sqft_basement",
+    "view",
+    "waterfront",
+    "lat",
+    "long",
+]
+
+# Number of CSV rows read at a time
+CHUNKSIZE = 50_000
+
+
+def data_cleaning_pipeline():
+    """The data cleaning stage of the King County pipeline. Its steps learn nothing from the data, so every chunk
+    can be cleaned on its own."""
+    if PIPELINE_DIR not in sys.path:
+        sys.path.append(PIPELINE_DIR)
+    from preprocessing_king_county import PreprocessingKingCountyData
+
+    return PreprocessingKingCountyData().data_cleaning_pipeline
+
+
+def houses_from_chunk(chunk: pd.DataFrame, cleaning=None) -> list:
+    """Convert a chunk of the King County data to houses of the HousePost schema.
+
+    Without 'cleaning' the last change is the year of the renovation (null if the house was never renovated).
+    The data cleaning removes the houses with an implausible ratio of bathrooms to bedrooms and sets the last
+    change to the year of the renovation or else of the construction.
+    """
+    if cleaning is not None:
+        chunk = cleaning.fit_transform(chunk)
+        last_change = chunk["last_known_change"]
+    else:
+        last_change = chunk["yr_renovated"].where(chunk["yr_renovated"] > 0)
+    houses = pd.DataFrame(
+        {
+            "bedrooms": chunk["bedrooms"],
+            "bathrooms": chunk["bathrooms"],
+            "floors": chunk["floors"],
+            "zipcode": chunk["zipcode"],
+            "price": chunk["price"].round(),
+            "last_change": last_change,
+            "lat": chunk["lat"],
+            "long": chunk["long"],
+        }
+    )
+    return houses.astype(object).where(houses.notna(), None).to_dict("records")
+
+
+def load_houses(
+    file_path: str,
+    clean: bool = False,
+    batch_size: int = BATCH_SIZE,
+    chunksize: int = CHUNKSIZE,
+) -> dict:
+    """Stream the King County CSV 'file_path' into the houses table, one chunk at a time.
+
+    Parameters:
+    ----------
+    file_path : str
+        Path to the CSV file.
+    clean : bool
+        If True the houses go through the data cleaning of the pipeline first.
+    batch_size : int
+        Number of houses per insert transaction.
+    chunksize : int
+        Number of CSV rows read at a time.
+
+    Returns:
+    ----------
+    result : dict
+        The number of inserted houses and the errors (see bulk.insert_houses), whose rows are positions in
+        the file, counted without the header and the houses removed by the cleaning.
+    """
+    create_schema(engine)
+    cleaning = data_cleaning_pipeline() if clean else None
+    result = {"inserted": 0, "errors": []}
+    rows = 0
+    batches = 0
+    for chunk in pd.read_csv(file_path, usecols=CSV_COLUMNS, chunksize=chunksize):
+        houses = houses_from_chunk(chunk, cleaning)
+        chunk_result = insert_houses(engine, houses, batch_size)
+        result["inserted"] += chunk_result["inserted"]
+        for error in chunk_result["errors"]:
+            row = None if error["row"] is None else error["row"] + rows
+            result["errors"].append(
+                dict(error, batch=error["batch"] + batches, row=row)
+            )
+        rows += len(houses)
+        batches += -(-len(houses) // batch_size)
+    return result
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    """Parse the command-line arguments of the loader."""
+    parser = argparse.ArgumentParser(
+        description="Load the houses of a King County CSV file into the database (DB_CONN)."
+    )
+    parser.add_argument("file_path", help="Path to the King County CSV file.")
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="Clean the houses with the data cleaning of the pipeline before loading them.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Number of houses per insert transaction (default: {BATCH_SIZE}).",
+    )
+    return parser.parse_args(args)
+
+
+def main() -> None:
+    """Load the CSV file and report the inserted houses and the errors."""
+    args = parse_args()
+    if args.batch_size < 1:
+        print("Error: --batch-size must be at least 1.")
+        sys.exit(1)
+    start = time.perf_counter()
+    result = load_houses(args.file_path, args.clean, args.batch_size)
+    elapsed = time.perf_counter() - start
+    for error in result["errors"]:
+        where = "" if error["row"] is None else f", row {error['row']}"
+        print(f"Error in batch {error['batch']}{where}: {error['detail']}")
+    print(
+        f"Inserted {result['inserted']} houses in {elapsed:.1f} s "
+        f"({result['inserted'] / elapsed:.0f} houses/s), {len(result['errors'])} errors."
+    )
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,107 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+
+import metrics
 import models
+import numpy as np
 import schemas
-from database import SessionLocal, engine
-from fastapi import Depends, FastAPI, HTTPException, Response
+from bulk import BATCH_SIZE, insert_houses
+from cache import HouseCache, cache_from_environment
+from comparables import INDEX_COLUMNS, ComparablesIndex
+from crud import (
+    HOUSE_COLUMNS,
+    create_schema,
+    delete_houses,
+    filter_conditions,
+    mark_stale_zipcodes,
+    refresh_zipcode_stats,
+    update_houses,
+)
+from database import AsyncSessionLocal, async_engine, engine, pool_status
+from export import EXPORT_FORMATS, export_houses
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from predictor import MODEL_ARTIFACT, MicroBatcher, PricePredictor
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Default and maximum number of houses per page of GET /houses
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows fetched from the server-side cursor at a time when streaming houses
+STREAM_BATCH_SIZE = 1000
+# Rows fetched at a time when the comparables index is built
+INDEX_BATCH_SIZE = 20_000
+# Default and maximum number of comparables
+COMPARABLES = 10
+MAX_COMPARABLES = 100
+
+# Columns of the houses in the comparables index
+INDEXED_COLUMNS = [getattr(models.House, column) for column in INDEX_COLUMNS]
+
+
+async def load_indexed_houses() -> np.ndarray:
+    """The houses with coordinates as a float array of the INDEX_COLUMNS, to build the comparables index.
+
+    The rows are streamed from a server-side cursor and converted to an array one batch at a time, so the event
+    loop serves other requests between the batches."""
+    query = select(*INDEXED_COLUMNS).where(
+        models.House.lat.is_not(None), models.House.long.is_not(None)
+    )
+    batches = []
+    async with async_engine.connect() as connection:
+        result = await connection.stream(
+            query.execution_options(yield_per=INDEX_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            batches.append(np.array(rows, dtype=float))
+    if not batches:
+        return np.empty((0, len(INDEX_COLUMNS)))
+    return np.concatenate(batches)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the cache of the house lookups, start building the comparables index in the background, load the
+    price model from MODEL_ARTIFACT at startup and run the micro-batcher of '/predict'. Without MODEL_ARTIFACT
+    the prediction endpoints respond with 503, like the comparables endpoints until the index is built.
+    """
+    app.state.house_cache = cache_from_environment()
+    app.state.comparables = ComparablesIndex()
+    app.state.comparables.start(load_indexed_houses)
+    app.state.stats_lock = asyncio.Lock()
+    app.state.predictor = None
+    app.state.batcher = None
+    if MODEL_ARTIFACT:
+        app.state.predictor = PricePredictor.from_artifact(MODEL_ARTIFACT)
+        app.state.batcher = MicroBatcher(app.state.predictor.predict)
+        app.state.batcher.start()
+    yield
+    if app.state.batcher is not None:
+        await app.state.batcher.stop()
+    await app.state.comparables.stop()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="King County Real Estate API",
     description="Welcome to the King County Houses Real Estate API. This API is a user-friendly API that provides access to historical real estate price data in the King County region. It offers developers and real estate professionals a quick and easy way to access accurate and up-to-date information on house prices.",
     version="0.0.1",
+    lifespan=lifespan,
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-models.Base.metadata.create_all(bind=engine)
+create_schema(engine)
 
 
 # Dependency
-def get_db():
-    try:
-        db = SessionLocal()
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 @app.get("/")
@@ -36,12 +117,81 @@ def index() -> Response:
     )
 
 
-@app.get("/houses", response_model=list[schemas.HouseGet])
-def get_all_house(db: Session = Depends(get_db)):
-    """Retrieve a list of all houses from the database.
+def get_cache(request: Request) -> HouseCache:
+    """Return the cache of the house lookups created at startup."""
+    return request.app.state.house_cache
+
+
+def get_comparables(request: Request) -> ComparablesIndex:
+    """Return the comparables index created at startup, for updates of the houses."""
+    return request.app.state.comparables
+
+
+def get_ready_comparables(request: Request) -> ComparablesIndex:
+    """Return the comparables index created at startup, for queries.
+
+    Raises:
+    ------
+    - HTTPException(503): If the index is not built yet."""
+    if not request.app.state.comparables.ready:
+        raise HTTPException(
+            status_code=503, detail="The comparables index is being built"
+        )
+    return request.app.state.comparables
+
+
+def house_filters(
+    zipcode: Optional[int] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    bedrooms: Optional[int] = None,
+    min_last_change: Optional[int] = None,
+    max_last_change: Optional[int] = None,
+) -> list:
+    """The filters of the houses as SQL conditions, backed by the indexes of the houses table.
 
     Parameters:
     -----
+    - zipcode: Only houses in this zipcode.
+    - min_price, max_price: Only houses with a price in this range (inclusive).
+    - bedrooms: Only houses with this number of bedrooms.
+    - min_last_change, max_last_change: Only houses whose last change is in this range of years (inclusive).
+    """
+    return filter_conditions(
+        zipcode, min_price, max_price, bedrooms, min_last_change, max_last_change
+    )
+
+
+@app.get(
+    "/houses",
+    response_model=list[schemas.HouseGet],
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def get_all_house(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    format: Literal["json", "ndjson"] = "json",
+    filters: list = Depends(house_filters),
+    db: AsyncSession = Depends(get_db),
+):
+    """Retrieve the houses from the database, one page at a time ordered by their ID.
+
+    The houses can be filtered by zipcode, price range, number of bedrooms and range of the last change; the
+    filters are applied by the database.
+
+    The pages use keyset pagination: a page holds the houses with an ID greater than `after`, so every page is
+    read from the primary key index no matter how deep it is. If the page is full, the `Link` header contains the
+    URL of the next page. With `format=ndjson` the houses are streamed as newline-delimited JSON, one house per
+    line, read from the database with a server-side cursor, so the memory stays flat for any number of houses.
+
+    Parameters:
+    -----
+    - limit: The maximum number of houses, by default 100 per page and all houses when streaming.
+    - after: Only houses with a greater ID are returned, the ID of the last house of the previous page.
+    - format: `json` for a page of houses, `ndjson` to stream them.
+    - filters: The filters of the houses, see `house_filters`.
     - db: The database session dependency retrieved using the `get_db` function.
 
     Returns:
@@ -50,15 +200,221 @@ def get_all_house(db: Session = Depends(get_db)):
 
     Raises:
     ------
-    - HTTPException(404): If no houses are found in the database."""
-    house = db.query(models.House).all()
-    if not house:
+    - HTTPException(404): If no houses are found in the database (without filters)."""
+    query = (
+        select(models.House.id, *HOUSE_COLUMNS)
+        .where(*filters)
+        .order_by(models.House.id)
+    )
+    if after is not None:
+        query = query.where(models.House.id > after)
+    if format == "ndjson":
+        if limit is not None:
+            query = query.limit(limit)
+        return StreamingResponse(
+            stream_houses(query), media_type="application/x-ndjson"
+        )
+
+    limit = limit or PAGE_SIZE
+    rows = (await db.execute(query.limit(limit))).all()
+    if not rows and after is None and not filters:
+        raise HTTPException(status_code=404, detail="House does not exist")
+    if len(rows) == limit:
+        next_page = request.url.include_query_params(limit=limit, after=rows[-1].id)
+        response.headers["Link"] = f'<{next_page}>; rel="next"'
+    return [dict(row._mapping) for row in rows]
+
+
+async def stream_houses(query):
+    """Yield the houses of 'query' as lines of JSON, fetched in batches from a server-side cursor.
+
+    The generator opens its own connection, because the session of the request is closed before the response
+    is streamed."""
+    columns = [column.key for column in HOUSE_COLUMNS]
+    async with async_engine.connect() as connection:
+        result = await connection.stream(
+            query.execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield "".join(
+                json.dumps(dict(zip(columns, row[1:]))) + "\n" for row in rows
+            )
+
+
+@app.get(
+    "/houses/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type, _ in EXPORT_FORMATS.values()}}
+    },
+)
+async def export_all_houses(
+    format: Literal["parquet", "arrow", "csv"] = "parquet",
+    filters: list = Depends(house_filters),
+):
+    """Export the houses ordered by their ID as a Parquet file, an Arrow IPC stream or a CSV file.
+
+    The houses are read from the database in batches with a server-side cursor and every batch is sent as soon
+    as it is encoded (a Parquet row group or Arrow record batch), so the memory stays flat for any number of
+    houses. The filters are the same as those of `GET /houses`.
+
+    Parameters:
+    -----
+    - format: `parquet`, `arrow` (IPC stream format) or `csv`.
+    - filters: The filters of the houses, see `house_filters`.
+
+    Returns:
+    ------
+    - StreamingResponse: The file with the ID and the columns of the HouseGet schema of every house.
+    """
+    columns = [models.House.id, *HOUSE_COLUMNS]
+    query = select(*columns).where(*filters).order_by(models.House.id)
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export_houses(query, columns, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="houses{extension}"'},
+    )
+
+
+async def comparable_houses(
+    db: AsyncSession, index: ComparablesIndex, point, k: int, exclude: int = None
+) -> list:
+    """The 'k' houses nearest to 'point' in the comparables index, read from the database."""
+    neighbours = index.query(point, k, exclude)
+    ids = [id for id, _, _ in neighbours]
+    rows = (
+        await db.execute(
+            select(models.House.id, *HOUSE_COLUMNS).where(models.House.id.in_(ids))
+        )
+    ).all()
+    houses = {row.id: dict(row._mapping) for row in rows}
+    # Houses deleted by another process since the last rebuild of the index are skipped
+    return [
+        dict(houses[id], distance_km=distance_km, similarity_distance=distance)
+        for id, distance_km, distance in neighbours
+        if id in houses
+    ]
+
+
+@app.get("/houses/comparables", response_model=list[schemas.Comparable])
+async def get_comparables_of_location(
+    lat: float = Query(ge=-90, le=90),
+    long: float = Query(ge=-180, le=180),
+    bedrooms: Optional[int] = None,
+    bathrooms: Optional[float] = None,
+    price: Optional[int] = Query(None, ge=1),
+    k: int = Query(COMPARABLES, ge=1, le=MAX_COMPARABLES),
+    db: AsyncSession = Depends(get_db),
+    index: ComparablesIndex = Depends(get_ready_comparables),
+):
+    """Find the houses most similar to a house at the given coordinates.
+
+    Args:
+    ------
+    - lat, long: The coordinates in degrees.
+    - bedrooms, bathrooms, price: The attributes of the house. Missing attributes are those of an average house.
+    - k: The number of houses.
+
+    Returns:
+    ------
+    - List[Comparable]: The houses ordered by their distance in the index, of the position and the attributes.
+
+    Raises:
+    ------
+    - HTTPException(503): If the comparables index is not built yet.
+    """
+    point = index.point(
+        {
+            "lat": lat,
+            "long": long,
+            "bedrooms": bedrooms,
+            "bathrooms": bathrooms,
+            "price": price,
+        }
+    )
+    return await comparable_houses(db, index, point, k)
+
+
+@app.get("/houses/{id}/comparables", response_model=list[schemas.Comparable])
+async def get_comparables_of_house(
+    id: int,
+    k: int = Query(COMPARABLES, ge=1, le=MAX_COMPARABLES),
+    db: AsyncSession = Depends(get_db),
+    index: ComparablesIndex = Depends(get_ready_comparables),
+):
+    """Find the comparable sales of a house: the houses nearest to it with similar bedrooms, bathrooms and price.
+
+    The houses are found in an in-process spatial index (see comparables.py), which is updated by the changes of
+    the houses and rebuilt in the background.
+
+    Args:
+    ------
+    - id: The ID of the house.
+    - k: The number of houses.
+
+    Returns:
+    ------
+    - List[Comparable]: The houses ordered by their distance in the index, of the position and the attributes,
+    without the house itself.
+
+    Raises:
+    ------
+    - HTTPException(404): If the house with the given ID does not exist.
+    - HTTPException(422): If the house has no coordinates.
+    - HTTPException(503): If the comparables index is not built yet."""
+    point = index.point_of(id)
+    if point is None:
+        # The house is not indexed yet (inserted in bulk) or has no coordinates
+        row = (
+            await db.execute(select(*INDEXED_COLUMNS).where(models.House.id == id))
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="House does not exist")
+        point = index.point(dict(row._mapping))
+        if point is None:
+            raise HTTPException(status_code=422, detail="House has no coordinates")
+    return await comparable_houses(db, index, point, k, exclude=id)
+
+
+@app.get("/houses/{id}", response_model=schemas.HouseGet)
+async def get_house(
+    id: int, db: AsyncSession = Depends(get_db), cache: HouseCache = Depends(get_cache)
+):
+    """Retrieve a house from the cache or else from the database, which then caches it.
+
+    Args:
+    ------
+    - id: The ID of the house.
+    - db: The database session, only used if the house is not cached.
+    - cache: The cache of the house lookups.
+
+    Returns:
+    ----
+    - HouseGet: The house.
+
+    Raises:
+    ----
+    - HTTPException(404): If the house with the given ID does not exist."""
+
+    async def load():
+        row = (
+            await db.execute(select(*HOUSE_COLUMNS).where(models.House.id == id))
+        ).first()
+        return None if row is None else dict(row._mapping)
+
+    house = await cache.get_or_load(id, load)
+    if house is None:
         raise HTTPException(status_code=404, detail="House does not exist")
     return house
 
 
 @app.post("/houses", response_model=schemas.HouseGet)
-def create_house(request: schemas.HousePost, db: Session = Depends(get_db)):
+async def create_house(
+    request: schemas.HousePost,
+    db: AsyncSession = Depends(get_db),
+    index: ComparablesIndex = Depends(get_comparables),
+):
     """Adds a new house to the database.
 
     Args:
@@ -76,15 +432,148 @@ def create_house(request: schemas.HousePost, db: Session = Depends(get_db)):
         zipcode=request.zipcode,
         price=request.price,
         last_change=request.last_change,
+        lat=request.lat,
+        long=request.long,
     )
     db.add(new_house)
-    db.commit()
-    db.refresh(new_house)
+    await mark_stale_zipcodes(db, [new_house.zipcode])
+    await db.commit()
+    index.upsert(new_house.id, request.model_dump())
     return new_house
 
 
-@app.put("/houses/{id}")
-def update_house(id: int, request: schemas.HouseUpdate, db: Session = Depends(get_db)):
+@app.post(
+    "/houses/bulk",
+    response_model=schemas.BulkInsertResult,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/HousePost"},
+                    }
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+            "required": True,
+        }
+    },
+)
+async def create_houses(
+    request: Request, index: ComparablesIndex = Depends(get_comparables)
+):
+    """Adds many houses to the database in batches.
+
+    The body is a JSON array of houses or, with the content type `application/x-ndjson`, one house per line.
+    Invalid houses are skipped and reported, like batches the database rejects, while the other houses are still
+    inserted.
+
+    Args:
+    ------
+    - request: The request, whose body holds the houses based on the HousePost schema.
+
+    Returns:
+    ----
+    - BulkInsertResult: The number of inserted houses and the errors.
+
+    Raises:
+    ----
+    - HTTPException(422): If the body is not valid JSON or NDJSON, or not an array of houses.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            houses = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            houses = json.loads(body)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON: {error}")
+    if not isinstance(houses, list):
+        raise HTTPException(status_code=422, detail="Expected an array of houses")
+    result = await run_in_threadpool(insert_houses, engine, houses)
+    if result["inserted"]:
+        index.request_rebuild()
+    return result
+
+
+@app.patch("/houses/bulk", response_model=schemas.BulkUpdateResult)
+async def update_houses_in_bulk(
+    changes: list[schemas.HouseBulkUpdate],
+    db: AsyncSession = Depends(get_db),
+    cache: HouseCache = Depends(get_cache),
+    index: ComparablesIndex = Depends(get_comparables),
+):
+    """Updates the last year of renovation and the price of many houses, one statement per batch.
+
+    Args:
+    ------
+    - changes: The IDs of the houses and their new values, based on the HouseBulkUpdate schema. If an ID is
+    given more than once, its last change is applied.
+    - db: The database session.
+
+    Returns:
+    ------
+    - BulkUpdateResult: The number of updated houses and the IDs of the houses that do not exist.
+    """
+    changes = list({change.id: change.model_dump() for change in changes}.values())
+    updated = 0
+    missing = []
+    for start in range(0, len(changes), BATCH_SIZE):
+        batch = changes[start : start + BATCH_SIZE]
+        houses = await update_houses(db, batch)
+        await db.commit()
+        ids = [change["id"] for change in batch]
+        await cache.invalidate(*ids)
+        for house in houses:
+            index.upsert(house["id"], house)
+        updated += len(houses)
+        found = {house["id"] for house in houses}
+        missing += [id for id in ids if id not in found]
+    return {"updated": updated, "missing": missing}
+
+
+@app.delete("/houses/bulk", response_model=schemas.BulkDeleteResult)
+async def delete_houses_in_bulk(
+    ids: list[int],
+    db: AsyncSession = Depends(get_db),
+    cache: HouseCache = Depends(get_cache),
+    index: ComparablesIndex = Depends(get_comparables),
+):
+    """Deletes many houses from the database, one statement per batch.
+
+    Args:
+    ------
+    - ids: The IDs of the houses to be deleted.
+    - db: The database session.
+
+    Returns:
+    ------
+    - BulkDeleteResult: The number of deleted houses and the IDs of the houses that do not exist.
+    """
+    ids = list(dict.fromkeys(ids))
+    deleted = 0
+    missing = []
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start : start + BATCH_SIZE]
+        found = set(await delete_houses(db, batch))
+        await db.commit()
+        await cache.invalidate(*batch)
+        for id in found:
+            index.remove(id)
+        deleted += len(found)
+        missing += [id for id in batch if id not in found]
+    return {"deleted": deleted, "missing": missing}
+
+
+@app.put("/houses/{id}", response_model=schemas.HouseGet)
+async def update_house(
+    id: int,
+    request: schemas.HouseUpdate,
+    db: AsyncSession = Depends(get_db),
+    cache: HouseCache = Depends(get_cache),
+    index: ComparablesIndex = Depends(get_comparables),
+):
     """Updates the last year of renovation and the price of the House.
 
     Args:
@@ -95,21 +584,27 @@ def update_house(id: int, request: schemas.HouseUpdate, db: Session = Depends(ge
 
     Returns:
     -----
-    - str: A message indicating the successful update.
+    - HouseGet: The updated house.
 
     Raises:
     -----
     - HTTPException(404): If the house with the given ID does not exist."""
-    house = db.query(models.House).filter(models.House.id == id)
-    if not house.first():
+    houses = await update_houses(db, [dict(request.model_dump(), id=id)])
+    if not houses:
         raise HTTPException(status_code=404, detail="House does not exist")
-    house.update(request.dict())
-    db.commit()
-    return "Updated successfully"
+    await db.commit()
+    await cache.invalidate(id)
+    index.upsert(id, houses[0])
+    return houses[0]
 
 
 @app.delete("/houses/{id}")
-def delete_house(id: int, db: Session = Depends(get_db)):
+async def delete_house(
+    id: int,
+    db: AsyncSession = Depends(get_db),
+    cache: HouseCache = Depends(get_cache),
+    index: ComparablesIndex = Depends(get_comparables),
+):
     """Deletes the house from the database.
 
     Args:
@@ -124,9 +619,194 @@ def delete_house(id: int, db: Session = Depends(get_db)):
     Raises:
     ------
     - HTTPException(404): If the house with the given ID does not exist."""
-    house = db.query(models.House).filter(models.House.id == id)
-    if not house.first():
+    if not await delete_houses(db, [id]):
         raise HTTPException(status_code=404, detail="House does not exist")
-    house.delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
+    await cache.invalidate(id)
+    index.remove(id)
     return "Deleted successfully"
+
+
+async def get_zipcode_stats_rows(request: Request, db: AsyncSession):
+    """Refresh the statistics of the changed zipcodes and return the query of the summary."""
+    async with request.app.state.stats_lock:
+        await refresh_zipcode_stats(db)
+    return select(
+        models.ZipcodeStats.zipcode,
+        models.ZipcodeStats.count,
+        models.ZipcodeStats.mean_price,
+        models.ZipcodeStats.median_price,
+    )
+
+
+@app.get("/stats", response_model=schemas.Stats)
+async def get_stats(request: Request, db: AsyncSession = Depends(get_db)):
+    """Statistics of the prices of all houses.
+
+    Returns:
+    ------
+    - Stats: The number of houses and zipcodes and the mean price, computed by the database from the summary
+    per zipcode."""
+    summary = (await get_zipcode_stats_rows(request, db)).subquery()
+    row = (
+        await db.execute(
+            select(
+                func.coalesce(func.sum(summary.c.count), 0).label("count"),
+                func.count().label("zipcodes"),
+                (
+                    func.sum(summary.c.mean_price * summary.c.count)
+                    / func.sum(summary.c.count)
+                ).label("mean_price"),
+            )
+        )
+    ).one()
+    return dict(row._mapping)
+
+
+@app.get("/stats/zipcodes", response_model=list[schemas.ZipcodeStats])
+async def get_stats_per_zipcode(request: Request, db: AsyncSession = Depends(get_db)):
+    """Statistics of the prices per zipcode.
+
+    The statistics are kept in a summary table in the database. The zipcodes whose houses changed since the last
+    request are recomputed by the database first, so the statistics are always up to date.
+
+    Returns:
+    ------
+    - List[ZipcodeStats]: The number of houses and the mean and median price of every zipcode.
+    """
+    query = await get_zipcode_stats_rows(request, db)
+    rows = await db.execute(query.order_by(models.ZipcodeStats.zipcode))
+    return [dict(row._mapping) for row in rows]
+
+
+@app.get("/stats/zipcodes/{zipcode}", response_model=schemas.ZipcodeStats)
+async def get_stats_of_zipcode(
+    zipcode: int, request: Request, db: AsyncSession = Depends(get_db)
+):
+    """Statistics of the prices of a zipcode.
+
+    Returns:
+    ------
+    - ZipcodeStats: The number of houses and the mean and median price.
+
+    Raises:
+    ------
+    - HTTPException(404): If there are no houses with a price in the zipcode."""
+    query = await get_zipcode_stats_rows(request, db)
+    row = (
+        await db.execute(query.where(models.ZipcodeStats.zipcode == zipcode))
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Zipcode does not exist")
+    return dict(row._mapping)
+
+
+@app.get("/cache", response_model=schemas.CacheStats)
+async def get_cache_stats(cache: HouseCache = Depends(get_cache)):
+    """Counters of the cache of the house lookups for monitoring.
+
+    Returns:
+    ------
+    - CacheStats: The backend and size of the cache and its hits, misses and evictions.
+    """
+    return cache.stats()
+
+
+@app.get("/pool", response_model=schemas.PoolStatus)
+async def get_pool_status():
+    """Statistics of the database connection pools for monitoring.
+
+    Returns:
+    ------
+    - PoolStatus: The pool of the async engine of the endpoints and of the sync engine of the bulk inserts:
+    connections in the pool, checked out and in overflow."""
+    return {
+        "async_pool": pool_status(async_engine.sync_engine),
+        "sync_pool": pool_status(engine),
+    }
+
+
+@app.get("/metrics", response_class=Response)
+async def get_metrics(cache: HouseCache = Depends(get_cache)):
+    """Metrics of the requests, the database and the cache in the Prometheus text format.
+
+    Returns:
+    ------
+    - Response: Latency, status and response size histograms per route, requests in flight, SQL statements and
+    their duration per request and per kind of statement, checkout times and connections of the pools and the
+    lookups of the cache."""
+    for label, pool_engine in (("async", async_engine.sync_engine), ("sync", engine)):
+        for state, value in pool_status(pool_engine).items():
+            if state not in ("pool", "max_overflow"):
+                metrics.POOL_CONNECTIONS.set((label, state), value)
+    stats = cache.stats()
+    for result in ("hits", "misses", "evictions"):
+        metrics.CACHE_LOOKUPS.set((result,), stats[result])
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def get_predictor(request: Request) -> PricePredictor:
+    """Return the price model loaded at startup.
+
+    Raises:
+    ------
+    - HTTPException(503): If no model was loaded (MODEL_ARTIFACT is not set)."""
+    if request.app.state.predictor is None:
+        raise HTTPException(status_code=503, detail="No price model loaded")
+    return request.app.state.predictor
+
+
+@app.post("/predict", response_model=schemas.PricePrediction)
+async def predict_price(
+    house: schemas.HouseFeatures,
+    request: Request,
+    predictor: PricePredictor = Depends(get_predictor),
+):
+    """Predicts the price of a house.
+
+    Concurrent requests are grouped into batches that the model predicts together (see predictor.MicroBatcher).
+
+    Args:
+    ------
+    - house: The features of the house, based on the HouseFeatures schema.
+
+    Returns:
+    ------
+    - PricePrediction: The predicted price.
+
+    Raises:
+    ------
+    - HTTPException(422): If the ratio of bathrooms to bedrooms is out of the range the model was trained on.
+    - HTTPException(503): If no model was loaded."""
+    price = await request.app.state.batcher.submit(house.model_dump())
+    if price is None:
+        raise HTTPException(
+            status_code=422,
+            detail="The ratio of bathrooms to bedrooms must be between 0.1 and 2",
+        )
+    return {"price": price}
+
+
+@app.post("/predict/batch", response_model=list[schemas.PricePrediction])
+async def predict_prices(
+    houses: list[schemas.HouseFeatures],
+    predictor: PricePredictor = Depends(get_predictor),
+):
+    """Predicts the prices of several houses in one call.
+
+    Args:
+    ------
+    - houses: The features of the houses, based on the HouseFeatures schema.
+
+    Returns:
+    ------
+    - List[PricePrediction]: The predicted prices in the order of the houses, null for houses whose ratio of
+    bathrooms to bedrooms is out of the range the model was trained on.
+
+    Raises:
+    ------
+    - HTTPException(503): If no model was loaded."""
+    prices = await run_in_threadpool(
+        predictor.predict, [house.model_dump() for house in houses]
+    )
+    return [{"price": price} for price in prices]
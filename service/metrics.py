@@ -0,0 +1,278 @@
+"""Metrics of the requests and the database in the Prometheus text format, served by GET /metrics.
+
+MetricsMiddleware records the latency, status and response size of every request per route (the path template,
+e.g. /houses/{id}, so the number of series stays bounded) and the requests in flight. The SQLAlchemy event
+hooks of database.py count the statements of the request and their duration, which the middleware records per
+route when the request ends, and time the checkouts of connections from the pools.
+
+Collection is cheap and takes no locks: the metrics are plain counters in dicts and lists that are only updated
+by the event loop, apart from the statements of the bulk inserts, which run in worker threads, where a
+concurrent increment may rarely be lost.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+
+# Buckets of the histograms in seconds, bytes and statements
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = tuple(64 * 4**i for i in range(11))
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Kinds of statements the durations are recorded for, other statements count as OTHER
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric with a value per combination of the values of its labels, which are passed as a tuple.
+
+    Parameters:
+    ----------
+    name : str
+        Name of the metric.
+    help : str
+        Description of the metric.
+    labelnames : tuple
+        Names of the labels.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def set(self, labels: tuple, value: float) -> None:
+        """Set the value of 'labels', for values that are collected when the metrics are read."""
+        self._values[labels] = value
+
+    def samples(self) -> list:
+        """The lines of the values of the metric."""
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in list(self._values.items())
+        ]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """A histogram of observations with the upper bounds 'buckets'."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            # The observations per bucket (the last one is +Inf) and their sum
+            series = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> list:
+        lines = []
+        bounds = self.buckets + (float("inf"),)
+        for labels, series in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}"
+            )
+            lines.append(
+                f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+            )
+        return lines
+
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Requests by route and status.",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duration of the requests until their response was sent.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of the bodies of the responses.",
+    ("method", "route"),
+    SIZE_BUCKETS,
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled.")
+REQUEST_STATEMENTS = Histogram(
+    "db_statements_per_request",
+    "SQL statements executed by a request.",
+    ("method", "route"),
+    STATEMENT_BUCKETS,
+)
+REQUEST_DB_DURATION = Histogram(
+    "db_duration_per_request_seconds",
+    "Time a request spent executing SQL statements.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Duration of the SQL statements by kind.",
+    ("kind",),
+    LATENCY_BUCKETS,
+)
+POOL_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool, including waits for a free connection and new connections.",
+    ("engine",),
+    LATENCY_BUCKETS,
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of the pools by state.",
+    ("engine", "state"),
+)
+CACHE_LOOKUPS = Counter(
+    "house_cache_lookups_total",
+    "Lookups of houses in the cache by result.",
+    ("result",),
+)
+
+REGISTRY = [
+    REQUESTS,
+    REQUEST_DURATION,
+    RESPONSE_SIZE,
+    IN_FLIGHT,
+    REQUEST_STATEMENTS,
+    REQUEST_DB_DURATION,
+    STATEMENT_DURATION,
+    POOL_CHECKOUT_DURATION,
+    POOL_CONNECTIONS,
+    CACHE_LOOKUPS,
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStatements:
+    """The number and duration of the SQL statements of one request."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The statements of the current request, None outside of requests
+current_statements = ContextVar("current_statements", default=None)
+
+
+def record_statement(statement: str, seconds: float) -> None:
+    """Record an executed SQL statement for its kind and the current request."""
+    kind = (statement.split(None, 1) or [""])[0].upper()
+    STATEMENT_DURATION.observe((kind if kind in STATEMENT_KINDS else "OTHER",), seconds)
+    statements = current_statements.get()
+    if statements is not None:
+        statements.count += 1
+        statements.seconds += seconds
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the metrics of the HTTP requests. A request ends when the last chunk of its
+    response is sent, so streamed responses are measured completely."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        statements = RequestStatements()
+        token = current_statements.set(statements)
+        response = {"status": 500, "size": 0}
+
+        async def send_and_measure(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            IN_FLIGHT.inc(amount=-1)
+            current_statements.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            REQUESTS.inc(labels + (response["status"],))
+            REQUEST_DURATION.observe(labels, time.perf_counter() - start)
+            RESPONSE_SIZE.observe(labels, response["size"])
+            REQUEST_STATEMENTS.observe(labels, statements.count)
+            REQUEST_DB_DURATION.observe(labels, statements.seconds)
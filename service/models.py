@@ -1,6 +1,6 @@
 from database import Base
 from pydantic import BaseModel
-from sqlalchemy import Column, Float, Integer
+from sqlalchemy import Column, Float, Index, Integer
 
 
 class House(Base):
@@ -12,3 +12,32 @@ class House(Base):
     zipcode = Column(Integer)
     price = Column(Integer)
     last_change = Column(Integer)
+    lat = Column(Float)
+    long = Column(Float)
+
+    # Indexes of the filters of GET /houses. The price is the second column, so the price range of a zipcode or
+    # a number of bedrooms is one index range, and the statistics read the prices of a zipcode in order.
+    __table_args__ = (
+        Index("ix_houses_zipcode_price", "zipcode", "price"),
+        Index("ix_houses_bedrooms_price", "bedrooms", "price"),
+        Index("ix_houses_price", "price"),
+        Index("ix_houses_last_change", "last_change"),
+    )
+
+
+class ZipcodeStats(Base):
+    """Summary of the prices per zipcode, refreshed from the houses of the zipcodes in StaleZipcode."""
+
+    __tablename__ = "zipcode_stats"
+    zipcode = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    mean_price = Column(Float)
+    median_price = Column(Float)
+
+
+class StaleZipcode(Base):
+    """Zipcodes whose houses changed since the last refresh of ZipcodeStats, one row per change."""
+
+    __tablename__ = "stale_zipcodes"
+    id = Column(Integer, primary_key=True)
+    zipcode = Column(Integer, nullable=False)
@@ -0,0 +1,187 @@
+"""Price predictions of the King County model for the API.
+
+The fitted preprocessor and the model are loaded at startup from the artifact in MODEL_ARTIFACT, written by
+pipeline/train_model.py (see pipeline/artifact.py). The pipeline modules are imported from PIPELINE_DIR.
+
+The features of the houses are computed in the row mode of the pipeline (pipeline/row_features.py), which gives
+exactly the features of the fitted preprocessor in microseconds per house without building a DataFrame.
+
+Single predictions are grouped by the MicroBatcher: concurrent requests wait at most PREDICT_MAX_WAIT_MS for
+each other and are predicted together (at most PREDICT_MAX_BATCH_SIZE houses) in one vectorized call in a worker
+thread, so the event loop keeps serving requests and the overhead of scikit-learn is paid once per batch.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_ARTIFACT = os.getenv("MODEL_ARTIFACT")
+PIPELINE_DIR = os.getenv(
+    "PIPELINE_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipeline"
+    ),
+)
+MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "64"))
+MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+
+
+class PricePredictor:
+    """Predicts the price of houses with a fitted preprocessor and the model trained on its output.
+
+    Parameters:
+    ----------
+    preprocessor : PreprocessingKingCountyData
+        The preprocessor, fitted on the columns in its INPUT_COLUMNS (like in train_model.py).
+    model : estimator
+        Regression model of the price. It gets the preprocessed features (all columns except 'price') as float64,
+        in the order it was trained with.
+    """
+
+    def __init__(self, preprocessor, model):
+        from row_features import RowFeaturizer
+
+        self.preprocessor = preprocessor
+        self.model = model
+        self.featurizer = RowFeaturizer(preprocessor)
+        if hasattr(model, "feature_names_in_"):
+            self.features = list(model.feature_names_in_)
+        else:
+            self.features = [
+                column for column in self.featurizer.features if column != "price"
+            ]
+
+    @classmethod
+    def from_artifact(cls, path: str) -> "PricePredictor":
+        """Load the preprocessor and the model from the artifact 'path'."""
+        if PIPELINE_DIR not in sys.path:
+            sys.path.append(PIPELINE_DIR)
+        from preprocessing_king_county import PreprocessingKingCountyData
+
+        preprocessor = PreprocessingKingCountyData.load(path)
+        if preprocessor.model_ is None:
+            raise ValueError(f"The artifact {path} contains no model")
+        return cls(preprocessor, preprocessor.model_)
+
+    def predict(self, houses: list) -> list:
+        """Predict the prices of 'houses' (dicts of the raw King County columns) in one call of the model.
+
+        Returns:
+        ----------
+        prices : list
+            The predicted price of every house, None for houses the data cleaning removes
+            (bathroom/bedroom ratio out of range).
+        """
+        if not houses:
+            return []
+        # 'price' is missing in the request and treated as NaN, 'sqft_basement' is computed by the row mode
+        matrix, kept = self.featurizer.feature_matrix(houses, self.features)
+        prices = np.full(len(houses), np.nan)
+        if kept.any():
+            prices[kept] = self.model.predict(
+                pd.DataFrame(matrix[kept], columns=self.features)
+            )
+        return [None if np.isnan(price) else float(price) for price in prices]
+
+
+class MicroBatcher:
+    """Groups concurrent single requests into batches that are evaluated by one call of 'predict_batch'.
+
+    A batch is evaluated as soon as it holds 'max_batch_size' items or its oldest item waited 'max_wait_ms'.
+    'predict_batch' runs in a worker thread, one batch at a time; requests arriving meanwhile form the next batch.
+
+    Parameters:
+    ----------
+    predict_batch : callable
+        Function mapping a list of items to the list of their results.
+    max_batch_size : int
+        Maximum number of items per batch.
+    max_wait_ms : float
+        Maximum time in milliseconds an item waits for others before its batch is evaluated.
+    """
+
+    def __init__(
+        self,
+        predict_batch,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("'max_batch_size' must be at least 1")
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending = []
+        self._worker = None
+
+    def start(self) -> None:
+        """Start evaluating batches, must be called from the event loop."""
+        self._has_items = asyncio.Event()
+        self._is_full = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop evaluating batches, pending requests fail with a RuntimeError."""
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        for _, _, future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("The batcher was stopped"))
+        self._pending = []
+
+    async def submit(self, item):
+        """Add 'item' to the next batch and return its result."""
+        if self._worker is None or self._worker.done():
+            raise RuntimeError("The batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, time.monotonic(), future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._is_full.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_items.wait()
+            wait = self._pending[0][1] + self.max_wait_ms / 1000 - time.monotonic()
+            if wait > 0 and not self._is_full.is_set():
+                try:
+                    await asyncio.wait_for(self._is_full.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._is_full.clear()
+            await self._evaluate(batch)
+
+    async def _evaluate(self, batch: list) -> None:
+        items = [item for item, _, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, self.predict_batch, items
+            )
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("The batcher was stopped"))
+            raise
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import BaseModel, Field, confloat, conint
+from pydantic import BaseModel, ConfigDict, Field, confloat, conint
 
 
 class HousePost(BaseModel):
@@ -22,9 +22,14 @@ class HousePost(BaseModel):
     last_change: Optional[conint(ge=1000, le=9999)] = Field(
         description="Year of the last renovation of the house. It indicates the most recent year when renovations or improvements were made.",
     )
+    lat: Optional[confloat(ge=-90.0, le=90.0)] = Field(
+        None, description="Latitude of the house in degrees"
+    )
+    long: Optional[confloat(ge=-180.0, le=180.0)] = Field(
+        None, description="Longitude of the house in degrees"
+    )
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class HouseGet(BaseModel):
@@ -46,9 +51,10 @@ class HouseGet(BaseModel):
     last_change: Optional[int] = Field(
         description="Year of the last renovation of the house. It indicates the most recent year when renovations or improvements were made.",
     )
+    lat: Optional[float] = Field(None, description="Latitude of the house in degrees")
+    long: Optional[float] = Field(None, description="Longitude of the house in degrees")
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class HouseUpdate(BaseModel):
@@ -60,5 +66,136 @@ class HouseUpdate(BaseModel):
         description="Year of the last renovation of the house. It indicates the most recent year when renovations or improvements were made.",
     )
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class HouseFeatures(BaseModel):
+    bedrooms: conint(gt=0) = Field(
+        description="It represents the count of separate rooms intended for sleeping"
+    )
+    bathrooms: confloat(gt=0.0) = Field(
+        description="It represents the count of separate areas containing toilet and bathing facilities"
+    )
+    sqft_living: conint(gt=0) = Field(
+        description="Square footage of the interior living space"
+    )
+    sqft_lot: conint(gt=0) = Field(description="Square footage of the land space")
+    floors: confloat(ge=0.0) = Field(
+        description="It represents the count of levels or stories in the building structure"
+    )
+    waterfront: conint(ge=0, le=1) = Field(
+        0, description="1 if the house overlooks the waterfront, otherwise 0"
+    )
+    view: conint(ge=0, le=4) = Field(
+        0, description="How good the view of the property is, from 0 to 4"
+    )
+    condition: conint(ge=1, le=5) = Field(
+        description="Condition of the house, from 1 to 5"
+    )
+    grade: conint(ge=1, le=13) = Field(
+        description="Quality of the construction and design, from 1 to 13"
+    )
+    sqft_above: conint(ge=0) = Field(
+        description="Square footage of the interior living space above ground level"
+    )
+    yr_built: conint(ge=1000, le=9999) = Field(description="Year the house was built")
+    yr_renovated: conint(ge=0, le=9999) = Field(
+        0,
+        description="Year of the last renovation of the house, 0 if it was never renovated",
+    )
+    zipcode: conint(ge=10000, le=99999) = Field(
+        description="The 5-digit ZIP code representing the location in King County"
+    )
+    lat: confloat(ge=-90.0, le=90.0) = Field(description="Latitude of the house")
+    long: confloat(ge=-180.0, le=180.0) = Field(description="Longitude of the house")
+
+
+class PricePrediction(BaseModel):
+    price: Optional[float] = Field(
+        description="Predicted price of the house. Null for houses the model does not predict, because their "
+        "ratio of bathrooms to bedrooms is out of the range of the training data (at most 0.1 or at least 2)."
+    )
+
+
+class BulkError(BaseModel):
+    batch: int = Field(description="Number of the batch, counted from 0")
+    row: Optional[int] = Field(
+        description="Position of the invalid house in the request, null if the whole batch could not be inserted"
+    )
+    detail: str = Field(description="Description of the error")
+
+
+class BulkInsertResult(BaseModel):
+    inserted: int = Field(description="Number of inserted houses")
+    errors: list[BulkError] = Field(
+        description="Invalid houses, which were skipped, and batches that could not be inserted"
+    )
+
+
+class ConnectionPool(BaseModel):
+    pool: str = Field(description="Class of the connection pool")
+    size: Optional[int] = Field(None, description="Number of connections kept open")
+    checked_in: Optional[int] = Field(None, description="Idle connections in the pool")
+    checked_out: Optional[int] = Field(None, description="Connections in use")
+    overflow: Optional[int] = Field(
+        None, description="Connections opened beyond the size of the pool"
+    )
+    max_overflow: Optional[int] = Field(
+        None, description="Maximum number of overflow connections"
+    )
+
+
+class PoolStatus(BaseModel):
+    async_pool: ConnectionPool = Field(
+        description="Pool of the async engine of the endpoints"
+    )
+    sync_pool: ConnectionPool = Field(description="Pool of the bulk inserts")
+
+
+class CacheStats(BaseModel):
+    backend: str = Field(description="Class of the cache backend")
+    size: Optional[int] = Field(
+        description="Number of cached houses, null if the backend does not report it"
+    )
+    hits: int = Field(description="Lookups answered from the cache")
+    misses: int = Field(description="Lookups that read the database")
+    evictions: int = Field(
+        description="Houses removed because the cache was full or they expired"
+    )
+
+
+class HouseBulkUpdate(HouseUpdate):
+    id: int = Field(description="ID of the house to be updated")
+
+
+class BulkUpdateResult(BaseModel):
+    updated: int = Field(description="Number of updated houses")
+    missing: list[int] = Field(description="IDs of the houses that do not exist")
+
+
+class BulkDeleteResult(BaseModel):
+    deleted: int = Field(description="Number of deleted houses")
+    missing: list[int] = Field(description="IDs of the houses that do not exist")
+
+
+class ZipcodeStats(BaseModel):
+    zipcode: int = Field(description="The 5-digit ZIP code")
+    count: int = Field(description="Number of houses with a price in the zipcode")
+    mean_price: float = Field(description="Mean price of the houses")
+    median_price: float = Field(description="Median price of the houses")
+
+
+class Stats(BaseModel):
+    count: int = Field(description="Number of houses with a price")
+    zipcodes: int = Field(description="Number of zipcodes with houses")
+    mean_price: Optional[float] = Field(
+        description="Mean price of the houses, null if there are none"
+    )
+
+
+class Comparable(HouseGet):
+    id: int = Field(description="ID of the house")
+    distance_km: float = Field(description="Distance to the house in kilometers")
+    similarity_distance: float = Field(
+        description="Distance in the index, of the position and the attributes, by which the houses are ordered"
+    )
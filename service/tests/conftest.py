@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_DIR = os.path.join(SERVICE_DIR, "..", "pipeline")
+DATA_PATH = os.path.join(
+    SERVICE_DIR, "..", "data", "King_County_House_prices_dataset.csv"
+)
+
+# The in-process tests run the app against a SQLite database instead of PostgreSQL. It is stored in a file,
+# because every connection to an in-memory database gets a database of its own.
+os.environ.setdefault(
+    "DB_CONN", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'houses.db')}"
+)
+
+# The service and pipeline modules import each other as top-level modules
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, PIPELINE_DIR)
@@ -0,0 +1,80 @@
+import asyncio
+
+import fakeredis
+from cache import LRUCache, RedisCache
+
+
+def test_lru_cache_evicts_the_least_recently_used_and_expired_houses(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+
+    async def run():
+        cache = LRUCache(max_size=2, ttl=10)
+        await cache.set(1, {"price": 1})
+        await cache.set(2, {"price": 2})
+        assert await cache.get(1) == {"price": 1}
+        await cache.set(3, {"price": 3})
+        assert await cache.get(2) is None
+        assert cache.size() == 2
+        now[0] = 11
+        assert await cache.get(1) is None
+        return cache.stats()
+
+    assert asyncio.run(run()) == {
+        "backend": "LRUCache",
+        "size": 1,
+        "hits": 0,
+        "misses": 0,
+        "evictions": 2,
+    }
+
+
+def test_house_loaded_during_an_invalidation_is_not_cached():
+    async def run():
+        cache = LRUCache()
+
+        async def load_stale():
+            # The house changes while it is read from the database
+            await cache.invalidate(1)
+            return {"price": 1}
+
+        assert await cache.get_or_load(1, load_stale) == {"price": 1}
+        assert await cache.get(1) is None
+
+        async def load():
+            return {"price": 2}
+
+        await cache.get_or_load(1, load)
+        assert await cache.get_or_load(1, load_stale) == {"price": 2}
+        return cache.hits, cache.misses
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_redis_cache_does_not_cache_a_house_invalidated_by_another_process():
+    server = fakeredis.FakeServer()
+
+    def redis_cache():
+        cache = RedisCache("redis://localhost:6379/0")
+        cache.client = fakeredis.FakeAsyncRedis(server=server)
+        return cache
+
+    async def run():
+        cache, other_process = redis_cache(), redis_cache()
+
+        async def load_stale():
+            # Another process changes the house while it is read from the database
+            await other_process.invalidate(1)
+            return {"price": 1}
+
+        assert await cache.get_or_load(1, load_stale) == {"price": 1}
+        assert await other_process.get(1) is None
+
+        async def load():
+            return {"price": 2}
+
+        await cache.get_or_load(1, load)
+        assert await other_process.get_or_load(1, load_stale) == {"price": 2}
+        return cache.misses, other_process.hits
+
+    assert asyncio.run(run()) == (2, 1)
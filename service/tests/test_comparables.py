@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import main
+import models
+import numpy as np
+from comparables import INDEX_COLUMNS, ComparablesIndex
+from database import SessionLocal
+from sqlalchemy import func, select
+from test_houses import client  # noqa: F401
+
+
+def random_houses(rng, ids):
+    return {
+        id: {
+            "id": id,
+            "lat": 47.2 + rng.random() * 0.6,
+            "long": -122.4 + rng.random() * 0.6,
+            "bedrooms": int(rng.integers(1, 6)),
+            "bathrooms": float(rng.integers(2, 8)) / 2,
+            "price": int(rng.integers(100_000, 2_000_000)),
+        }
+        for id in ids
+    }
+
+
+def as_array(houses):
+    return np.array(
+        [[house[column] for column in INDEX_COLUMNS] for house in houses.values()],
+        dtype=float,
+    )
+
+
+def nearest(index, houses, point, k, exclude=None):
+    distances = {
+        id: np.linalg.norm(index.point(house) - point)
+        for id, house in houses.items()
+        if id != exclude
+    }
+    return sorted(distances, key=distances.get)[:k]
+
+
+def test_incremental_changes_match_a_brute_force_search():
+    rng = np.random.default_rng(0)
+    houses = random_houses(rng, range(1, 501))
+    index = ComparablesIndex(max_delta=10_000)
+
+    async def load():
+        return as_array(houses)
+
+    asyncio.run(index.rebuild(load))
+    for id in range(1, 100, 3):
+        index.remove(id)
+        del houses[id]
+    for id, house in random_houses(rng, range(50, 600, 5)).items():
+        index.upsert(id, house)
+        houses[id] = house
+    assert len(index) == len(houses)
+
+    for id in (2, 50, 595):
+        point = index.point_of(id)
+        neighbours = index.query(point, 10, exclude=id)
+        assert [id for id, _, _ in neighbours] == nearest(
+            index, houses, point, 10, exclude=id
+        )
+        assert all(a[2] <= b[2] for a, b in zip(neighbours, neighbours[1:]))
+
+
+def test_changes_during_a_rebuild_are_kept():
+    rng = np.random.default_rng(1)
+    houses = random_houses(rng, range(1, 101))
+    index = ComparablesIndex()
+    # Changes before the first build
+    index.upsert(102, dict(houses[3], id=102))
+
+    async def load():
+        # Changes made while the houses are read
+        index.remove(1)
+        index.upsert(101, dict(houses[2], id=101))
+        return as_array(houses)
+
+    assert not index.ready
+    asyncio.run(index.rebuild(load))
+    assert index.ready
+    assert index.point_of(102) is not None
+    assert index.point_of(1) is None
+    assert index.point_of(101) is not None
+    neighbours = index.query(index.point_of(2), 1, exclude=2)
+    assert neighbours[0][0] == 101
+    assert neighbours[0][1] == 0
+
+
+def last_id():
+    with SessionLocal() as db:
+        return db.scalar(select(func.max(models.House.id)))
+
+
+def wait_until_indexed(client):
+    for _ in range(100):
+        if client.get("/houses/1/comparables").status_code != 503:
+            return
+        time.sleep(0.05)
+    raise TimeoutError("The comparables index was not built")
+
+
+def test_comparables_endpoints_follow_the_changes(client):
+    wait_until_indexed(client)
+
+    def ids(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return [house["id"] for house in response.json()]
+
+    # House 11 is at 47.6 with one bedroom, house 12 is 1.1 km north with two bedrooms
+    houses = client.get("/houses/11/comparables?k=3").json()
+    assert len(houses) == 3
+    assert houses[0]["id"] == 12
+    assert 1.1 < houses[0]["distance_km"] < 1.12
+    assert 11 not in ids("/houses/11/comparables?k=24")
+
+    twin = client.post("/houses", json=client.get("/houses/11").json()).json()
+    twin_id = last_id()
+    assert ids("/houses/11/comparables?k=1") == [twin_id]
+    location = "lat=47.6&long=-122.3&bedrooms=1&bathrooms=1.5&price=100010"
+    assert set(ids(f"/houses/comparables?{location}&k=2")) == {11, twin_id}
+
+    client.put(f"/houses/{twin_id}", json={"price": 2_000_000})
+    assert ids("/houses/11/comparables?k=1") == [12]
+    client.delete(f"/houses/{twin_id}")
+    assert twin_id not in ids("/houses/11/comparables?k=25")
+
+    house = dict(twin, lat=None, long=None)
+    assert client.post("/houses", json=house).status_code == 200
+    assert client.get(f"/houses/{last_id()}/comparables").status_code == 422
+    assert client.get("/houses/999/comparables").status_code == 404
+
+
+def test_comparables_are_unavailable_until_the_index_is_built(client, monkeypatch):
+    monkeypatch.setattr(main.app.state.comparables, "ready", False)
+    response = client.get("/houses/comparables?lat=47.6&long=-122.3")
+    assert response.status_code == 503
+    # Houses can still be changed, the changes are applied by the build
+    assert client.delete("/houses/2").status_code == 200
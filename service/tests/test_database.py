@@ -0,0 +1,29 @@
+import database
+from database import async_database_url, engine_options
+
+
+def test_async_url_uses_the_async_driver():
+    assert (
+        async_database_url("postgresql://user:secret@db:5432/houses")
+        == "postgresql+asyncpg://user:secret@db:5432/houses"
+    )
+    assert (
+        async_database_url("postgresql+psycopg2://db/houses")
+        == "postgresql+asyncpg://db/houses"
+    )
+    assert async_database_url("sqlite:///houses.db") == "sqlite+aiosqlite:///houses.db"
+
+
+def test_engine_options_from_the_environment(monkeypatch):
+    monkeypatch.setattr(database, "POOL_SIZE", 20)
+    monkeypatch.setattr(database, "STATEMENT_TIMEOUT_MS", "5000")
+
+    options = engine_options("postgresql://db/houses", is_async=True)
+    assert options["pool_size"] == 20
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert engine_options("postgresql://db/houses")["connect_args"] == {
+        "options": "-c statement_timeout=5000"
+    }
+    # An in-memory SQLite database keeps its own pool and has no statement timeout
+    assert "pool_size" not in engine_options("sqlite://")
+    assert "connect_args" not in engine_options("sqlite:///houses.db")
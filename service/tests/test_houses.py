@@ -0,0 +1,323 @@
+import asyncio
+import io
+import json
+
+import database
+import main
+import models
+import pandas as pd
+import pytest
+from pyarrow import ipc
+from conftest import DATA_PATH
+from database import SessionLocal
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from bulk import insert_houses
+from crud import refresh_zipcode_stats
+from load_houses import load_houses
+
+
+def clear_tables():
+    with SessionLocal() as db:
+        for model in (models.House, models.ZipcodeStats, models.StaleZipcode):
+            db.query(model).delete()
+        db.commit()
+
+
+@pytest.fixture
+def client():
+    clear_tables()
+    houses = [
+        {
+            "bedrooms": i % 5 + 1,
+            "bathrooms": 1.5,
+            "floors": 1.0,
+            "zipcode": 98000 + i,
+            "price": 100000 + i,
+            "last_change": None if i % 2 else 2000,
+            "lat": 47.5 + i / 100,
+            "long": -122.3,
+        }
+        for i in range(25)
+    ]
+    insert_houses(database.engine, houses)
+    with TestClient(main.app) as client:
+        yield client
+    clear_tables()
+
+
+def test_pages_follow_the_link_header(client):
+    zipcodes = []
+    url = "/houses?limit=10"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        zipcodes += [house["zipcode"] for house in response.json()]
+        url = response.links.get("next", {}).get("url")
+
+    assert zipcodes == [98000 + i for i in range(25)]
+    assert client.get("/houses").json()[0] == {
+        "bedrooms": 1,
+        "bathrooms": 1.5,
+        "floors": 1.0,
+        "zipcode": 98000,
+        "price": 100000,
+        "last_change": 2000,
+        "lat": 47.5,
+        "long": -122.3,
+    }
+
+
+def test_houses_are_streamed_as_ndjson(client):
+    first_page = client.get("/houses?limit=10").json()
+    after = client.get("/houses?limit=3").links["next"]["url"].split("after=")[1]
+
+    response = client.get("/houses?format=ndjson")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    houses = [json.loads(line) for line in response.text.splitlines()]
+    assert len(houses) == 25
+    assert houses[:10] == first_page
+
+    response = client.get(f"/houses?format=ndjson&after={after}&limit=2")
+    assert [json.loads(line) for line in response.text.splitlines()] == first_page[3:5]
+
+
+def test_empty_table_is_not_found():
+    clear_tables()
+    with TestClient(main.app) as client:
+        assert client.get("/houses").status_code == 404
+
+
+def test_bulk_insert_skips_and_reports_invalid_houses(client):
+    house = {
+        "bedrooms": 3,
+        "bathrooms": 2.0,
+        "floors": 1.0,
+        "zipcode": 98100,
+        "price": 400000,
+        "last_change": None,
+    }
+    houses = [house, dict(house, bedrooms=0), dict(house, zipcode=98101), 17]
+
+    result = client.post("/houses/bulk", json=houses).json()
+    assert result["inserted"] == 2
+    assert [error["row"] for error in result["errors"]] == [1, 3]
+    assert "bedrooms" in result["errors"][0]["detail"]
+
+    body = "\n".join(json.dumps(dict(house, zipcode=98200 + i)) for i in range(3))
+    response = client.post(
+        "/houses/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json() == {"inserted": 3, "errors": []}
+    zipcodes = [h["zipcode"] for h in client.get("/houses?after=25").json()]
+    assert zipcodes == [98100, 98101, 98200, 98201, 98202]
+
+    assert client.post("/houses/bulk", content="[{").status_code == 422
+
+
+@pytest.mark.parametrize("clean", [False, True])
+def test_csv_loader_reports_errors_per_batch(client, tmp_path, clean):
+    raw = pd.read_csv(DATA_PATH, nrows=30)
+    raw.loc[12, "bedrooms"] = 0
+    raw.to_csv(tmp_path / "houses.csv", index=False)
+
+    result = load_houses(str(tmp_path / "houses.csv"), clean=clean, batch_size=8)
+
+    with SessionLocal() as db:
+        loaded = db.query(models.House).filter(models.House.id > 25).all()
+    if clean:
+        # The cleaning removes the house without bedrooms (and houses with many bathrooms per bedroom)
+        assert result["errors"] == []
+        assert result["inserted"] == len(loaded) < 30
+        assert all(house.last_change for house in loaded)
+    else:
+        assert result["inserted"] == len(loaded) == 29
+        assert [(e["batch"], e["row"]) for e in result["errors"]] == [(1, 12)]
+        assert loaded[0].price == round(raw.loc[0, "price"])
+
+
+def test_houses_are_updated_and_deleted(client):
+    created = client.post(
+        "/houses",
+        json={
+            "bedrooms": 2,
+            "bathrooms": 1.0,
+            "floors": 1.0,
+            "zipcode": 98300,
+            "price": 250000,
+            "last_change": None,
+        },
+    )
+    assert created.status_code == 200
+
+    assert client.put("/houses/26", json={"price": 260000}).status_code == 200
+    assert client.get("/houses?after=25").json()[0]["price"] == 260000
+    assert client.delete("/houses/26").status_code == 200
+    assert client.get("/houses?after=25").json() == []
+    assert client.delete("/houses/26").status_code == 404
+    assert client.put("/houses/26", json={"price": 1}).status_code == 404
+
+    pools = client.get("/pool").json()
+    assert pools["async_pool"]["checked_out"] == 0
+    assert pools["async_pool"]["size"] == 5
+
+
+def test_house_lookups_are_cached_until_the_house_changes(client):
+    stats = client.get("/cache").json()
+    assert client.get("/houses/3").json()["zipcode"] == 98002
+    assert client.get("/houses/3").json()["zipcode"] == 98002
+    assert client.get("/houses/99").status_code == 404
+
+    new_stats = client.get("/cache").json()
+    assert new_stats["hits"] - stats["hits"] == 1
+    assert new_stats["misses"] - stats["misses"] == 2
+
+    client.put("/houses/3", json={"price": 123456})
+    assert client.get("/houses/3").json()["price"] == 123456
+    client.delete("/houses/3")
+    assert client.get("/houses/3").status_code == 404
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_bulk_updates_and_deletes(client, monkeypatch, returning):
+    dialect = database.async_engine.dialect
+    monkeypatch.setattr(dialect, "update_returning", returning)
+    monkeypatch.setattr(dialect, "delete_returning", returning)
+    monkeypatch.setattr(main, "BATCH_SIZE", 2)
+    assert client.get("/houses/1").json()["price"] == 100000
+
+    updated = client.put("/houses/1", json={"price": 5, "last_change": 2020})
+    assert updated.json()["price"] == 5
+    assert updated.json()["last_change"] == 2020
+    changes = [
+        {"id": 2, "price": 7},
+        {"id": 99, "price": 8},
+        {"id": 1, "price": 9, "last_change": 1999},
+        {"id": 2, "price": 10},
+    ]
+    result = client.patch("/houses/bulk", json=changes).json()
+    assert result == {"updated": 2, "missing": [99]}
+    houses = client.get("/houses?limit=3").json()
+    assert [(house["price"], house["last_change"]) for house in houses] == [
+        (9, 1999),
+        (10, None),
+        (100002, 2000),
+    ]
+
+    result = client.request("DELETE", "/houses/bulk", json=[1, 3, 99, 5]).json()
+    assert result == {"deleted": 3, "missing": [99]}
+    assert client.get("/houses/1").status_code == 404
+    assert [house["zipcode"] for house in client.get("/houses?limit=3").json()] == [
+        98001,
+        98003,
+        98005,
+    ]
+
+
+def test_filters_are_applied_by_the_database(client):
+    def zipcodes(query):
+        return [
+            house["zipcode"] - 98000 for house in client.get(f"/houses?{query}").json()
+        ]
+
+    assert zipcodes("zipcode=98003") == [3]
+    assert zipcodes("min_price=100020&max_price=100022") == [20, 21, 22]
+    assert zipcodes("bedrooms=2&min_price=100010") == [11, 16, 21]
+    assert zipcodes("min_last_change=2000&max_price=100004") == [0, 2, 4]
+    assert client.get("/houses?zipcode=12345").json() == []
+    lines = client.get("/houses?format=ndjson&bedrooms=5").text.splitlines()
+    assert [json.loads(line)["zipcode"] for line in lines] == [
+        98004,
+        98009,
+        98014,
+        98019,
+        98024,
+    ]
+
+
+@pytest.mark.parametrize(
+    "format, read",
+    [
+        ("parquet", pd.read_parquet),
+        ("arrow", lambda file: ipc.open_stream(file).read_pandas()),
+        ("csv", pd.read_csv),
+    ],
+)
+def test_houses_are_exported_in_columnar_formats(client, format, read):
+    houses = pd.DataFrame(client.get("/houses").json())
+
+    response = client.get(f"/houses/export?format={format}")
+    assert response.status_code == 200
+    assert f'filename="houses.{format}"' in response.headers["content-disposition"]
+    exported = read(io.BytesIO(response.content))
+    assert list(exported["id"]) == list(range(1, 26))
+    pd.testing.assert_frame_equal(exported[houses.columns], houses, check_dtype=False)
+
+    response = client.get(f"/houses/export?format={format}&bedrooms=5&zipcode=98009")
+    assert list(read(io.BytesIO(response.content))["zipcode"]) == [98009]
+
+
+def test_zipcode_stats_are_refreshed_after_changes(client, tmp_path):
+    clear_tables()
+    pd.read_csv(DATA_PATH, nrows=2000).to_csv(tmp_path / "houses.csv", index=False)
+    load_houses(str(tmp_path / "houses.csv"))
+
+    def expected():
+        lines = client.get("/houses?format=ndjson").text.splitlines()
+        houses = pd.DataFrame([json.loads(line) for line in lines])
+        stats = houses.groupby("zipcode")["price"].agg(["count", "mean", "median"])
+        return [
+            {
+                "zipcode": zipcode,
+                "count": row["count"],
+                "mean_price": pytest.approx(row["mean"]),
+                "median_price": row["median"],
+            }
+            for zipcode, row in stats.iterrows()
+        ]
+
+    assert client.get("/stats/zipcodes").json() == expected()
+
+    client.put("/houses/1", json={"price": 10})
+    client.request("DELETE", "/houses/bulk", json=[2, 3, 4])
+    client.post("/houses", json=dict(client.get("/houses/5").json(), price=7))
+    stats = client.get("/stats/zipcodes").json()
+    assert stats == expected()
+    zipcode = stats[0]["zipcode"]
+    assert client.get(f"/stats/zipcodes/{zipcode}").json() == stats[0]
+    assert client.get("/stats/zipcodes/12345").status_code == 404
+    total = client.get("/stats").json()
+    assert total["count"] == sum(row["count"] for row in stats) == 1998
+    assert total["zipcodes"] == len(stats)
+
+
+def test_concurrent_refreshes_of_the_zipcode_stats(client):
+    with SessionLocal() as db:
+        db.query(models.House).filter(models.House.zipcode == 98000).delete()
+        db.query(models.House).filter(models.House.zipcode == 98001).update(
+            {"price": 5}
+        )
+        db.add_all([models.StaleZipcode(zipcode=z) for z in (98000, 98001, 98002)])
+        db.commit()
+
+    async def refresh_twice():
+        # An engine of its own, the pool of the app belongs to the event loop of the test client
+        engine = create_async_engine(database.async_engine.url)
+        try:
+            async with AsyncSession(engine) as first, AsyncSession(engine) as second:
+                await asyncio.gather(
+                    refresh_zipcode_stats(first), refresh_zipcode_stats(second)
+                )
+        finally:
+            await engine.dispose()
+
+    asyncio.run(refresh_twice())
+
+    with SessionLocal() as db:
+        assert db.query(models.StaleZipcode).count() == 0
+        stats = {row.zipcode: row for row in db.query(models.ZipcodeStats)}
+    assert len(stats) == 24 and 98000 not in stats
+    assert (stats[98001].count, stats[98001].median_price) == (1, 5)
+    assert stats[98002].mean_price == 100002
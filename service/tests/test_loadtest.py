@@ -0,0 +1,46 @@
+import copy
+import os
+
+from loadtest.run_loadtest import (
+    OPERATIONS,
+    Workload,
+    compare_to_baseline,
+    parse_mix,
+    run_loadtest,
+)
+from test_houses import clear_tables
+
+
+def test_parse_mix():
+    assert parse_mix("get=3,update=1") == {"get": 0.75, "update": 0.25}
+
+
+def test_workload_ids_of_created_houses():
+    workload = Workload({"create": 1.0}, houses=10)
+    urls = [workload.next_request()[2] for _ in range(3)]
+    assert urls == ["/houses"] * 3
+    assert workload.last_id == 13
+
+
+def test_run_loadtest_inprocess():
+    clear_tables()
+    results = run_loadtest(
+        db_url=os.environ["DB_CONN"],
+        houses=50,
+        duration=0.5,
+        concurrency=4,
+        warmup=0,
+    )
+    clear_tables()
+    assert results["config"]["concurrency"] == 4
+    overall = results["results"]["all"]
+    assert overall["requests"] > 0
+    assert overall["errors"] == 0
+    assert overall["p50_ms"] <= overall["p95_ms"] <= overall["p99_ms"]
+    assert set(results["results"]) <= set(OPERATIONS) | {"all"}
+
+    assert compare_to_baseline(results, results) == []
+    slower = copy.deepcopy(results)
+    slower["results"]["all"]["p99_ms"] = overall["p99_ms"] * 2 + 10
+    regressions = compare_to_baseline(slower, results)
+    assert [(r["operation"], r["metric"]) for r in regressions] == [("all", "p99_ms")]
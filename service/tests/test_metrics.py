@@ -0,0 +1,40 @@
+from metrics import Histogram
+from test_houses import client  # noqa: F401
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(("/houses",), value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{route="/houses",le="0.1"} 2',
+        'latency_seconds_bucket{route="/houses",le="1.0"} 3',
+        'latency_seconds_bucket{route="/houses",le="+Inf"} 4',
+        'latency_seconds_sum{route="/houses"} 2.65',
+        'latency_seconds_count{route="/houses"} 4',
+    ]
+
+
+def test_metrics_of_requests_and_statements(client):
+    client.get("/houses/1")
+    client.get("/houses/1")
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    requests = [line for line in lines if line.startswith("http_requests_total{")]
+    assert any(
+        'route="/houses/{id}",status="200"' in line and not line.endswith(" 0")
+        for line in requests
+    )
+    # Only the first lookup reads the database, the second one hits the cache
+    cached = (
+        'db_statements_per_request_bucket{method="GET",route="/houses/{id}",le="0"}'
+    )
+    assert any(line.startswith(cached) and int(line.split()[-1]) >= 1 for line in lines)
+    assert any(
+        line.startswith('db_pool_checkout_seconds_count{engine="async"}')
+        for line in lines
+    )
+    assert 'house_cache_lookups_total{result="hits"}' in response.text
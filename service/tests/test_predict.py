@@ -0,0 +1,84 @@
+import asyncio
+
+import main
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import DATA_PATH
+from fastapi.testclient import TestClient
+from predictor import MicroBatcher
+from preprocessing_king_county import PreprocessingKingCountyData
+from schemas import HouseFeatures
+from sklearn.linear_model import LinearRegression
+
+FEATURES = ["bedrooms", "bathrooms", "sqft_living", "grade", "water_distance"]
+
+
+@pytest.fixture(scope="module")
+def houses():
+    raw = pd.read_csv(DATA_PATH).dropna(subset=["waterfront", "view", "yr_renovated"])
+    return raw.sample(20, random_state=0)
+
+
+@pytest.fixture(scope="module")
+def artifact(tmp_path_factory):
+    preprocessor = PreprocessingKingCountyData()
+    columns = preprocessor.INPUT_COLUMNS
+    df = preprocessor.preprocess_fit_transform(pd.read_csv(DATA_PATH)[columns])
+    model = LinearRegression().fit(df[FEATURES].astype(float), df["price"])
+    path = str(tmp_path_factory.mktemp("artifact") / "king_county")
+    preprocessor.save(path, model)
+    return path, preprocessor, model
+
+
+@pytest.fixture
+def client(artifact, monkeypatch):
+    monkeypatch.setattr(main, "MODEL_ARTIFACT", artifact[0])
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    batches = []
+
+    def predict_batch(items):
+        batches.append(len(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(predict_batch, max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == [i * 2 for i in range(10)]
+    assert batches == [4, 4, 2]
+
+
+def test_predictions_equal_the_model(client, artifact, houses):
+    _, preprocessor, model = artifact
+    expected = model.predict(
+        preprocessor.preprocess_transform(houses[preprocessor.INPUT_COLUMNS])[
+            FEATURES
+        ].astype(float)
+    )
+    requests = houses[list(HouseFeatures.model_fields)].to_dict("records")
+
+    single = [client.post("/predict", json=house).json()["price"] for house in requests]
+    batch = client.post("/predict/batch", json=requests).json()
+
+    np.testing.assert_allclose(single, expected, rtol=1e-6)
+    np.testing.assert_allclose([item["price"] for item in batch], expected, rtol=1e-6)
+
+    outlier = dict(requests[0], bedrooms=1, bathrooms=3.0)
+    assert client.post("/predict", json=outlier).status_code == 422
+    batch = client.post("/predict/batch", json=[outlier, requests[0]]).json()
+    assert batch[0]["price"] is None
+    assert batch[1]["price"] == pytest.approx(expected[0], rel=1e-6)
+
+
+def test_predict_without_model_is_unavailable(monkeypatch):
+    monkeypatch.setattr(main, "MODEL_ARTIFACT", None)
+    with TestClient(main.app) as client:
+        assert client.post("/predict/batch", json=[]).status_code == 503